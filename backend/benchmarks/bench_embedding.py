@@ -0,0 +1,150 @@
+"""
+Embedding 调用方式基准：blocking vs inline vs worker
+
+多个并发调用方（模拟并发构建 + QA）各自反复请求小批量 embedding，同时用一个定时器
+测量事件循环延迟（其他接口此时能否及时响应）。对比：
+- blocking：async 函数中直接同步 encode（改造前的行为）
+- inline：本进程 MicroBatcher，encode 在后台线程执行
+- worker：独立 worker 进程 + unix socket（EMBEDDING_MODE=worker）
+
+默认使用合成模型：每次 encode 的 CPU 开销 = 固定开销 + 每条文本开销（numpy 矩阵乘忙等，
+与 torch 前向一样在计算期间释放 GIL），不需要下载 bge 模型；--real 使用 EMBEDDING_MODEL 加载真实模型。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_embedding --callers 16 --seconds 5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from knowledge_engine.core.embedding import InlineEmbedder, WorkerEmbedder, load_embedding_model, model_encoder, serve
+
+
+class SyntheticModel:
+    """按 固定开销 + 每条开销 消耗 CPU 的 encode，输出确定性的归一化向量"""
+
+    def __init__(self, fixed_ms: float, per_text_ms: float, dim: int = 1024) -> None:
+        self.fixed_s = fixed_ms / 1000
+        self.per_text_s = per_text_ms / 1000
+        self.dim = dim
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True):
+        a = np.ones((64, 256), dtype=np.float32)
+        end = time.perf_counter() + self.fixed_s + self.per_text_s * len(texts)
+        while time.perf_counter() < end:
+            a @ a.T
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            v = np.random.default_rng(zlib.crc32(t.encode("utf-8"))).standard_normal(self.dim)
+            out[i] = v / np.linalg.norm(v)
+        return out
+
+
+class BlockingEmbedder:
+    mode = "blocking"
+
+    def __init__(self, model) -> None:
+        self.encode = model_encoder(model)
+
+    async def embed(self, texts):
+        return self.encode(texts)
+
+    def stats(self):
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+async def run_load(embedder, callers: int, seconds: float, max_texts: int) -> dict:
+    latencies: list[float] = []
+    lags: list[float] = []
+    texts_done = 0
+    stop_at = time.perf_counter() + seconds
+
+    async def caller(i: int) -> None:
+        nonlocal texts_done
+        rng = random.Random(i)
+        while time.perf_counter() < stop_at:
+            texts = [f"caller {i} text {rng.random()}" for _ in range(rng.randint(1, max_texts))]
+            t0 = time.perf_counter()
+            vecs = await embedder.embed(texts)
+            latencies.append(time.perf_counter() - t0)
+            assert len(vecs) == len(texts)
+            texts_done += len(texts)
+
+    async def probe() -> None:
+        # 事件循环延迟：期望 10ms 后醒来，实际多等了多久
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - t0 - 0.01)
+
+    started = time.perf_counter()
+    await asyncio.gather(probe(), *[caller(i) for i in range(callers)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    lags.sort()
+    return {
+        "texts_per_s": texts_done / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "lag_p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--max-texts", type=int, default=8)
+    parser.add_argument("--fixed-ms", type=float, default=15)
+    parser.add_argument("--per-text-ms", type=float, default=2)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--real", action="store_true", help="使用 EMBEDDING_MODEL 指定的真实模型")
+    parser.add_argument("--modes", default="blocking,inline,worker")
+    args = parser.parse_args()
+
+    model = load_embedding_model() if args.real else SyntheticModel(args.fixed_ms, args.per_text_ms)
+    max_wait_s = args.max_wait_ms / 1000
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="bench_embedding_"), "embedding.sock")
+
+    print(f"callers={args.callers} texts/request=1-{args.max_texts} max_batch={args.max_batch} max_wait={args.max_wait_ms}ms "
+          f"model={'real' if args.real else f'synthetic({args.fixed_ms}ms + {args.per_text_ms}ms/text)'}")
+    print(f"{'mode':<10}{'texts/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'loop lag p99(ms)':>18}")
+    for mode in args.modes.split(","):
+        proc = None
+        if mode == "blocking":
+            embedder = BlockingEmbedder(model)
+        elif mode == "inline":
+            embedder = InlineEmbedder(model, args.max_batch, max_wait_s)
+        else:
+            proc = multiprocessing.Process(target=serve, args=(socket_path, model, args.max_batch, max_wait_s), daemon=True)
+            proc.start()
+            embedder = WorkerEmbedder(socket_path, autostart=False)
+            deadline = time.monotonic() + 60
+            while not os.path.exists(socket_path) and time.monotonic() < deadline:
+                time.sleep(0.05)
+        try:
+            r = asyncio.run(run_load(embedder, args.callers, args.seconds, args.max_texts))
+        finally:
+            embedder.close()
+            if proc is not None:
+                proc.terminate()
+                proc.join()
+        print(f"{mode:<10}{r['texts_per_s']:>10.1f}{r['p50'] * 1000:>10.1f}{r['p99'] * 1000:>10.1f}{r['lag_p99'] * 1000:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Embedding 推理后端基准：torch fp32 vs ONNX fp32 vs ONNX int8
+
+在已构建概念的真实 chunk（lightrag_workdir/*/kv_store_text_chunks.json）上对比：
+- 加载时间、吞吐（texts/s，单进程、固定 batch）
+- 与 fp32 参考向量的一致性：逐条余弦相似度（均值 / p5 / 最小值），
+  以及以 chunk 为查询的近邻召回率 recall@k（参考向量的 top-k 有多少仍在候选后端的 top-k 中）
+
+参考向量默认用 torch fp32 的结果；未测 torch 时使用 vdb_chunks.json 中构建时存下的 fp32 向量（--reference stored）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_embedding_backends --backends torch,onnx-fp32,onnx-int8 --threads 4
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from knowledge_engine.core.embedding import resolve_model_source
+from knowledge_engine.core.onnx_embedding import ONNX_DIR, FP32_FILE, INT8_FILE, OnnxEmbeddingModel, export_onnx
+
+DEFAULT_WORKDIRS = ("../data/lightrag_workdir", "./lightrag_workdir")
+
+
+def load_chunks(workdir: str, limit: int) -> Tuple[List[str], np.ndarray]:
+    """所有概念的 chunk 文本，及 vdb_chunks.json 中对应的已存向量（缺失的行为 NaN）"""
+    texts: List[str] = []
+    stored: List[np.ndarray] = []
+    for concept in sorted(os.listdir(workdir)):
+        kv_path = os.path.join(workdir, concept, "kv_store_text_chunks.json")
+        if not os.path.exists(kv_path):
+            continue
+        with open(kv_path, "r", encoding="utf-8") as f:
+            chunks: Dict[str, dict] = json.load(f)
+        vectors: Dict[str, np.ndarray] = {}
+        vdb_path = os.path.join(workdir, concept, "vdb_chunks.json")
+        if os.path.exists(vdb_path):
+            with open(vdb_path, "r", encoding="utf-8") as f:
+                vdb = json.load(f)
+            matrix = np.frombuffer(base64.b64decode(vdb["matrix"]), dtype=np.float32).reshape(-1, vdb["embedding_dim"])
+            vectors = {item["__id__"]: matrix[i] for i, item in enumerate(vdb["data"])}
+        for chunk_id, chunk in chunks.items():
+            texts.append(chunk["content"])
+            stored.append(vectors.get(chunk_id, np.full(1024, np.nan, dtype=np.float32)))
+            if len(texts) >= limit:
+                return texts, np.stack(stored)
+    return texts, np.stack(stored) if stored else np.zeros((0, 1024), dtype=np.float32)
+
+
+def load_backend(name: str, onnx_dir: str, threads: int):
+    if name == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(resolve_model_source(), device="cpu")
+    quantized = name == "onnx-int8"
+    if not os.path.exists(os.path.join(onnx_dir, INT8_FILE if quantized else FP32_FILE)):
+        export_onnx(resolve_model_source(), onnx_dir, quantize=True)
+    return OnnxEmbeddingModel(onnx_dir, quantized=quantized, threads=threads)
+
+
+def agreement(ref: np.ndarray, cand: np.ndarray, k: int) -> Dict[str, float]:
+    cos = np.sum(ref * cand, axis=1)
+    # chunk 之间的近邻：排除自身后比较 top-k 集合
+    ref_sim = ref @ ref.T
+    cand_sim = cand @ cand.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    k = min(k, len(ref) - 1)
+    ref_top = np.argpartition(-ref_sim, k, axis=1)[:, :k]
+    cand_top = np.argpartition(-cand_sim, k, axis=1)[:, :k]
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_top, cand_top)]) if k > 0 else 1.0
+    return {"cos_mean": float(cos.mean()), "cos_p5": float(np.percentile(cos, 5)), "cos_min": float(cos.min()), "recall": float(recall)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workdir", default=next((d for d in DEFAULT_WORKDIRS if os.path.isdir(d)), DEFAULT_WORKDIRS[0]))
+    parser.add_argument("--limit", type=int, default=1000, help="最多使用的 chunk 数")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX intra-op 线程数，0 为可用 CPU 数")
+    parser.add_argument("--onnx-dir", default=ONNX_DIR)
+    parser.add_argument("--backends", default="torch,onnx-fp32,onnx-int8")
+    parser.add_argument("--reference", choices=("auto", "torch", "stored"), default="auto")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    texts, stored = load_chunks(args.workdir, args.limit)
+    if not texts:
+        raise SystemExit(f"No chunks found under {args.workdir}")
+    print(f"chunks={len(texts)} avg_chars={sum(map(len, texts)) / len(texts):.0f} batch={args.batch_size} workdir={args.workdir}")
+
+    results: Dict[str, dict] = {}
+    for name in args.backends.split(","):
+        t0 = time.perf_counter()
+        model = load_backend(name, args.onnx_dir, args.threads)
+        load_s = time.perf_counter() - t0
+        model.encode(texts[:2], batch_size=2, normalize_embeddings=True)  # 预热
+        t0 = time.perf_counter()
+        vecs = np.asarray(model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True), dtype=np.float32)
+        elapsed = time.perf_counter() - t0
+        results[name] = {"load_s": load_s, "texts_per_s": len(texts) / elapsed, "vectors": vecs}
+        del model
+
+    use_stored = args.reference == "stored" or (args.reference == "auto" and "torch" not in results)
+    if use_stored:
+        keep = ~np.isnan(stored).any(axis=1)
+        ref, ref_name = stored[keep], "stored fp32 vectors"
+    else:
+        if "torch" not in results:
+            raise SystemExit("--reference torch requires the torch backend in --backends")
+        keep = np.ones(len(texts), dtype=bool)
+        ref, ref_name = results["torch"]["vectors"], "torch fp32"
+    print(f"reference: {ref_name} ({len(ref)} vectors)")
+
+    print(f"{'backend':<12}{'load(s)':>9}{'texts/s':>10}{'cos mean':>10}{'cos p5':>9}{'cos min':>9}{f'recall@{args.k}':>11}")
+    for name, r in results.items():
+        a = agreement(ref, r["vectors"][keep], args.k)
+        print(f"{name:<12}{r['load_s']:>9.1f}{r['texts_per_s']:>10.1f}{a['cos_mean']:>10.4f}{a['cos_p5']:>9.4f}{a['cos_min']:>9.4f}{a['recall']:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Knowledge Engine 读接口基准：并发拉取图谱 / 文档片段时，状态轮询接口的延迟分布
+
+在临时目录中生成一个大图谱 JSON 与 documents.json，在独立线程中用 uvicorn 启动最小 FastAPI 应用
+（服务端事件循环与压测客户端分离），对比三种读取方式：
+- blocking：async 接口中同步读文件 + 解析（改造前的行为）
+- thread：asyncio.to_thread 读取，无缓存
+- cached：asyncio.to_thread + JSONStorage 读穿缓存，图谱按版本缓存校验后的 JSON 并直接拼装响应（当前实现）
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_graph_reads --nodes 1500 --docs 3000 --seconds 5
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+def make_dataset(root: str, concept: str, nodes: int, docs: int) -> None:
+    graph_dir = os.path.join(root, "data", "graphs")
+    os.makedirs(graph_dir, exist_ok=True)
+    graph = {
+        "concept": concept,
+        "nodes": [
+            {
+                "id": f"n{i}",
+                "label": f"节点{i}",
+                "description": "桩图谱节点描述，" * 8,
+                "domains": ["物理", "信息论"],
+                "source_chunks": [f"d{i % docs}", f"d{(i * 7) % docs}"],
+                "size": 15,
+            }
+            for i in range(nodes)
+        ],
+        "edges": [
+            {"source": f"n{i}", "target": f"n{(i * 13 + 1) % nodes}", "relation": "相关", "description": "桩关系描述"}
+            for i in range(nodes * 2)
+        ],
+        "total_nodes": nodes,
+        "total_edges": nodes * 2,
+    }
+    with open(os.path.join(graph_dir, f"{concept}.json"), "w", encoding="utf-8") as f:
+        json.dump(graph, f, ensure_ascii=False, indent=2)
+    documents = {f"d{i}": {"domain": "物理", "content": "桩文档内容。" * 60} for i in range(docs)}
+    with open(os.path.join(root, "data", "documents.json"), "w", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False, indent=2)
+
+
+def build_app(mode: str):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import Response
+
+    from common.models import APIResponse, GraphResponse, SearchStatusData
+    from knowledge_engine.core.storage import GRAPH_DIR, JSONStorage
+
+    storage = JSONStorage()
+    app = FastAPI()
+
+    def load_graph_uncached(concept: str):
+        data = storage._load_json(os.path.join(GRAPH_DIR, f"{concept}.json"))
+        return GraphResponse(**data) if data else None
+
+    def load_graph_cached(concept: str):
+        # 与 KnowledgeService.get_graph_json / central_agent.main.raw_api_response 相同的路径
+        return storage.get_graph_view(concept, lambda data: GraphResponse(**data).model_dump_json().encode("utf-8"))
+
+    def raw_api_response(data_json: bytes) -> Response:
+        envelope = APIResponse().model_dump_json(exclude={"data"})
+        return Response(content=envelope[:-1].encode("utf-8") + b',"data":' + data_json + b"}", media_type="application/json")
+
+    def load_chunk_uncached(chunk_id: str):
+        return storage._load_json(storage.docs_file).get(chunk_id)
+
+    @app.get("/api/graph/{concept}")
+    async def get_graph(concept: str):
+        if mode == "blocking":
+            graph = load_graph_uncached(concept)
+        elif mode == "thread":
+            graph = await asyncio.to_thread(load_graph_uncached, concept)
+        else:
+            body = await asyncio.to_thread(load_graph_cached, concept)
+            if body is None:
+                raise HTTPException(404)
+            return raw_api_response(body)
+        if graph is None:
+            raise HTTPException(404)
+        return APIResponse(data=graph)
+
+    @app.get("/api/graph/chunk/{chunk_id}")
+    async def get_chunk(chunk_id: str):
+        if mode == "blocking":
+            data = load_chunk_uncached(chunk_id)
+        elif mode == "thread":
+            data = await asyncio.to_thread(load_chunk_uncached, chunk_id)
+        else:
+            data = await asyncio.to_thread(storage.get_document, chunk_id)
+        return APIResponse(data=data)
+
+    @app.get("/api/search/status/{task_id}")
+    async def status(task_id: str):
+        now = datetime.utcnow()
+        return APIResponse(data=SearchStatusData(
+            task_id=task_id, status="processing", progress={"overall": 42, "current_stage": "search", "stages": {}},
+            partial_results={"total_chunks_found": 10}, updated_at=now,
+        ))
+
+    return app
+
+
+def start_server(app) -> tuple[object, threading.Thread, str]:
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def run_mode(base_url: str, concept: str, seconds: float, graph_clients: int, pollers: int, poll_interval: float):
+    import httpx
+
+    poll_latencies: list[float] = []
+    graph_fetches = 0
+    stop_at = time.perf_counter() + seconds
+
+    limits = httpx.Limits(max_connections=graph_clients + pollers)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def fetch_graphs(i: int) -> None:
+            nonlocal graph_fetches
+            while time.perf_counter() < stop_at:
+                r = await client.get(f"/api/graph/{concept}")
+                assert r.status_code == 200
+                await client.get(f"/api/graph/chunk/d{i}")
+                graph_fetches += 1
+
+        async def poll(i: int) -> None:
+            while time.perf_counter() < stop_at:
+                t0 = time.perf_counter()
+                r = await client.get(f"/api/search/status/task-{i}")
+                assert r.status_code == 200
+                poll_latencies.append(time.perf_counter() - t0)
+                await asyncio.sleep(poll_interval)
+
+        await asyncio.gather(
+            *[fetch_graphs(i) for i in range(graph_clients)],
+            *[poll(i) for i in range(pollers)],
+        )
+    return poll_latencies, graph_fetches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=1500)
+    parser.add_argument("--docs", type=int, default=3000)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--graph-clients", type=int, default=4)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--poll-interval-ms", type=float, default=50)
+    parser.add_argument("--modes", default="blocking,thread,cached")
+    args = parser.parse_args()
+
+    concept = "基准概念"
+    root = tempfile.mkdtemp(prefix="bench_graph_reads_")
+    make_dataset(root, concept, args.nodes, args.docs)
+    # JSONStorage 使用相对路径 ./data
+    os.chdir(root)
+    graph_kb = os.path.getsize(os.path.join("data", "graphs", f"{concept}.json")) / 1024
+    docs_kb = os.path.getsize(os.path.join("data", "documents.json")) / 1024
+
+    print(f"graph={graph_kb:.0f}KB documents={docs_kb:.0f}KB graph_clients={args.graph_clients} pollers={args.pollers}")
+    print(f"{'mode':<10}{'polls':>8}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'graphs/s':>10}")
+    for mode in args.modes.split(","):
+        server, thread, base_url = start_server(build_app(mode))
+        try:
+            lat, fetches = asyncio.run(
+                run_mode(base_url, concept, args.seconds, args.graph_clients, args.pollers, args.poll_interval_ms / 1000)
+            )
+        finally:
+            server.should_exit = True
+            thread.join()
+        lat.sort()
+        p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+        print(
+            f"{mode:<10}{len(lat):>8}{statistics.median(lat) * 1000:>10.1f}"
+            f"{p99 * 1000:>10.1f}{lat[-1] * 1000:>10.1f}{fetches / args.seconds:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+LightRAG 文档插入基准：逐篇插入 vs 按窗口批量插入
+
+用已构建概念的原始文档（lightrag_workdir/*/kv_store_full_docs.json）在临时目录中重新构建图谱，
+LLM 与 embedding 换成固定延迟的桩（不访问外部服务、不加载模型），对比不同 LIGHTRAG_INSERT_WINDOW /
+MAX_PARALLEL_INSERT 下的总耗时、首篇完成时间与逐篇进度回调。
+桩 LLM 不返回实体，合并阶段几乎不耗时，结果反映的是抽取调用能否并行起来。
+
+需要安装 lightrag。用法（在 backend 目录下）：
+    python -m benchmarks.bench_ingest --docs 40 --llm-ms 300 --configs 1x1,8x4,16x8
+"""
+from __future__ import annotations
+
+import os
+
+# 导入 rag_engine 会创建全局 RAGEngine：改为不自动拉起的 worker 模式，避免加载真实模型
+os.environ.setdefault("EMBEDDING_MODE", "worker")
+os.environ["EMBEDDING_WORKER_AUTOSTART"] = "false"
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+import argparse
+import asyncio
+import json
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+from knowledge_engine.core.rag_engine import RAGEngine
+from knowledge_engine.core.rag_pool import RAGPool
+
+DEFAULT_WORKDIRS = ("../data/lightrag_workdir", "./lightrag_workdir")
+_HEADER_RE = re.compile(r"^\[DOC_ID: (?P<doc_id>[^\]]+)\]\n\[领域: (?P<domain>[^\]]*)\]\n", re.S)
+
+
+def load_documents(workdir: str, limit: int) -> List[dict]:
+    documents: List[dict] = []
+    for concept in sorted(os.listdir(workdir)):
+        path = os.path.join(workdir, concept, "kv_store_full_docs.json")
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for record in json.load(f).values():
+                m = _HEADER_RE.match(record["content"])
+                if not m:
+                    continue
+                documents.append({"doc_id": m["doc_id"], "domain": m["domain"], "content": record["content"][m.end():]})
+                if len(documents) >= limit:
+                    return documents
+    return documents
+
+
+class StubEngine(RAGEngine):
+    """LLM / embedding 为固定延迟桩的 RAGEngine"""
+
+    def __init__(self, base_dir: str, window: int, parallel: int, llm_s: float, embed_s: float) -> None:
+        self.base_dir = base_dir
+        self.rag_pool = RAGPool(self._create_rag_instance)
+        self.insert_window = window
+        self.max_parallel_insert = parallel
+        self.embedder = None
+        self.embedding_cache = None
+        self.llm_s = llm_s
+        self.embed_s = embed_s
+        self.llm_calls = 0
+
+    async def _llm_wrapper(self, prompt, system_prompt=None, history_messages=[], **kwargs):
+        self.llm_calls += 1
+        await asyncio.sleep(self.llm_s)
+        return "<|COMPLETE|>"
+
+    async def close(self) -> None:
+        await self.rag_pool.close()
+
+    async def _embedding_wrapper(self, texts: list) -> np.ndarray:
+        await asyncio.sleep(self.embed_s)
+        out = np.zeros((len(texts), 1024), dtype=np.float32)
+        for i, t in enumerate(texts):
+            v = np.random.default_rng(zlib.crc32(t.encode("utf-8"))).standard_normal(1024)
+            out[i] = v / np.linalg.norm(v)
+        return out
+
+
+async def run(documents: List[dict], window: int, parallel: int, llm_s: float, embed_s: float) -> dict:
+    root = tempfile.mkdtemp(prefix="bench_ingest_")
+    engine = StubEngine(root, window, parallel, llm_s, embed_s)
+    done_at: List[float] = []
+    failed = 0
+
+    def on_progress(doc: dict, status: str, done: int, total: int) -> None:
+        nonlocal failed
+        done_at.append(time.perf_counter())
+        failed += status != "processed"
+
+    try:
+        t0 = time.perf_counter()
+        await engine.insert_documents("bench", documents, on_progress)
+        elapsed = time.perf_counter() - t0
+        await engine.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "seconds": elapsed,
+        "docs_per_s": len(documents) / elapsed,
+        "first_s": (done_at[0] - t0) if done_at else float("nan"),
+        "callbacks": len(done_at),
+        "failed": failed,
+        "llm_calls": engine.llm_calls,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workdir", default=next((d for d in DEFAULT_WORKDIRS if os.path.isdir(d)), DEFAULT_WORKDIRS[0]))
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--llm-ms", type=float, default=300)
+    parser.add_argument("--embed-ms", type=float, default=20)
+    parser.add_argument("--configs", default="1x1,8x4,16x8", help="逗号分隔的 窗口x并行数；1x1 为逐篇插入（改造前的行为）")
+    args = parser.parse_args()
+
+    documents = load_documents(args.workdir, args.docs)
+    if not documents:
+        raise SystemExit(f"No documents found under {args.workdir}")
+    print(f"docs={len(documents)} avg_chars={sum(len(d['content']) for d in documents) / len(documents):.0f} "
+          f"llm={args.llm_ms}ms embed={args.embed_ms}ms")
+    print(f"{'window x parallel':<18}{'total(s)':>10}{'docs/s':>9}{'first doc(s)':>14}{'progress':>10}{'failed':>8}{'llm calls':>11}")
+    for config in args.configs.split(","):
+        window, parallel = (int(x) for x in config.split("x"))
+        r = asyncio.run(run(documents, window, parallel, args.llm_ms / 1000, args.embed_ms / 1000))
+        print(f"{config:<18}{r['seconds']:>10.1f}{r['docs_per_s']:>9.2f}{r['first_s']:>14.1f}{r['callbacks']:>10}{r['failed']:>8}{r['llm_calls']:>11}")
+
+
+if __name__ == "__main__":
+    main()
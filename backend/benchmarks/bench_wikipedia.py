@@ -0,0 +1,109 @@
+"""
+Wikipedia 摘要获取模式基准：sequential vs concurrent vs batch
+
+使用本地桩服务模拟 Wikipedia API（每个请求固定延迟），不访问外网。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bench_wikipedia --latency-ms 80 --queries 20 --results 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency_s: float, results: int):
+    class StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):  # 静默
+            pass
+
+        def _send(self, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            time.sleep(latency_s)
+            parsed = urllib.parse.urlparse(self.path)
+            qs = urllib.parse.parse_qs(parsed.query)
+            extract = "桩服务返回的词条摘要内容。" * 20
+
+            if parsed.path.startswith("/api/rest_v1/page/summary/"):
+                return self._send({"extract": extract})
+
+            action = qs.get("action", [""])[0]
+            if action == "opensearch":
+                q = qs.get("search", [""])[0]
+                n = min(int(qs.get("limit", ["10"])[0]), results)
+                titles = [f"{q}-{i}" for i in range(n)]
+                return self._send([q, titles, [""] * n, [f"https://stub/{t}" for t in titles]])
+            if action == "query":
+                titles = qs.get("titles", [""])[0].split("|")
+                return self._send({"query": {"pages": [{"title": t, "extract": extract} for t in titles]}})
+
+            self.send_response(404)
+            self.end_headers()
+
+    return StubHandler
+
+
+async def run_mode(mode: str, base_url: str, queries: int, results: int) -> list[float]:
+    os.environ["WIKIPEDIA_MODE"] = mode
+    os.environ["WIKIPEDIA_BASE_URL"] = base_url
+    os.environ["SEARCH_PROVIDER"] = "wikipedia"
+    os.environ["SEARCH_CACHE_ENABLED"] = "false"
+
+    from search_agent.service import SearchService
+
+    service = SearchService()
+    await service.startup()
+    latencies = []
+    try:
+        for i in range(queries):
+            t0 = time.perf_counter()
+            items = await service.search(f"q{i}", results)
+            latencies.append(time.perf_counter() - t0)
+            assert len(items) == results, f"{mode}: expected {results} items, got {len(items)}"
+    finally:
+        await service.shutdown()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--results", type=int, default=10)
+    parser.add_argument("--modes", default="sequential,concurrent,batch")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency_ms / 1000, args.results))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"stub latency={args.latency_ms}ms queries={args.queries} results/query={args.results}")
+    print(f"{'mode':<12}{'mean(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}")
+    try:
+        for mode in args.modes.split(","):
+            lat = sorted(asyncio.run(run_mode(mode, base_url, args.queries, args.results)))
+            p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            print(
+                f"{mode:<12}{statistics.mean(lat) * 1000:>10.1f}"
+                f"{statistics.median(lat) * 1000:>10.1f}{p95 * 1000:>10.1f}"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
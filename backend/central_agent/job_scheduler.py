@@ -0,0 +1,175 @@
+"""
+构建任务调度：限制同时运行的构建数，超出的按优先级排队
+
+- 同时运行的任务数不超过 max_concurrent，其余进入优先级队列（priority 大的先执行，同优先级先到先得）
+- 排队数达到 max_backlog 时拒绝新任务（BacklogFull，由接口转换为 429）
+- cancel：排队中的任务直接出队（协程从未创建）；运行中的任务取消其 asyncio.Task，
+  取消会传递到正在等待的 HTTP 请求与 LightRAG 插入
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("central-agent-jobs")
+
+JobFactory = Callable[[], Awaitable[Any]]
+
+
+class BacklogFull(Exception):
+    pass
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_backlog: int,
+        on_queue_change: Optional[Callable[[Dict[str, int]], None]] = None,
+    ) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_backlog = max_backlog
+        self.on_queue_change = on_queue_change
+        # 堆中条目为 (-priority, seq, job_id)；取消的条目只从 _queued 删除，出堆时跳过
+        self._heap: List[tuple[int, int, str]] = []
+        self._queued: Dict[str, JobFactory] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelling: set[str] = set()
+        self._seq = itertools.count()
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._queued)
+
+    def full(self) -> bool:
+        """新任务既无法立即执行、排队也已满"""
+        return bool(self.max_backlog) and self.queued >= self.max_backlog and len(self._running) >= self.max_concurrent
+
+    def admit(self) -> bool:
+        """提交前的准入检查（拒绝计入 rejected），便于调用方在创建任务记录前就返回 429"""
+        if self.full():
+            self.rejected += 1
+            return False
+        return True
+
+    def submit(self, job_id: str, factory: JobFactory, priority: int = 0) -> Optional[int]:
+        """提交任务；返回排队位置（立即开始执行时为 None）"""
+        if not self.admit():
+            raise BacklogFull(f"Build queue is full ({self.queued} queued, {len(self._running)} running)")
+        self.submitted += 1
+        self._queued[job_id] = factory
+        heapq.heappush(self._heap, (-priority, next(self._seq), job_id))
+        self._dispatch()
+        self._notify()
+        return self.position(job_id)
+
+    def _dispatch(self) -> None:
+        while self._heap and len(self._running) < self.max_concurrent:
+            _, _, job_id = heapq.heappop(self._heap)
+            factory = self._queued.pop(job_id, None)
+            if factory is None:
+                continue
+            task = asyncio.create_task(factory(), name=f"build:{job_id}")
+            self._running[job_id] = task
+            task.add_done_callback(lambda t, j=job_id: self._finished(j, t))
+
+    def _finished(self, job_id: str, task: asyncio.Task) -> None:
+        self._running.pop(job_id, None)
+        self._cancelling.discard(job_id)
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None:
+            self.failed += 1
+            logger.error("Build %s failed: %r", job_id, task.exception())
+        else:
+            self.completed += 1
+        self._dispatch()
+        self._notify()
+
+    def _notify(self) -> None:
+        if self.on_queue_change is None:
+            return
+        try:
+            self.on_queue_change(self.positions())
+        except Exception as e:
+            logger.warning("Queue change callback failed: %s", e)
+
+    def positions(self) -> Dict[str, int]:
+        ordered = sorted(e for e in self._heap if e[2] in self._queued)
+        return {job_id: i + 1 for i, (_, _, job_id) in enumerate(ordered)}
+
+    def position(self, job_id: str) -> Optional[int]:
+        if job_id not in self._queued:
+            return None
+        return self.positions().get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """返回 "dequeued"（排队中，已移除）/ "cancelling"（运行中，已请求取消）/ None（不在本进程）"""
+        if self._queued.pop(job_id, None) is not None:
+            self.cancelled += 1
+            self._notify()
+            return "dequeued"
+        task = self._running.get(job_id)
+        if task is not None:
+            # 只取消一次：重复 cancel 会打断任务自身的收尾（写入最终状态）
+            if job_id not in self._cancelling:
+                self._cancelling.add(job_id)
+                task.cancel()
+            return "cancelling"
+        return None
+
+    async def shutdown(self) -> None:
+        self._queued.clear()
+        self._heap.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_backlog": self.max_backlog,
+            "running": len(self._running),
+            "queued": self.queued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+class KeyedLocks:
+    """按键分配的 asyncio.Lock，无人持有或等待时自动回收"""
+
+    def __init__(self) -> None:
+        self._locks: Dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def locked(self, key: str) -> bool:
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (asyncio.Lock(), 0))
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users <= 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import json
+import os
+import time
 import uuid
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
 # 引入 Shared Models
 from common.models import (
@@ -15,18 +21,41 @@ from common.models import (
     Pagination, PlanRequest, PlanResult, PlanDiscipline,
     SearchResultsResponseData, SearchStartRequest, SearchStartResult,
     SearchStatusData, SearchSummary, Chunk,
-    GraphResponse, QARequest, QAResponse # 引入新模型
+    QARequest, QAResponse, # 引入新模型
+    NodeProvenance, DocumentProvenance,
 )
 
 # 引入 Services
-from search_agent.service import SearchService
-from search_agent.graph import search_graph
+from search_agent.graph import search_graph, search_service
+from search_agent.pipeline import run_streaming_pipeline
 from knowledge_engine.service import KnowledgeService # 引入 KE Service
+from central_agent.task_store import ACTIVE_STATUSES, TaskHandle, create_task_store
+from central_agent.progress_stream import HEARTBEAT, HEARTBEAT_S, ProgressBus, format_event
+from central_agent.job_scheduler import BacklogFull, JobScheduler, KeyedLocks
+from search_agent.search_cache import normalize_query
+from common import metrics, tracing
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("central-agent")
 
-app = FastAPI(title="Central Agent", version="0.3.0")
+# 实例化 Services（search_service 与 search_graph 共用同一实例，共享连接池）
+knowledge_service = KnowledgeService()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 分类缓存的相似度查找复用 Knowledge Engine 已加载的 embedding 模型
+    search_service.classify_cache.embed_fn = knowledge_service.embed
+    await search_service.startup()
+    try:
+        yield
+    finally:
+        await job_scheduler.shutdown()
+        await search_service.shutdown()
+        await knowledge_service.rag.close()
+        knowledge_service.rag.embedder.close()
+        task_store.close()
+
+app = FastAPI(title="Central Agent", version="0.3.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,19 +65,149 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 实例化 Services
-search_service = SearchService()
-knowledge_service = KnowledgeService()
+# 任务状态存储（TASK_STORE=memory|sqlite），结果落盘分页读取
+task_store = create_task_store()
+# 运行中任务的状态写入合并间隔（秒）
+STATUS_FLUSH_S = float(os.getenv("TASK_STATUS_FLUSH_S", "0.5"))
+# 运行在本 worker 的任务的进度推送频道
+progress_bus = ProgressBus()
+# 本 worker 最近任务的调用时间线（GET /api/search/trace/{task_id}）
+traces = tracing.TraceRegistry()
+
+def status_view(t: Dict[str, Any]) -> Dict[str, Any]:
+    """/status 与进度推送共用的状态结构"""
+    return {
+        "task_id": t["task_id"],
+        "status": t["status"],
+        "progress": t["progress"],
+        "partial_results": t["partial"],
+        "started_at": t.get("started_at"),
+        "updated_at": t["updated_at"],
+        "queue_position": t.get("queue_position"),
+    }
+
+def done_view(t: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "task_id": t["task_id"],
+        "status": t["status"],
+        "error": t.get("error"),
+        "total": t.get("results_total", 0),
+        "results_url": f"/api/search/results/{t['task_id']}" if t["status"] == "completed" else None,
+    }
 
-# 任务状态存储
-TASKS: Dict[str, Dict[str, Any]] = {}
+# 本 worker 提交的（排队中或运行中）任务
+ACTIVE_HANDLES: Dict[str, TaskHandle] = {}
+_supervisors: Dict[str, asyncio.Task] = {}
+# 排队 / 长时间无进度回调的任务定期刷新 updated_at，避免被判定为中断
+TASK_HEARTBEAT_S = float(os.getenv("TASK_HEARTBEAT_S", "60"))
+
+def update_queue_positions(positions: Dict[str, int]) -> None:
+    for task_id, handle in ACTIVE_HANDLES.items():
+        if handle.data["status"] != "pending":
+            continue
+        pos = positions.get(task_id)
+        if handle.data.get("queue_position") != pos:
+            handle.data["queue_position"] = pos
+            handle.touch()
+            progress_bus.publish(task_id, "status", status_view(handle.data))
+
+# 构建任务调度：同时运行数上限 + 优先级队列，排队满时 /start 返回 429
+job_scheduler = JobScheduler(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_BUILDS", "2")),
+    max_backlog=int(os.getenv("BUILD_QUEUE_MAX", "20")),
+    on_queue_change=update_queue_positions,
+)
+
+# 相同构建（概念 + 学科集合 + 配置）合并：运行中的直接挂靠，BUILD_REUSE_S 秒内完成的直接复用
+BUILD_COALESCE = os.getenv("BUILD_COALESCE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+BUILD_REUSE_S = float(os.getenv("BUILD_REUSE_S", "3600"))
+_inflight_builds: Dict[str, str] = {}
+# 同一概念的构建写同一个 LightRAG 工作目录与图谱文件，按概念串行
+concept_locks = KeyedLocks()
+
+def make_build_key(req: SearchStartRequest) -> str:
+    # 概念保持原样：工作目录与图谱文件按原始概念名存放
+    disciplines = sorted(
+        (normalize_query(d.name), sorted({normalize_query(k) for k in d.search_keywords}))
+        for d in req.disciplines
+    )
+    config = req.search_config.model_dump(exclude={"pipeline"})  # 执行方式不影响结果
+    raw = json.dumps([req.concept, disciplines, config], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def find_coalescable(build_key: str) -> Optional[Dict[str, Any]]:
+    task_id = _inflight_builds.get(build_key)
+    if task_id is not None:
+        return await asyncio.to_thread(task_store.get, task_id)
+    # 其他 worker 提交的或已完成的相同构建
+    return await asyncio.to_thread(task_store.find_build, build_key, BUILD_REUSE_S)
+
+async def finish_task(task_id: str, handle: TaskHandle) -> None:
+    """写入最终状态、推送结束事件并释放本 worker 的任务资源"""
+    handle.data["queue_position"] = None
+    handle.data["updated_at"] = datetime.utcnow().isoformat()
+    await handle.flush()
+    progress_bus.publish(task_id, "status", status_view(handle.data))
+    progress_bus.publish(task_id, "done", done_view(handle.data))
+    progress_bus.close(task_id)
+    ACTIVE_HANDLES.pop(task_id, None)
+    build_key = handle.data.get("build_key")
+    if _inflight_builds.get(build_key) == task_id:
+        del _inflight_builds[build_key]
+    supervisor = _supervisors.pop(task_id, None)
+    if supervisor is not None and supervisor is not asyncio.current_task():
+        supervisor.cancel()
+
+async def supervise(task_id: str, handle: TaskHandle) -> None:
+    """
+    跟踪其他 worker 发起的取消（存储中的取消标记）并定期刷新心跳
+    本 worker 的取消请求由 cancel 接口直接处理
+    """
+    beat = time.monotonic()
+    while True:
+        await asyncio.sleep(STATUS_FLUSH_S)
+        if handle.cancelled():
+            if job_scheduler.cancel(task_id) == "dequeued":
+                handle.data["status"] = "cancelled"
+                await finish_task(task_id, handle)
+            return
+        if time.monotonic() - beat >= TASK_HEARTBEAT_S:
+            beat = time.monotonic()
+            handle.touch()
 
 @app.get("/api/health")
 async def health() -> APIResponse:
     return APIResponse(data={"status": "ok", "service": "central-agent"})
 
+BUILD_JOBS = metrics.Gauge("build_jobs", "Build jobs in this process", ["state"])
+STREAM_SUBSCRIBERS = metrics.Gauge("progress_stream_subscribers", "Open SSE progress subscribers")
+
+@app.get("/metrics")
+async def prometheus_metrics() -> Response:
+    """Prometheus 抓取接口（本进程的指标）"""
+    jobs = job_scheduler.stats()
+    BUILD_JOBS.set(jobs["running"], state="running")
+    BUILD_JOBS.set(jobs["queued"], state="queued")
+    STREAM_SUBSCRIBERS.set(progress_bus.stats()["subscribers"])
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ========== 1. Search Agent 接口 ==========
 
+@app.get("/api/search/stats")
+async def search_stats() -> APIResponse:
+    """Search Agent 运行时指标（连接池等）"""
+    return APIResponse(data={
+        **search_service.stats(),
+        "tasks": await asyncio.to_thread(task_store.stats),
+        "progress_stream": progress_bus.stats(),
+        "jobs": job_scheduler.stats(),
+        "storage_cache": knowledge_service.storage.cache_stats(),
+        "embedding": knowledge_service.rag.embedder.stats(),
+        "embedding_cache": knowledge_service.rag.embedding_cache.stats() if knowledge_service.rag.embedding_cache else None,
+        "lightrag_pool": knowledge_service.rag.rag_pool.stats(),
+        "llm_cache": knowledge_service.rag.llm_cache.stats(),
+    })
+
 @app.post("/api/search/classify")
 async def classify(req: ClassifyRequest) -> APIResponse:
     data = await search_service.classify(req.concept, req.max_disciplines, req.min_relevance)
@@ -64,27 +223,56 @@ async def plan(req: PlanRequest) -> APIResponse:
         concept=req.concept,
         primary_discipline=raw.get("primary_discipline", "综合"),
         disciplines=[PlanDiscipline(**d, is_default_selected=True) for d in disciplines],
-        suggested_additions=[]
+        suggested_additions=[],
+        cache=raw.get("cache"),
     )
     return APIResponse(data=data)
 
 @app.post("/api/search/start")
 async def start(req: SearchStartRequest) -> APIResponse:
     task_id = f"task-{uuid.uuid4()}"
+    build_key = make_build_key(req)
+    if BUILD_COALESCE:
+        existing = await find_coalescable(build_key)
+        if existing is None and build_key in _inflight_builds:
+            # 查询存储期间同一 worker 又提交了相同构建
+            existing = await find_coalescable(build_key)
+        if existing is not None and (existing["status"] in ACTIVE_STATUSES or existing["status"] == "completed"):
+            logger.info(f"Coalesced build for '{req.concept}' onto {existing['task_id']} ({existing['status']})")
+            return APIResponse(data=SearchStartResult(
+                task_id=existing["task_id"],
+                status=existing["status"],
+                created_at=existing["created_at"],
+                queue_position=existing.get("queue_position"),
+                coalesced=True,
+            ))
+
+    # 合并后的请求不占用排队名额，准入检查放在合并之后
+    if not job_scheduler.admit():
+        raise HTTPException(status_code=429, detail="Build queue is full, please retry later", headers={"Retry-After": "30"})
+    if BUILD_COALESCE:
+        _inflight_builds[build_key] = task_id
     
-    # 1. 初始化任务状态
-    TASKS[task_id] = {
+    # 1. 初始化任务状态（结果不在状态里，完成后落盘，见 results_total）
+    now = datetime.utcnow().isoformat()
+    task = {
         "task_id": task_id,
         "concept": req.concept,
         "status": "pending",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
+        "created_at": now,
+        "started_at": None,
+        "updated_at": now,
         "progress": {"overall": 0, "current_stage": "pending", "stages": {}},
         "partial": {"total_chunks_found": 0, "validated_chunks": 0},
-        "result_chunks": [],
+        "results_total": 0,
+        "queue_position": None,
+        "build_key": build_key,
         "cancelled": False,
         "error": None
     }
+    await asyncio.to_thread(task_store.put, task)
+    handle = TaskHandle(task_store, task, STATUS_FLUSH_S)
+    trace = traces.start(task_id, concept=req.concept, pipeline=req.search_config.pipeline, depth=req.search_config.depth)
 
     # 2. 准备初始状态
     # 注意：确保这里的数据转换没有报错
@@ -106,14 +294,15 @@ async def start(req: SearchStartRequest) -> APIResponse:
     async def run_langgraph_task():
         logger.info(f"🚀 Background task started for {task_id}")  # [关键日志1] 证明任务启动了
         
+        task_data = handle.data
         try:
-            # 获取引用
-            task_data = TASKS[task_id]
-            
             # 更新状态为 processing
             task_data["status"] = "processing"
+            task_data["queue_position"] = None
             task_data["progress"]["current_stage"] = "starting"
-            task_data["updated_at"] = datetime.utcnow()
+            task_data["started_at"] = task_data["updated_at"] = datetime.utcnow().isoformat()
+            await handle.flush()
+            progress_bus.publish(task_id, "status", status_view(task_data))
             
             logger.info(f"Set status to processing for {task_id}") # [关键日志2] 证明状态更新代码执行了
 
@@ -133,73 +322,193 @@ async def start(req: SearchStartRequest) -> APIResponse:
 
                 if extra and "total" in extra:
                     task_data["partial"]["total_chunks_found"] = extra["total"]
+                if extra and "validated" in extra:
+                    task_data["partial"]["validated_chunks"] = extra["validated"]
+                if extra and "near_duplicates_removed" in extra:
+                    task_data["partial"]["near_duplicates_removed"] = extra["near_duplicates_removed"]
                     
-                task_data["updated_at"] = datetime.utcnow()
+                task_data["updated_at"] = datetime.utcnow().isoformat()
+                # 只修改本地副本，写入按 TASK_STATUS_FLUSH_S 合并；推送不合并，立即发给订阅者
+                handle.touch()
+                progress_bus.publish(task_id, "status", status_view(task_data))
 
             def check_cancelled():
-                return task_data.get("cancelled", False)
+                return handle.cancelled()
 
             # 运行 Graph
             logger.info(f"Invoking graph for {task_id}...") # [关键日志3] 开始调用 LangGraph
             
-            final_state = await search_graph.ainvoke(
-                initial_state, 
-                config={"configurable": {"status_callback": status_callback, "cancelled_check": check_cancelled}}
-            )
+            graph_config = {"configurable": {"status_callback": status_callback, "cancelled_check": check_cancelled}}
+            if concept_locks.locked(req.concept):
+                logger.info(f"Task {task_id} waiting for another build of '{req.concept}'")
+                status_callback("waiting", 0)
+            async with concept_locks.hold(req.concept):
+                if req.search_config.pipeline == "streaming":
+                    final_state = await run_streaming_pipeline(initial_state, graph_config)
+                else:
+                    final_state = await search_graph.ainvoke(initial_state, config=graph_config)
             
             logger.info(f"Graph finished for {task_id}") # [关键日志4] Graph 运行结束
 
             if check_cancelled():
                 task_data["status"] = "cancelled"
             else:
-                task_data["status"] = "completed"
                 # 安全地获取 chunks，防止 final_state 中没有 chunks 字段
                 chunks = final_state.get("chunks", [])
-                task_data["result_chunks"] = [c.model_dump() for c in chunks]
+                task_data["results_total"] = await asyncio.to_thread(
+                    task_store.save_results, task_id, [c.model_dump(mode="json") for c in chunks]
+                )
+                task_data["status"] = "completed"
                 task_data["progress"]["overall"] = 100
                 
+        except asyncio.CancelledError:
+            # cancel 接口（或服务关闭）取消了本任务：在途的 HTTP 请求与 LightRAG 插入随之中止
+            logger.warning(f"Task {task_id} cancelled")
+            task_data["status"] = "cancelled"
+            raise
         except Exception as e:
             # [关键] 捕获所有后台任务的报错
             logger.exception(f"❌ CRITICAL ERROR in background task {task_id}") 
-            TASKS[task_id]["status"] = "failed"
-            TASKS[task_id]["error"] = str(e)
+            task_data["status"] = "failed"
+            task_data["error"] = str(e)
+        finally:
+            await finish_task(task_id, handle)
+
+    async def run_traced():
+        # 在任务自己的上下文中启用 trace，之后创建的子任务和线程调用都会继承
+        trace.add_span("queued", trace.t0, time.perf_counter())
+        try:
+            with tracing.activate(trace), tracing.span("task", concept=req.concept):
+                await run_langgraph_task()
         finally:
-            TASKS[task_id]["updated_at"] = datetime.utcnow()
+            trace.finished = True
 
-    # 4. 提交给 Event Loop
-    asyncio.create_task(run_langgraph_task())
-    logger.info(f"Task {task_id} scheduled.")
+    # 4. 提交给调度器（有空位立即执行，否则按优先级排队）
+    try:
+        position = job_scheduler.submit(task_id, run_traced, req.priority)
+    except BacklogFull as e:
+        # 与上面的容量检查之间被其他请求占满
+        if _inflight_builds.get(build_key) == task_id:
+            del _inflight_builds[build_key]
+        task["status"] = "failed"
+        task["error"] = str(e)
+        await asyncio.to_thread(task_store.put, task)
+        raise HTTPException(status_code=429, detail="Build queue is full, please retry later", headers={"Retry-After": "30"})
+    ACTIVE_HANDLES[task_id] = handle
+    progress_bus.open(task_id)
+    _supervisors[task_id] = asyncio.create_task(supervise(task_id, handle))
+    if position is not None:
+        task["queue_position"] = position
+        handle.touch()
+    logger.info(f"Task {task_id} scheduled (queue position: {position}).")
 
     return APIResponse(
         data=SearchStartResult(
             task_id=task_id,
             status="pending", # 这里返回 pending 是对的，因为后台任务是异步的
-            created_at=TASKS[task_id]["created_at"]
+            created_at=task["created_at"],
+            queue_position=position,
         )
     )
 
 @app.get("/api/search/status/{task_id}")
 async def status(task_id: str) -> APIResponse:
-    t = TASKS.get(task_id)
+    t = await asyncio.to_thread(task_store.get, task_id)
     if not t: raise HTTPException(404, "Task not found")
     
-    return APIResponse(data=SearchStatusData(
-        task_id=task_id,
-        status=t["status"],
-        progress=t["progress"],
-        partial_results=t["partial"],
-        updated_at=t["updated_at"]
-    ))
+    return APIResponse(data=SearchStatusData(**status_view(t)))
+
+@app.get("/api/search/trace/{task_id}")
+async def task_trace(task_id: str) -> Dict[str, Any]:
+    """
+    任务的 span 时间线，Chrome trace 格式（保存为 .json 后用 ui.perfetto.dev 或 chrome://tracing 打开）
+    直接返回 trace 对象而不是 APIResponse，便于工具直接加载；trace 只保存在执行该任务的 worker 内存中
+    """
+    trace = traces.get(task_id)
+    if trace is None:
+        raise HTTPException(404, "Trace not found")
+    return trace.to_chrome()
+
+@app.delete("/api/search/tasks/{task_id}")
+async def cancel_task(task_id: str) -> APIResponse:
+    """取消任务：排队中的直接出队，运行中的取消其 asyncio 任务（含在途 HTTP 请求与 LightRAG 插入）"""
+    t = await asyncio.to_thread(task_store.get, task_id)
+    if not t: raise HTTPException(404, "Task not found")
+    if t["status"] not in ACTIVE_STATUSES:
+        # 已结束的任务不再改变状态
+        return APIResponse(data=CancelTaskResult(task_id=task_id, status=t["status"]))
+
+    await asyncio.to_thread(task_store.request_cancel, task_id)
+    handle = ACTIVE_HANDLES.get(task_id)
+    if handle is not None:
+        handle.mark_cancelled()
+        if job_scheduler.cancel(task_id) == "dequeued":
+            handle.data["status"] = "cancelled"
+            await finish_task(task_id, handle)
+    # 运行在其他 worker 上的任务由其 supervise 读取取消标记后处理
+    return APIResponse(data=CancelTaskResult(task_id=task_id))
+
+@app.get("/api/search/stream/{task_id}")
+async def stream(task_id: str, request: Request, last_event_id: Optional[int] = Query(None)) -> StreamingResponse:
+    """
+    任务进度推送（SSE）：event: status 为与 /status 相同的快照，event: done 携带结果位置后结束
+    支持 Last-Event-ID（请求头或 last_event_id 参数）断线续传
+    """
+    t = await asyncio.to_thread(task_store.get, task_id)
+    if not t: raise HTTPException(404, "Task not found")
+    header_id = request.headers.get("last-event-id")
+    if last_event_id is None and header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+
+    async def local_events():
+        async for chunk in progress_bus.subscribe(task_id, last_event_id):
+            yield chunk
+            if await request.is_disconnected():
+                return
+
+    async def store_events():
+        # 任务不在本 worker 运行（或已结束）：按状态写入间隔读取存储，变化时推送
+        last_updated, idle = None, 0.0
+        current = t
+        while True:
+            if current["updated_at"] != last_updated:
+                last_updated, idle = current["updated_at"], 0.0
+                yield format_event(None, "status", json.dumps(status_view(current), ensure_ascii=False))
+            if current["status"] not in ACTIVE_STATUSES:
+                yield format_event(None, "done", json.dumps(done_view(current), ensure_ascii=False))
+                return
+            if idle >= HEARTBEAT_S:
+                idle = 0.0
+                yield HEARTBEAT
+            await asyncio.sleep(STATUS_FLUSH_S)
+            idle += STATUS_FLUSH_S
+            if await request.is_disconnected():
+                return
+            current = await asyncio.to_thread(task_store.get, task_id)
+            if current is None:
+                return
+
+    async def events():
+        yield "retry: 3000\n\n"
+        source = local_events() if progress_bus.has(task_id) else store_events()
+        async for chunk in source:
+            yield chunk
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/search/results/{task_id}")
 async def results(task_id: str, page: int = 1, page_size: int = 20) -> APIResponse:
-    t = TASKS.get(task_id)
+    t = await asyncio.to_thread(task_store.get, task_id)
     if not t or t["status"] != "completed": raise HTTPException(400, "Task not ready")
     
-    chunks = t["result_chunks"]
-    total = len(chunks)
-    start = (page - 1) * page_size
-    page_items = chunks[start : start + page_size]
+    # 只从磁盘读取当前页
+    total = t.get("results_total", 0)
+    start = (max(page, 1) - 1) * page_size
+    page_items = await asyncio.to_thread(task_store.results, task_id, start, page_size)
     
     return APIResponse(data=SearchResultsResponseData(
         task_id=task_id,
@@ -214,25 +523,46 @@ async def results(task_id: str, page: int = 1, page_size: int = 20) -> APIRespon
 @app.get("/api/graph/concepts")
 async def list_concepts() -> APIResponse:
     """列出所有已构建图谱的概念"""
-    concepts = knowledge_service.list_concepts()
+    concepts = await asyncio.to_thread(knowledge_service.list_concepts)
     return APIResponse(data={"concepts": concepts})
 
 @app.get("/api/graph/{concept}")
 async def get_graph(concept: str) -> APIResponse:
     """获取指定概念的知识图谱"""
-    data = knowledge_service.get_graph(concept)
-    if not data:
+    # 读文件、解析与校验在线程中完成并按图谱版本缓存序列化结果，大图谱不阻塞事件循环
+    body = await asyncio.to_thread(knowledge_service.get_graph_json, concept)
+    if body is None:
         raise HTTPException(status_code=404, detail=f"Graph for '{concept}' not found")
-    return APIResponse(data=GraphResponse(**data))
+    return raw_api_response(body)
+
+def raw_api_response(data_json: bytes) -> Response:
+    """用已序列化的 data 拼装 APIResponse 结构，避免对大对象重复校验和编码"""
+    envelope = APIResponse().model_dump_json(exclude={"data"})
+    return Response(content=envelope[:-1].encode("utf-8") + b',"data":' + data_json + b"}", media_type="application/json")
 
 @app.get("/api/graph/chunk/{chunk_id}")
 async def get_chunk(chunk_id: str) -> APIResponse:
     """获取原始文档片段内容"""
-    data = knowledge_service.get_chunk(chunk_id)
+    data = await asyncio.to_thread(knowledge_service.get_chunk, chunk_id)
     if not data:
         raise HTTPException(status_code=404, detail=f"Chunk '{chunk_id}' not found")
     return APIResponse(data=data)
 
+@app.get("/api/graph/{concept}/provenance")
+async def get_provenance(concept: str, node_id: Optional[str] = None, doc_id: Optional[str] = None) -> APIResponse:
+    """溯源查询：node_id 给出节点来自哪些 chunk / 文档，doc_id 给出文档贡献了哪些 chunk / 节点"""
+    if (node_id is None) == (doc_id is None):
+        raise HTTPException(status_code=400, detail="Specify exactly one of node_id or doc_id")
+    if node_id is not None:
+        data = await asyncio.to_thread(knowledge_service.get_node_provenance, concept, node_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail=f"Node '{node_id}' not found in graph '{concept}'")
+        return APIResponse(data=NodeProvenance(**data))
+    data = await asyncio.to_thread(knowledge_service.get_document_provenance, concept, doc_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"Document '{doc_id}' not found in graph '{concept}'")
+    return APIResponse(data=DocumentProvenance(**data))
+
 @app.post("/api/qa")
 async def qa(req: QARequest) -> APIResponse:
     """基于图谱的问答"""
@@ -0,0 +1,117 @@
+"""
+搜索任务进度推送（Server-Sent Events）
+
+每个运行中的任务一个频道：status_callback 发布的事件只序列化一次，写入频道的环形缓冲区，
+所有订阅者从同一缓冲区读取（一次发布、多路扇出）。事件 id 在频道内单调递增，
+断线重连时带上 Last-Event-ID 即可从缓冲区补发；缺口超出缓冲区时直接从最新快照继续
+（status 事件本身就是完整快照）。空闲超过心跳间隔时发送 SSE 注释行保活。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+logger = logging.getLogger("central-agent-stream")
+
+BUFFER_SIZE = int(os.getenv("PROGRESS_STREAM_BUFFER", "256"))
+HEARTBEAT_S = float(os.getenv("PROGRESS_HEARTBEAT_S", "15"))
+# 任务结束后频道保留的时间，供断线的客户端重连补发
+RETAIN_S = float(os.getenv("PROGRESS_STREAM_RETAIN_S", "120"))
+
+HEARTBEAT = ": ping\n\n"
+
+
+def format_event(event_id: Optional[int], event: str, data: str) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+
+class _Channel:
+    def __init__(self) -> None:
+        self.events: deque[tuple[int, str, str]] = deque(maxlen=BUFFER_SIZE)
+        self.next_id = 1
+        self.closed_at: Optional[float] = None
+        self.subscribers = 0
+        # 每次发布替换为新的 Event：等待者拿到的旧 Event 被 set，全部订阅者同时唤醒
+        self.changed = asyncio.Event()
+
+    def publish(self, event: str, data: str) -> None:
+        self.events.append((self.next_id, event, data))
+        self.next_id += 1
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class ProgressBus:
+    def __init__(self) -> None:
+        self._channels: Dict[str, _Channel] = {}
+        self.published = 0
+
+    def open(self, task_id: str) -> None:
+        self._sweep()
+        self._channels.setdefault(task_id, _Channel())
+
+    def has(self, task_id: str) -> bool:
+        return task_id in self._channels
+
+    def publish(self, task_id: str, event: str, payload: Any) -> None:
+        ch = self._channels.get(task_id)
+        if ch is None or ch.closed_at is not None:
+            return
+        ch.publish(event, json.dumps(payload, ensure_ascii=False, default=str))
+        self.published += 1
+
+    def close(self, task_id: str) -> None:
+        ch = self._channels.get(task_id)
+        if ch is not None and ch.closed_at is None:
+            ch.closed_at = time.time()
+            # 唤醒订阅者以便它们发现频道已结束
+            changed, ch.changed = ch.changed, asyncio.Event()
+            changed.set()
+
+    def _sweep(self) -> None:
+        cutoff = time.time() - RETAIN_S
+        for task_id in [k for k, ch in self._channels.items() if ch.closed_at is not None and ch.closed_at < cutoff]:
+            del self._channels[task_id]
+
+    async def subscribe(self, task_id: str, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        产出已格式化的 SSE 文本；last_event_id 为空时从最新快照开始
+        频道关闭且缓冲区读完后结束
+        """
+        ch = self._channels.get(task_id)
+        if ch is None:
+            return
+        ch.subscribers += 1
+        cursor = last_event_id if last_event_id is not None else ch.next_id - 2
+        try:
+            while True:
+                waiter = ch.changed
+                if ch.events and cursor < ch.events[0][0] - 1:
+                    # 要补发的事件已被挤出缓冲区，从最新快照继续
+                    cursor = ch.events[-1][0] - 1
+                for event_id, event, data in list(ch.events):
+                    if event_id > cursor:
+                        cursor = event_id
+                        yield format_event(event_id, event, data)
+                if ch.closed_at is not None:
+                    return
+                try:
+                    await asyncio.wait_for(waiter.wait(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            ch.subscribers -= 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "channels": len(self._channels),
+            "open_channels": sum(1 for ch in self._channels.values() if ch.closed_at is None),
+            "subscribers": sum(ch.subscribers for ch in self._channels.values()),
+            "events_published": self.published,
+        }
@@ -0,0 +1,451 @@
+"""
+搜索任务状态存储
+
+- memory：进程内 LRU + TTL，只适用于单 worker
+- sqlite：SQLite（WAL）文件，多个 uvicorn worker 共享任务状态与取消标记，重启后仍可查询
+
+任务结果（chunks）不随状态保存，而是写入 TASK_RESULTS_DIR 下的 JSONL 文件并记录每行偏移，
+/results 分页时只读取对应的行。运行中的任务通过 TaskHandle 合并状态写入，回调本身只改内存。
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("central-agent-tasks")
+
+ACTIVE_STATUSES = ("pending", "processing")
+_SAFE_ID_RE = re.compile(r"[^0-9A-Za-z_-]")
+
+
+class ResultSpool:
+    """每个任务一份 JSONL 结果文件 + int64 行偏移文件，按行号区间读取"""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, task_id: str) -> tuple[str, str]:
+        base = os.path.join(self.root, _SAFE_ID_RE.sub("_", task_id))
+        return base + ".jsonl", base + ".idx"
+
+    def write(self, task_id: str, rows: List[dict]) -> int:
+        data_path, idx_path = self._paths(task_id)
+        offsets = array("q")
+        with open(data_path + ".tmp", "wb") as f:
+            for row in rows:
+                offsets.append(f.tell())
+                f.write(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            offsets.append(f.tell())
+        with open(idx_path + ".tmp", "wb") as f:
+            offsets.tofile(f)
+        # 先换偏移再换数据：读方总是先读偏移，旧偏移指向新文件也只会越界返回空
+        os.replace(idx_path + ".tmp", idx_path)
+        os.replace(data_path + ".tmp", data_path)
+        return len(rows)
+
+    def read(self, task_id: str, offset: int, limit: int) -> List[dict]:
+        data_path, idx_path = self._paths(task_id)
+        if offset < 0 or limit <= 0 or not os.path.exists(idx_path):
+            return []
+        offsets = array("q")
+        with open(idx_path, "rb") as f:
+            f.seek(offset * offsets.itemsize)
+            offsets.frombytes(f.read((limit + 1) * offsets.itemsize))
+        if len(offsets) < 2:
+            return []
+        with open(data_path, "rb") as f:
+            f.seek(offsets[0])
+            raw = f.read(offsets[-1] - offsets[0])
+        return [json.loads(line) for line in raw.splitlines() if line]
+
+    def delete(self, task_id: str) -> None:
+        for path in self._paths(task_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for name in os.listdir(self.root):
+            try:
+                total += os.path.getsize(os.path.join(self.root, name))
+            except OSError:
+                pass
+        return total
+
+
+class TaskStore(ABC):
+    """
+    任务存储接口；方法均为同步调用（sqlite 后端会访问磁盘，异步代码中经 asyncio.to_thread 调用）
+
+    任务以 dict 保存，字段需可 JSON 序列化；results_total 记录已落盘的结果条数。
+    """
+
+    backend = "base"
+
+    def __init__(self, results_dir: str, max_tasks: int, ttl_s: float, stale_s: float) -> None:
+        self.spool = ResultSpool(results_dir)
+        self.max_tasks = max_tasks
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self.evictions = 0
+
+    # --- 子类实现 ---
+    @abstractmethod
+    def _load(self, task_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def put(self, task: dict) -> None:
+        ...
+
+    @abstractmethod
+    def request_cancel(self, task_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def is_cancelled(self, task_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def _recent_by_build_key(self, build_key: str, limit: int) -> List[str]:
+        """同一 build_key 最近更新的任务 id（新到旧）"""
+
+    def close(self) -> None:
+        pass
+
+    # --- 公共逻辑 ---
+    def get(self, task_id: str) -> Optional[dict]:
+        task = self._load(task_id)
+        if task is None:
+            return None
+        # 运行中的任务长时间没有状态写入：所在 worker 已退出（重启 / 崩溃）
+        if task["status"] in ACTIVE_STATUSES and self.stale_s and time.time() - task.get("updated_ts", 0) > self.stale_s:
+            task["status"] = "failed"
+            task["error"] = task.get("error") or "任务中断：执行该任务的进程已退出"
+        return task
+
+    def find_build(self, build_key: str, reuse_s: float) -> Optional[dict]:
+        """
+        查找可复用的相同构建：仍在运行的任务，或 reuse_s 秒内完成的任务
+        """
+        for task_id in self._recent_by_build_key(build_key, limit=5):
+            task = self.get(task_id)
+            if task is None:
+                continue
+            if task["status"] in ACTIVE_STATUSES:
+                return task
+            if task["status"] == "completed" and reuse_s and time.time() - task.get("updated_ts", 0) <= reuse_s:
+                return task
+        return None
+
+    def save_results(self, task_id: str, rows: List[dict]) -> int:
+        return self.spool.write(task_id, rows)
+
+    def results(self, task_id: str, offset: int, limit: int) -> List[dict]:
+        return self.spool.read(task_id, offset, limit)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "tasks": self.count(),
+            "max_tasks": self.max_tasks,
+            "ttl_s": self.ttl_s,
+            "evictions": self.evictions,
+            "results_bytes": self.spool.disk_bytes(),
+        }
+
+
+class MemoryTaskStore(TaskStore):
+    backend = "memory"
+
+    def __init__(self, results_dir: str, max_tasks: int = 1000, ttl_s: float = 0, stale_s: float = 0) -> None:
+        super().__init__(results_dir, max_tasks, ttl_s, stale_s)
+        self._tasks: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            self._expire()
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            self._tasks.move_to_end(task_id)
+            return copy.deepcopy(task)
+
+    def put(self, task: dict) -> None:
+        task = copy.deepcopy(task)
+        task["updated_ts"] = time.time()
+        with self._lock:
+            old = self._tasks.get(task["task_id"])
+            # 取消标记只由 request_cancel 设置，状态写入不能把它覆盖掉
+            task["cancelled"] = bool(old and old.get("cancelled")) or task.get("cancelled", False)
+            self._tasks[task["task_id"]] = task
+            self._tasks.move_to_end(task["task_id"])
+            self._expire()
+            if self.max_tasks and len(self._tasks) > self.max_tasks:
+                overflow = len(self._tasks) - self.max_tasks
+                finished = [k for k, t in self._tasks.items() if t["status"] not in ACTIVE_STATUSES]
+                for task_id in finished[:overflow]:
+                    self._drop(task_id)
+
+    def request_cancel(self, task_id: str) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return False
+            task["cancelled"] = True
+            return True
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return bool(task and task.get("cancelled"))
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def _recent_by_build_key(self, build_key: str, limit: int) -> List[str]:
+        with self._lock:
+            matches = [t for t in self._tasks.values() if t.get("build_key") == build_key]
+        matches.sort(key=lambda t: t["updated_ts"], reverse=True)
+        return [t["task_id"] for t in matches[:limit]]
+
+    def _expire(self) -> None:
+        # 调用方需持有 self._lock；只淘汰已结束的任务
+        if not self.ttl_s:
+            return
+        cutoff = time.time() - self.ttl_s
+        for task_id in [k for k, t in self._tasks.items() if t["updated_ts"] < cutoff and t["status"] not in ACTIVE_STATUSES]:
+            self._drop(task_id)
+
+    def _drop(self, task_id: str) -> None:
+        self._tasks.pop(task_id, None)
+        self.spool.delete(task_id)
+        self.evictions += 1
+
+
+class SQLiteTaskStore(TaskStore):
+    backend = "sqlite"
+
+    def __init__(self, path: str, results_dir: str, max_tasks: int = 10000, ttl_s: float = 0, stale_s: float = 0) -> None:
+        super().__init__(results_dir, max_tasks, ttl_s, stale_s)
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                status TEXT NOT NULL,
+                cancelled INTEGER NOT NULL DEFAULT 0,
+                updated_ts REAL NOT NULL,
+                build_key TEXT
+            )
+            """
+        )
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(tasks)")}
+        if "build_key" not in columns:
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN build_key TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_updated ON tasks(updated_ts)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_build_key ON tasks(build_key, updated_ts)")
+        self._conn.commit()
+
+    def _load(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, cancelled, updated_ts FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        task = json.loads(row[0])
+        task["cancelled"] = bool(row[1])
+        task["updated_ts"] = row[2]
+        return task
+
+    def put(self, task: dict) -> None:
+        now = time.time()
+        data = json.dumps({k: v for k, v in task.items() if k not in ("cancelled", "updated_ts")}, ensure_ascii=False, default=str)
+        with self._lock:
+            # 取消标记列只由 request_cancel 修改（可能来自其他 worker）
+            self._conn.execute(
+                """
+                INSERT INTO tasks (task_id, data, status, cancelled, updated_ts, build_key) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    data = excluded.data, status = excluded.status, updated_ts = excluded.updated_ts, build_key = excluded.build_key
+                """,
+                (task["task_id"], data, task["status"], int(bool(task.get("cancelled"))), now, task.get("build_key")),
+            )
+            victims = self._evict()
+            self._conn.commit()
+        for task_id in victims:
+            self.spool.delete(task_id)
+
+    def request_cancel(self, task_id: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute("UPDATE tasks SET cancelled = 1 WHERE task_id = ?", (task_id,))
+            self._conn.commit()
+        return cur.rowcount > 0
+
+    def is_cancelled(self, task_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancelled FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return bool(row and row[0])
+
+    def count(self) -> int:
+        with self._lock:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()
+        return n
+
+    def _recent_by_build_key(self, build_key: str, limit: int) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id FROM tasks WHERE build_key = ? ORDER BY updated_ts DESC LIMIT ?", (build_key, limit)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _evict(self) -> List[str]:
+        # 调用方需持有 self._lock；只淘汰已结束的任务
+        victims: List[str] = []
+        placeholders = ",".join("?" for _ in ACTIVE_STATUSES)
+        if self.ttl_s:
+            victims += [r[0] for r in self._conn.execute(
+                f"SELECT task_id FROM tasks WHERE updated_ts < ? AND status NOT IN ({placeholders})",
+                (time.time() - self.ttl_s, *ACTIVE_STATUSES),
+            )]
+        if self.max_tasks:
+            (n,) = self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()
+            overflow = n - len(victims) - self.max_tasks
+            if overflow > 0:
+                victims += [r[0] for r in self._conn.execute(
+                    f"SELECT task_id FROM tasks WHERE status NOT IN ({placeholders}) ORDER BY updated_ts ASC LIMIT ? OFFSET ?",
+                    (*ACTIVE_STATUSES, overflow, len(victims)),
+                )]
+        if victims:
+            self._conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(v,) for v in victims])
+            self.evictions += len(victims)
+        return victims
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_task_store() -> TaskStore:
+    backend = os.getenv("TASK_STORE", "memory").strip().lower()
+    results_dir = os.getenv("TASK_RESULTS_DIR", "./data/task_results")
+    ttl_s = float(os.getenv("TASK_STORE_TTL_S", str(7 * 24 * 3600)))
+    stale_s = float(os.getenv("TASK_STALE_S", "900"))
+    if backend == "sqlite":
+        return SQLiteTaskStore(
+            path=os.getenv("TASK_STORE_PATH", "./data/tasks.sqlite3"),
+            results_dir=results_dir,
+            max_tasks=int(os.getenv("TASK_STORE_MAX_TASKS", "10000")),
+            ttl_s=ttl_s,
+            stale_s=stale_s,
+        )
+    if backend != "memory":
+        logger.warning("Unknown TASK_STORE=%s, falling back to memory", backend)
+    return MemoryTaskStore(
+        results_dir=results_dir,
+        max_tasks=int(os.getenv("TASK_STORE_MAX_TASKS", "1000")),
+        ttl_s=ttl_s,
+        stale_s=stale_s,
+    )
+
+
+class TaskHandle:
+    """
+    运行中任务的本地状态副本
+
+    status_callback 只修改 data 并标记脏，距上次写入不足 flush_interval 时合并到一次延迟写入；
+    取消标记同样按 flush_interval 节流地从存储刷新（其他 worker 可能发起取消）。
+    """
+
+    def __init__(self, store: TaskStore, task: dict, flush_interval: float) -> None:
+        self.store = store
+        self.data = task
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._pending: Optional[asyncio.Task] = None
+        # 写入串行执行：to_thread 中的 put 无法被取消，最终状态必须在之前的写入完成后再写
+        self._write_lock = asyncio.Lock()
+        self._cancelled = False
+        self._last_cancel_check = 0.0
+        self.writes = 0
+        self.updates = 0
+
+    @property
+    def task_id(self) -> str:
+        return self.data["task_id"]
+
+    def touch(self) -> None:
+        """标记状态已修改；写入合并到下一次刷新"""
+        self.updates += 1
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        delay = self._last_flush + self.flush_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._write()
+
+    async def _write(self) -> None:
+        async with self._write_lock:
+            snapshot = copy.deepcopy(self.data)
+            self._last_flush = time.monotonic()
+            self.writes += 1
+            try:
+                await asyncio.to_thread(self.store.put, snapshot)
+            except Exception as e:
+                logger.warning("Task status write failed for %s: %s", self.task_id, e)
+
+    async def flush(self) -> None:
+        """立即写入最新状态（任务结束时调用）"""
+        pending, self._pending = self._pending, None
+        if pending is not None and not pending.done():
+            if self._write_lock.locked():
+                # 已在写入旧快照：取消只会中断等待，线程中的 put 仍可能晚于最终写入落盘
+                await pending
+            else:
+                # 仍在等待节流间隔，取消后不会再写
+                pending.cancel()
+        await self._write()
+
+    def cancelled(self) -> bool:
+        if self._cancelled:
+            return True
+        now = time.monotonic()
+        if now - self._last_cancel_check >= self.flush_interval:
+            self._last_cancel_check = now
+            try:
+                self._cancelled = self.store.is_cancelled(self.task_id)
+            except Exception as e:
+                logger.warning("Cancel check failed for %s: %s", self.task_id, e)
+        return self._cancelled
+
+    def mark_cancelled(self) -> None:
+        self._cancelled = True
@@ -0,0 +1,208 @@
+"""
+进程内指标，按 Prometheus 文本格式（0.0.4）导出，由 central_agent 的 /metrics 接口暴露
+
+Counter / Gauge / Histogram 三种类型，按 label 取值组合分序列。label 只能使用有限取值
+（阶段名、上游名、状态码类别等），不要把概念、URL、task_id 作为 label；
+单个指标的序列数达到 max_series 后，新出现的组合统一归入 label 值 "other"，避免基数失控。
+
+指标在模块级定义、导入时注册；方法均线程安全（embedding、graphml 解析等运行在线程池中）。
+多 worker 部署时每个进程各自计数，由 Prometheus 按实例汇总。
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "200"))
+
+# 秒级延迟的默认分桶：覆盖毫秒级的缓存命中到分钟级的 LightRAG 插入
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+OVERFLOW = "other"
+
+_registry: Dict[str, "_Metric"] = {}
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), max_series: int = MAX_SERIES) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.max_series = max(1, max_series)
+        self._lock = threading.Lock()
+        self._series: Dict[tuple[str, ...], Any] = {}
+        with _registry_lock:
+            if name in _registry:
+                raise ValueError(f"Metric {name!r} is already registered")
+            _registry[name] = self
+
+    def _key(self, labels: Dict[str, Any]) -> tuple[str, ...]:
+        """调用方需持有 self._lock"""
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"Unknown labels for {self.name}: {sorted(unknown)}")
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        if key not in self._series and len(self._series) >= self.max_series:
+            key = tuple(OVERFLOW for _ in self.labelnames)
+        return key
+
+    def _labels(self, key: tuple[str, ...], extra: Optional[tuple[str, str]] = None) -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra is not None:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """调用方需持有 self._lock"""
+
+    def render(self) -> str:
+        with self._lock:
+            samples = self._samples()
+        return "\n".join([f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}", *samples])
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("Counter can only increase")
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._series.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in self._series.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._series[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        with self._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._labels(k)} {_fmt(v)}" for k, v in self._series.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        max_series: int = MAX_SERIES,
+    ) -> None:
+        super().__init__(name, doc, labelnames, max_series)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                # [各分桶计数..., +Inf 计数, 总和]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """计时上下文（同步、异步代码均可使用），异常退出同样记录耗时"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[:-1]) if series else 0
+
+    def _samples(self) -> List[str]:
+        out: List[str] = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), series[:-1]):
+                cumulative += n
+                out.append(f"{self.name}_bucket{self._labels(key, ('le', _fmt(bound)))} {cumulative}")
+            out.append(f"{self.name}_sum{self._labels(key)} {_fmt(series[-1])}")
+            out.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return out
+
+
+def render() -> str:
+    """全部已注册指标的 Prometheus 文本"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n\n".join(m.render() for m in metrics) + "\n"
+
+
+def status_class(status: Optional[int]) -> str:
+    """HTTP 状态码归类为有限取值：429 单独保留，其余按 2xx/3xx/4xx/5xx，无响应为 error"""
+    if status is None:
+        return "error"
+    if status == 429:
+        return "429"
+    return f"{status // 100}xx"
+
+
+# --- 跨模块共用的指标（Search Agent 与 LightRAG 都会调用 LLM） ---
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "LLM chat completion latency per attempt", ["component", "operation", "outcome"]
+)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens reported by the API usage field", ["component", "operation", "kind"])
+LLM_RETRIES = Counter("llm_retries_total", "LLM request attempts after the first one", ["component", "operation"])
+
+
+def record_llm_usage(component: str, operation: str, usage: Any) -> None:
+    """累计 usage 中的 prompt / completion token 数；usage 可以是 dict 或 OpenAI SDK 对象"""
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        field = f"{kind}_tokens"
+        n = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+        if n:
+            LLM_TOKENS.inc(n, component=component, operation=operation, kind=kind)
@@ -33,12 +33,14 @@ class ClassifyResult(BaseModel):
     primary_discipline: str
     disciplines: list[Discipline]
     suggested_additions: list[SuggestedAddition] = Field(default_factory=list)
+    cache: Optional[dict] = None  # 分类缓存来源（exact / similar / miss）
 
 class SearchConfig(BaseModel):
     depth: Literal["shallow", "medium", "deep"] = "medium"
     max_results_per_discipline: int = Field(10, ge=1, le=50)
     enable_validation: bool = True
     auto_ingest: bool = True  # 新增：控制是否自动入库
+    pipeline: Literal["staged", "streaming"] = "staged"  # staged: LangGraph 阶段屏障；streaming: 有界队列流水线
 
 class DisciplineInput(BaseModel):
     name: str
@@ -48,12 +50,15 @@ class SearchStartRequest(BaseModel):
     concept: str = Field(..., min_length=1)
     disciplines: list[DisciplineInput]
     search_config: SearchConfig = Field(default_factory=SearchConfig)
+    priority: int = 0  # 排队时数值大的先执行
 
 class SearchStartResult(BaseModel):
     task_id: str
     status: str
     created_at: datetime
     estimated_duration_seconds: int = 30
+    queue_position: Optional[int] = None  # 排队中时的位置（从 1 开始），已开始执行为 None
+    coalesced: bool = False  # True 表示复用了相同构建（运行中或刚完成）的任务
 
 class SourceInfo(BaseModel):
     url: str
@@ -100,6 +105,7 @@ class SearchStatusData(BaseModel):
     partial_results: dict
     started_at: Optional[datetime] = None
     updated_at: datetime
+    queue_position: Optional[int] = None
 
 class CancelTaskResult(BaseModel):
     task_id: str
@@ -120,6 +126,7 @@ class PlanResult(BaseModel):
     defaults: list[str] = Field(default_factory=list)
     disciplines: list[PlanDiscipline]
     suggested_additions: list[SuggestedAddition] = Field(default_factory=list)
+    cache: Optional[dict] = None
 
 # --- Knowledge Engine 相关 
 
@@ -144,6 +151,23 @@ class GraphResponse(BaseModel):
     total_nodes: int
     total_edges: int
 
+class ChunkProvenance(BaseModel):
+    chunk_id: str
+    doc_ids: List[str]
+    domains: List[str]
+
+class NodeProvenance(BaseModel):
+    concept: str
+    node_id: str
+    chunks: List[ChunkProvenance]
+    doc_ids: List[str]
+
+class DocumentProvenance(BaseModel):
+    concept: str
+    doc_id: str
+    chunk_ids: List[str]
+    nodes: List[str]
+
 class QARequest(BaseModel):
     concept: str
     source_node: str
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger("sqlite-cache")
+
+
+class SQLiteCache:
+    """
+    基于 SQLite 的持久化 KV 缓存（值为 JSON）
+
+    - TTL：过期条目在读取时视为未命中并删除
+    - LRU：命中时刷新 accessed_at，超出 max_entries / max_bytes 时淘汰最久未访问的条目
+    - 同一文件可被多个进程共享（WAL 模式）
+
+    方法均为同步阻塞调用，异步代码中请通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, path: str, ttl_s: float = 0, max_entries: int = 0, max_bytes: int = 0) -> None:
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_s and now - created_at > self.ttl_s:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # 调用方需持有 self._lock
+        if self.ttl_s:
+            cur = self._conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_s,))
+            self.evictions += max(cur.rowcount, 0)
+        if self.max_entries:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.max_entries:
+                cur = self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += max(cur.rowcount, 0)
+        if self.max_bytes:
+            (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+            if total > self.max_bytes:
+                # 按访问时间从旧到新累加，删除到总量回到上限以内
+                overflow = total - self.max_bytes
+                freed, victims = 0, []
+                for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC"):
+                    if freed >= overflow:
+                        break
+                    victims.append((key,))
+                    freed += size
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+                self.evictions += len(victims)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "ttl_s": self.ttl_s,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
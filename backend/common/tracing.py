@@ -0,0 +1,164 @@
+"""
+单任务的调用时间线（span 树），导出为 Chrome trace 格式（chrome://tracing、ui.perfetto.dev 可直接打开）
+
+- 任务开始时 activate(trace) 把 Trace 放入 contextvar；之后在同一上下文中创建的
+  asyncio 任务、asyncio.to_thread 调用都会继承它，span() 自动挂到当前 span 之下
+- 不在任何任务上下文中时 span() 不做记录（classify 等接口调用同一代码路径时零开销）
+- 并发的兄弟 span（如同时进行的多个查询）分配到不同的 lane（trace 中的 tid），
+  保证每条 lane 上的事件严格嵌套，时间线显示不会错乱
+- 每个 trace 最多记录 TRACE_MAX_SPANS 个 span，超出的只计数；
+  最近 TRACE_MAX_TASKS 个任务的 trace 保留在本进程内存中
+"""
+from __future__ import annotations
+
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "5000"))
+TRACE_MAX_TASKS = int(os.getenv("TRACE_MAX_TASKS", "200"))
+
+# (trace, 当前 span 的 id, 当前 span 所在 lane)
+_current: contextvars.ContextVar[Optional[tuple["Trace", int, int]]] = contextvars.ContextVar("trace_span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id: str, **meta: Any) -> None:
+        self.trace_id = trace_id
+        self.meta = meta
+        self.started_at = datetime.utcnow().isoformat()
+        self.t0 = time.perf_counter()
+        self.finished = False
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # (name, span_id, parent_id, lane, start_s, end_s, args)
+        self._spans: List[tuple[str, int, int, int, float, float, Dict[str, Any]]] = []
+        # 每条 lane 上当前打开的 span 栈
+        self._lanes: List[List[int]] = [[]]
+
+    def _open(self, parent_id: int, parent_lane: int) -> tuple[int, int]:
+        with self._lock:
+            span_id = next(self._ids)
+            stack = self._lanes[parent_lane]
+            if (not stack and parent_id == 0) or (stack and stack[-1] == parent_id):
+                lane = parent_lane
+            else:
+                # 父 span 所在 lane 上已有并发的兄弟 span，改用空闲 lane
+                lane = next((i for i, s in enumerate(self._lanes) if not s), len(self._lanes))
+                if lane == len(self._lanes):
+                    self._lanes.append([])
+            self._lanes[lane].append(span_id)
+            return span_id, lane
+
+    def _close(self, name: str, span_id: int, parent_id: int, lane: int, start: float, end: float, args: Dict[str, Any]) -> None:
+        with self._lock:
+            stack = self._lanes[lane]
+            if span_id in stack:
+                stack.remove(span_id)
+            if len(self._spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return
+            self._spans.append((name, span_id, parent_id, lane, start, end, args))
+
+    def add_span(self, name: str, start: float, end: float, **args: Any) -> None:
+        """补记一段已结束的区间（perf_counter 时间），如排队等待"""
+        span_id, lane = self._open(0, 0)
+        self._close(name, span_id, 0, lane, start, end, args)
+
+    @property
+    def span_count(self) -> int:
+        return len(self._spans)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self._spans)
+            lanes = len(self._lanes)
+        events: List[Dict[str, Any]] = [
+            {"ph": "M", "pid": 1, "tid": 0, "name": "process_name", "args": {"name": self.trace_id}},
+        ]
+        for lane in range(lanes):
+            events.append({"ph": "M", "pid": 1, "tid": lane, "name": "thread_name",
+                           "args": {"name": "task" if lane == 0 else f"concurrent-{lane}"}})
+        for name, span_id, parent_id, lane, start, end, args in sorted(spans, key=lambda s: s[4]):
+            events.append({
+                "ph": "X",
+                "name": name,
+                "cat": name.split(":", 1)[0],
+                "pid": 1,
+                "tid": lane,
+                "ts": round((start - self.t0) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "args": {**args, "span_id": span_id, "parent_id": parent_id},
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "trace_id": self.trace_id,
+                "started_at": self.started_at,
+                "finished": self.finished,
+                "spans": len(spans),
+                "dropped_spans": self.dropped,
+                **self.meta,
+            },
+        }
+
+
+@contextmanager
+def activate(trace: Trace) -> Iterator[Trace]:
+    """在当前上下文中启用 trace（之后的 span 都记录到它下面）"""
+    token = _current.set((trace, 0, 0))
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    """
+    记录一个 span；产出的 dict 即 span 的 args，可在退出前补充结果大小等信息
+    异常退出时记录异常类型
+    """
+    current = _current.get()
+    if current is None:
+        yield args
+        return
+    trace, parent_id, parent_lane = current
+    span_id, lane = trace._open(parent_id, parent_lane)
+    token = _current.set((trace, span_id, lane))
+    start = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        trace._close(name, span_id, parent_id, lane, start, time.perf_counter(), args)
+
+
+class TraceRegistry:
+    """本进程最近任务的 trace（LRU）"""
+
+    def __init__(self, max_traces: int = TRACE_MAX_TASKS) -> None:
+        self.max_traces = max(1, max_traces)
+        self._traces: OrderedDict[str, Trace] = OrderedDict()
+
+    def start(self, trace_id: str, **meta: Any) -> Trace:
+        trace = Trace(trace_id, **meta)
+        self._traces[trace_id] = trace
+        self._traces.move_to_end(trace_id)
+        while len(self._traces) > self.max_traces:
+            self._traces.popitem(last=False)
+        return trace
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        return self._traces.get(trace_id)
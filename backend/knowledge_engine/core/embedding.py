@@ -0,0 +1,464 @@
+"""
+Embedding 计算：跨调用方的动态微批 + 可选的独立 worker 进程
+
+- EMBEDDING_MODE=inline：本进程加载模型，encode 在专用后台线程中执行，不阻塞事件循环
+- EMBEDDING_MODE=worker：模型只在一个独立进程中加载一次，所有 uvicorn worker 通过 unix socket 共享；
+  连接不上时由客户端拉起该进程（文件锁保证只拉起一个），也可单独运行：
+      python -m knowledge_engine.core.embedding
+
+两种模式都经过 MicroBatcher：各调用方（并发构建、QA、分类缓存）的小请求在 EMBEDDING_MAX_WAIT_MS 内
+合并成不超过 EMBEDDING_MAX_BATCH 条文本的批次，一次前向计算后再按请求拆分结果。
+推理后端由 EMBEDDING_BACKEND 选择（torch / onnx）。
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import fcntl
+import importlib.util
+import itertools
+import logging
+import os
+import queue
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from common.metrics import Histogram
+
+load_dotenv()
+
+# 如果没有设置，默认使用 huggingface 镜像
+os.environ.setdefault('HF_ENDPOINT', 'https://hf-mirror.com')
+
+logger = logging.getLogger("embedding")
+
+EMBEDDING_MODE = os.getenv("EMBEDDING_MODE", "inline").strip().lower()
+# torch：SentenceTransformer fp32；onnx：ONNX Runtime（默认 int8 动态量化，见 onnx_embedding.py）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+# onnxruntime 是可选依赖（uv sync --extra onnx / pip install "backend[onnx]"），未安装时退回 torch，
+# 在这里决定而不是加载模型时，保证缓存等使用的模型标识与实际后端一致
+if EMBEDDING_BACKEND == "onnx" and importlib.util.find_spec("onnxruntime") is None:
+    logger.warning("EMBEDDING_BACKEND=onnx but onnxruntime is not installed (install the 'onnx' extra), falling back to torch")
+    EMBEDDING_BACKEND = "torch"
+SOCKET_PATH = os.getenv("EMBEDDING_SOCKET", "./data/embedding.sock")
+MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+MAX_WAIT_S = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")) / 1000
+AUTOSTART = os.getenv("EMBEDDING_WORKER_AUTOSTART", "true").strip().lower() in ("1", "true", "yes")
+# 拉起 worker 后等待其加载模型并开始监听的时间
+START_TIMEOUT_S = float(os.getenv("EMBEDDING_WORKER_START_TIMEOUT_S", "300"))
+# 未设置时使用 socket 旁边的随机密钥文件（{socket}.key，权限 0600），见 worker_authkey
+AUTHKEY = os.getenv("EMBEDDING_WORKER_AUTHKEY", "")
+
+DEFAULT_MODEL = "BAAI/bge-large-zh-v1.5"
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MICROBATCH_SIZE = Histogram(
+    "embedding_microbatch_size", "Texts per merged forward pass (inline mode)", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+DoneFn = Callable[[Optional[np.ndarray], Optional[BaseException]], None]
+
+
+def resolve_model_source() -> str:
+    """EMBEDDING_MODEL 指向的本地模型目录；不存在时使用 HF 上的默认模型"""
+    model_path = os.getenv("EMBEDDING_MODEL", "./bge-large-zh-v1.5")
+    if os.path.exists(model_path) and os.path.exists(os.path.join(model_path, "config.json")):
+        return model_path
+    return DEFAULT_MODEL
+
+
+def embedding_model_id() -> str:
+    """模型 + 推理后端的标识；int8 量化的向量与 fp32 略有差异，缓存等按它区分"""
+    model_id = os.path.basename(os.getenv("EMBEDDING_MODEL", "./bge-large-zh-v1.5").rstrip("/"))
+    if EMBEDDING_BACKEND == "onnx":
+        from .onnx_embedding import ONNX_QUANTIZED
+        model_id += "-onnx-int8" if ONNX_QUANTIZED else "-onnx"
+    return model_id
+
+
+def load_embedding_model():
+    if EMBEDDING_BACKEND == "onnx":
+        from .onnx_embedding import load_onnx_model
+        try:
+            return load_onnx_model(resolve_model_source())
+        except ImportError as e:
+            # 如首次导出量化模型时缺少 onnx 包
+            raise RuntimeError(f"EMBEDDING_BACKEND=onnx requires the 'onnx' extra (onnxruntime, onnx): {e}") from e
+
+    from sentence_transformers import SentenceTransformer
+
+    try:
+        source = resolve_model_source()
+        if source == DEFAULT_MODEL:
+            print(f"Loading embedding model from HF: {DEFAULT_MODEL}")
+        return SentenceTransformer(source, device='cpu')
+    except Exception as e:
+        print(f"Warning: Embedding load failed ({e}), using fallback.")
+        return SentenceTransformer(DEFAULT_MODEL, device='cpu')
+
+
+def worker_authkey(socket_path: str) -> bytes:
+    """
+    worker 连接的认证密钥。multiprocessing.connection 会反序列化收到的对象，
+    密钥不能是公开的默认值：未配置 EMBEDDING_WORKER_AUTHKEY 时，首次使用生成随机密钥写入
+    仅本用户可读的 {socket}.key，客户端与 worker 进程读取同一文件
+    """
+    if AUTHKEY:
+        return AUTHKEY.encode("utf-8")
+    key_path = socket_path + ".key"
+    if not os.path.exists(key_path):
+        os.makedirs(os.path.dirname(key_path) or ".", exist_ok=True)
+        # 先写临时文件再 link：并发创建时只有一个成功，其他进程不会读到写了一半的文件
+        tmp_path = f"{key_path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            os.link(tmp_path, key_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(key_path, "r") as f:
+        return f.read().strip().encode("utf-8")
+
+
+def model_encoder(model: Any, batch_size: int = MAX_BATCH) -> EncodeFn:
+    def encode(texts: List[str]) -> np.ndarray:
+        return np.asarray(model.encode(texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+    return encode
+
+
+class MicroBatcher:
+    """
+    在单个后台线程中执行 encode：取到第一个请求后最多再等 max_wait_s 凑批，
+    凑满 max_batch 条文本立即执行；超出的请求留给下一批
+    """
+
+    def __init__(self, encode_fn: EncodeFn, max_batch: int = MAX_BATCH, max_wait_s: float = MAX_WAIT_S) -> None:
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max_wait_s
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.encode_s = 0.0
+
+    def submit(self, texts: List[str], done: DoneFn) -> None:
+        """done(vectors, error) 在后台线程中回调"""
+        # 线程意外退出（如 encode 之外的异常）时重新拉起，避免后续请求永远等不到回调
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+        self._queue.put((texts, done))
+
+    def close(self) -> None:
+        self._queue.put(None)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            size = len(first[0])
+            deadline = time.monotonic() + self.max_wait_s
+            stop = False
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+                size += len(nxt[0])
+            self._encode(batch)
+            if stop:
+                return
+
+    def _encode(self, batch: List[tuple[List[str], DoneFn]]) -> None:
+        texts = [t for ts, _ in batch for t in ts]
+        t0 = time.perf_counter()
+        try:
+            vectors = self.encode_fn(texts)
+        except Exception as e:
+            logger.error("Embedding batch of %d texts failed: %s", len(texts), e)
+            for _, done in batch:
+                self._notify(done, None, e)
+            return
+        self.encode_s += time.perf_counter() - t0
+        self.requests += len(batch)
+        self.texts += len(texts)
+        self.batches += 1
+        MICROBATCH_SIZE.observe(len(texts))
+        offset = 0
+        for ts, done in batch:
+            self._notify(done, vectors[offset: offset + len(ts)], None)
+            offset += len(ts)
+
+    @staticmethod
+    def _notify(done: DoneFn, vectors: Optional[np.ndarray], error: Optional[BaseException]) -> None:
+        # 回调异常（如调用方的事件循环已关闭）只影响该请求，不能让后台线程退出
+        try:
+            done(vectors, error)
+        except Exception as e:
+            logger.error("Embedding callback failed: %s", e)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": self.batches,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "encode_s": round(self.encode_s, 3),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_s * 1000,
+        }
+
+
+def _resolve(fut: asyncio.Future, vectors: Optional[np.ndarray], error: Optional[BaseException]) -> None:
+    if fut.done():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(vectors)
+
+
+class InlineEmbedder:
+    mode = "inline"
+
+    def __init__(self, model: Any = None, max_batch: int = MAX_BATCH, max_wait_s: float = MAX_WAIT_S) -> None:
+        self.model = model if model is not None else load_embedding_model()
+        self.batcher = MicroBatcher(model_encoder(self.model, max_batch), max_batch, max_wait_s)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self.batcher.submit(list(texts), lambda v, e: loop.call_soon_threadsafe(_resolve, fut, v, e))
+        return await fut
+
+    def stats(self) -> dict[str, Any]:
+        return {"mode": self.mode, **self.batcher.stats()}
+
+    def close(self) -> None:
+        self.batcher.close()
+
+
+class WorkerEmbedder:
+    """
+    embedding worker 进程的客户端；一个连接上可并发多个请求（按请求 id 匹配响应）
+    连接断开时在途请求以 ConnectionError 失败，下次调用自动重连（必要时重新拉起 worker）
+    """
+
+    mode = "worker"
+
+    def __init__(self, socket_path: str = SOCKET_PATH, autostart: bool = AUTOSTART, start_timeout_s: float = START_TIMEOUT_S) -> None:
+        self.socket_path = socket_path
+        self.autostart = autostart
+        self.start_timeout_s = start_timeout_s
+        self._conn: Optional[Connection] = None
+        self._connect_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+
+        self.requests = 0
+        self.connects = 0
+        self.spawned = 0
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        conn = self._conn or await asyncio.to_thread(self._connect)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req_id = next(self._ids)
+        self._pending[req_id] = (loop, fut)
+        try:
+            with self._send_lock:
+                conn.send((req_id, "embed", list(texts)))
+            self.requests += 1
+            return await fut
+        except OSError as e:
+            self._disconnect(conn, e)
+            raise ConnectionError(f"Embedding worker connection lost: {e}") from e
+        finally:
+            self._pending.pop(req_id, None)
+
+    def _try_connect(self) -> Optional[Connection]:
+        try:
+            return Client(self.socket_path, family="AF_UNIX", authkey=worker_authkey(self.socket_path))
+        except OSError:
+            return None
+
+    def _connect(self) -> Connection:
+        with self._connect_lock:
+            if self._conn is not None:
+                return self._conn
+            conn = self._try_connect()
+            if conn is None:
+                if not self.autostart:
+                    raise ConnectionError(f"Embedding worker is not listening on {self.socket_path}")
+                conn = self._spawn_and_connect()
+            self.connects += 1
+            self._conn = conn
+            threading.Thread(target=self._read_loop, args=(conn,), name="embedding-client", daemon=True).start()
+            return conn
+
+    def _spawn_and_connect(self) -> Connection:
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        # 多个 uvicorn worker 同时启动时只由拿到锁的一个拉起进程，其余等锁释放后直接连接
+        with open(self.socket_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            conn = self._try_connect()
+            if conn is not None:
+                return conn
+            logger.info("Starting embedding worker on %s", self.socket_path)
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(p for p in (BACKEND_ROOT, os.getenv("PYTHONPATH")) if p)}
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "knowledge_engine.core.embedding", "--socket", self.socket_path],
+                env=env,
+                start_new_session=True,  # 不随单个 uvicorn worker 退出，供其他 worker 继续使用
+            )
+            self.spawned += 1
+            deadline = time.monotonic() + self.start_timeout_s
+            while conn is None:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"Embedding worker exited with code {proc.returncode}")
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Embedding worker did not start within {self.start_timeout_s}s")
+                time.sleep(0.2)
+                conn = self._try_connect()
+            return conn
+
+    def _read_loop(self, conn: Connection) -> None:
+        while True:
+            try:
+                req_id, ok, payload = conn.recv()
+            except (EOFError, OSError) as e:
+                self._disconnect(conn, e)
+                return
+            entry = self._pending.get(req_id)
+            if entry is None:
+                continue  # 调用方已取消
+            loop, fut = entry
+            error = None if ok else RuntimeError(f"Embedding worker error: {payload}")
+            loop.call_soon_threadsafe(_resolve, fut, payload if ok else None, error)
+
+    def _disconnect(self, conn: Connection, error: BaseException) -> None:
+        with self._connect_lock:
+            if self._conn is not conn:
+                return
+            self._conn = None
+        logger.warning("Embedding worker connection closed: %s", error)
+        try:
+            conn.close()
+        except OSError:
+            pass
+        for loop, fut in list(self._pending.values()):
+            loop.call_soon_threadsafe(_resolve, fut, None, ConnectionError("Embedding worker connection closed"))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "socket": self.socket_path,
+            "connected": self._conn is not None,
+            "requests": self.requests,
+            "in_flight": len(self._pending),
+            "connects": self.connects,
+            "spawned": self.spawned,
+        }
+
+    def close(self) -> None:
+        # 只断开本进程的连接，worker 进程继续为其他 uvicorn worker 服务
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+def create_embedder():
+    if EMBEDDING_MODE == "worker":
+        return WorkerEmbedder()
+    return InlineEmbedder()
+
+
+# --- worker 进程 ---
+
+def _serve_connection(conn: Connection, batcher: MicroBatcher) -> None:
+    send_lock = threading.Lock()
+
+    def reply(message: tuple) -> None:
+        with send_lock:
+            try:
+                conn.send(message)
+            except OSError:
+                pass  # 客户端已断开
+
+    while True:
+        try:
+            req_id, kind, payload = conn.recv()
+        except (EOFError, OSError):
+            break
+        if kind == "embed":
+            batcher.submit(payload, lambda v, e, r=req_id: reply((r, e is None, v if e is None else repr(e))))
+        elif kind == "stats":
+            reply((req_id, True, batcher.stats()))
+        else:
+            reply((req_id, False, f"unknown request {kind!r}"))
+    conn.close()
+
+
+def serve(socket_path: str = SOCKET_PATH, model: Any = None, max_batch: int = MAX_BATCH, max_wait_s: float = MAX_WAIT_S) -> None:
+    """加载模型后监听 unix socket（模型加载完成前不监听，客户端据此判断是否就绪）"""
+    model = model if model is not None else load_embedding_model()
+    batcher = MicroBatcher(model_encoder(model, max_batch), max_batch, max_wait_s)
+    os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # 上次异常退出留下的 socket 文件
+    listener = Listener(socket_path, family="AF_UNIX", authkey=worker_authkey(socket_path))
+    # 只允许本用户连接
+    os.chmod(socket_path, 0o600)
+    logger.info("Embedding worker listening on %s (max_batch=%d, max_wait=%.1fms)", socket_path, max_batch, max_wait_s * 1000)
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:  # 认证失败等只影响该连接
+                logger.warning("Rejected embedding client: %s", e)
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, batcher), daemon=True).start()
+    finally:
+        listener.close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Embedding worker process")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_S * 1000)
+    args = parser.parse_args()
+    # SIGTERM 走正常退出路径，关闭监听并删除 socket 文件
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    serve(args.socket, max_batch=args.max_batch, max_wait_s=args.max_wait_ms / 1000)
@@ -0,0 +1,341 @@
+"""
+内容寻址的 embedding 磁盘缓存（位于 RAGEngine._embedding_wrapper 之前）
+
+键为 blake2b(模型标识 + 规范化文本) 的 16 字节摘要；同一段文本（chunk、实体名、关系描述）
+在重建或不同概念共享来源时直接命中，只有未命中的文本才送入模型，结果按请求顺序返回。
+
+磁盘布局（EMBEDDING_CACHE_DIR）：
+- vectors.<gen>.bin：只追加的向量矩阵（float16 / float32，每行 dim 个值），以 np.memmap 只读映射
+- index.<gen>.bin：只追加的索引日志，每条 16 字节键 + int64 行号
+- meta.json：当前代数 gen、维度与存储类型
+
+总大小超过 EMBEDDING_CACHE_MAX_BYTES 时压缩为新一代文件：按最近使用顺序保留到上限的 80%，
+切换 meta.json 后删除旧文件。写入与压缩持有文件锁，多个 uvicorn worker 可共享同一目录，
+读取时根据索引日志长度 / meta.json 变化增量同步其他进程的写入。
+
+方法均为同步阻塞调用，异步代码中请通过 asyncio.to_thread 调用（get_or_embed 已处理）。
+"""
+from __future__ import annotations
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from common.metrics import Counter, Gauge
+
+from .embedding import embedding_model_id
+
+logger = logging.getLogger("embedding-cache")
+
+ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./data/embedding_cache")
+MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 ** 3)))
+DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16").strip().lower()
+# 压缩后保留的比例（相对 MAX_BYTES）
+COMPACT_TO = 0.8
+
+KEY_BYTES = 16
+RECORD_BYTES = KEY_BYTES + 8
+_WS_RE = re.compile(r"\s+")
+
+LOOKUPS = Counter("embedding_cache_lookups_total", "Embedding cache lookups per text", ["result"])
+CACHE_BYTES = Gauge("embedding_cache_bytes", "Embedding cache vector file size")
+
+
+def normalize_text(text: str) -> str:
+    return _WS_RE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+class EmbeddingCache:
+    def __init__(self, root: str, model_id: str, max_bytes: int = MAX_BYTES, dtype: str = DTYPE) -> None:
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.root = root
+        self.model_id = model_id
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+
+        # 键 -> 行号；迭代顺序即最近使用顺序（最旧在前）
+        self._index: OrderedDict[bytes, int] = OrderedDict()
+        self._gen = -1
+        self._dim: Optional[int] = None
+        # meta.json 的 (inode, mtime)；None 表示尚未读取，() 表示文件不存在
+        self._meta_sig: Optional[tuple] = None
+        self._index_pos = 0
+        self._mm: Optional[np.memmap] = None
+        # 启动后其他进程把目录切换成了别的存储类型：不再读写缓存
+        self._dtype_mismatch = False
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.compactions = 0
+        with self._lock:
+            with self._file_lock():
+                self._migrate_dtype()
+            self._refresh()
+
+    # --- 文件与同步 ---
+
+    def _path(self, kind: str, gen: Optional[int] = None) -> str:
+        return os.path.join(self.root, f"{kind}.{self._gen if gen is None else gen}.bin")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.root, "meta.json")
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(os.path.join(self.root, "cache.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _write_meta(self, gen: int, dim: Optional[int]) -> None:
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"gen": gen, "dim": dim, "dtype": self.dtype.name}, f)
+        os.replace(tmp, self._meta_path)
+
+    def _read_meta(self) -> dict:
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _migrate_dtype(self) -> None:
+        """存储类型变更：旧数据作废，从新一代开始；只在启动时执行，调用方需持有文件锁"""
+        try:
+            meta = self._read_meta()
+        except FileNotFoundError:
+            return
+        if meta.get("dtype") != self.dtype.name:
+            logger.info("Embedding cache dtype changed (%s -> %s), starting a new generation", meta.get("dtype"), self.dtype.name)
+            self._write_meta(int(meta.get("gen", 0)) + 1, None)
+
+    def _refresh(self) -> None:
+        """同步其他进程的写入 / 压缩；调用方需持有 self._lock"""
+        # meta.json 经 os.replace 更新，每次都是新的 inode；只比较 mtime 时同一时钟刻度内的两次写入无法区分
+        try:
+            st = os.stat(self._meta_path)
+            meta_sig: tuple = (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            meta_sig = ()
+        if meta_sig != self._meta_sig:
+            meta = self._read_meta() if meta_sig else {"gen": 0, "dim": None, "dtype": self.dtype.name}
+            self._meta_sig = meta_sig
+            mismatch = meta.get("dtype") != self.dtype.name
+            if mismatch != self._dtype_mismatch:
+                # 不在这里迁移：调用方可能已持有文件锁（flock 对同一进程的另一个打开文件同样互斥），
+                # 两个存储类型不同的进程也会来回切换代数
+                if mismatch:
+                    logger.warning("Embedding cache dtype changed to %s by another process, caching disabled", meta.get("dtype"))
+                self._dtype_mismatch = mismatch
+            if mismatch:
+                self._gen = -1
+                self._dim = None
+                self._index.clear()
+                self._index_pos = 0
+                self._mm = None
+                return
+            if meta["gen"] != self._gen or meta.get("dim") != self._dim:
+                self._gen = int(meta["gen"])
+                self._dim = meta.get("dim")
+                self._index.clear()
+                self._index_pos = 0
+                self._mm = None
+
+        if self._dtype_mismatch:
+            return
+        try:
+            size = os.path.getsize(self._path("index"))
+        except FileNotFoundError:
+            size = 0
+        if size - self._index_pos >= RECORD_BYTES:
+            try:
+                with open(self._path("index"), "rb") as f:
+                    f.seek(self._index_pos)
+                    data = f.read((size - self._index_pos) // RECORD_BYTES * RECORD_BYTES)
+            except FileNotFoundError:
+                return  # 其他进程刚完成压缩，下次读取时按新的 meta.json 重新加载
+            for i in range(0, len(data), RECORD_BYTES):
+                key = data[i: i + KEY_BYTES]
+                self._index[key] = int.from_bytes(data[i + KEY_BYTES: i + RECORD_BYTES], "little")
+                self._index.move_to_end(key)
+            self._index_pos += len(data)
+
+    def _row_bytes(self) -> int:
+        return (self._dim or 0) * self.dtype.itemsize
+
+    def _matrix(self, need_rows: int) -> Optional[np.memmap]:
+        """只读映射向量文件；行数不足时重新映射（文件只会追加）"""
+        if self._mm is not None and self._mm.shape[0] >= need_rows:
+            return self._mm
+        try:
+            rows = os.path.getsize(self._path("vectors")) // self._row_bytes()
+        except (FileNotFoundError, ZeroDivisionError):
+            return None
+        if rows < need_rows or rows == 0:
+            return None
+        self._mm = np.memmap(self._path("vectors"), dtype=self.dtype, mode="r", shape=(rows, self._dim))
+        return self._mm
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=KEY_BYTES)
+        h.update(self.model_id.encode("utf-8") + b"\0" + normalize_text(text).encode("utf-8"))
+        return h.digest()
+
+    # --- 读写 ---
+
+    def get_many(self, texts: List[str]) -> tuple[Optional[np.ndarray], List[int]]:
+        """
+        返回 (float32 结果矩阵, 未命中的下标)；未命中的行为 0，由调用方计算后填入
+        缓存为空（维度未知）时结果矩阵为 None
+        """
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            self._refresh()
+            rows = [self._index.get(k) for k in keys]
+            found = [r for r in rows if r is not None]
+            mm = self._matrix(max(found) + 1) if found else None
+            if mm is None:
+                rows = [None] * len(keys)
+            if self._dim is None:
+                self.misses += len(keys)
+                LOOKUPS.inc(len(keys), result="miss")
+                return None, list(range(len(keys)))
+            out = np.zeros((len(keys), self._dim), dtype=np.float32)
+            hit_idx = [i for i, r in enumerate(rows) if r is not None]
+            if hit_idx:
+                out[hit_idx] = mm[[rows[i] for i in hit_idx]]
+                for i in hit_idx:
+                    self._index.move_to_end(keys[i])
+        missing = [i for i, r in enumerate(rows) if r is None]
+        self.hits += len(hit_idx)
+        self.misses += len(missing)
+        LOOKUPS.inc(len(hit_idx), result="hit")
+        LOOKUPS.inc(len(missing), result="miss")
+        return out, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(texts) or not len(texts):
+            return
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._dtype_mismatch:
+                return
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+                self._write_meta(self._gen, self._dim)
+                self._refresh()
+            if vectors.shape[1] != self._dim:
+                logger.warning("Embedding dim %d does not match cache dim %d, not caching", vectors.shape[1], self._dim)
+                return
+            new: Dict[bytes, int] = {}
+            for i, t in enumerate(texts):
+                k = self.key(t)
+                if k not in self._index and k not in new:
+                    new[k] = i
+            if not new:
+                return
+            row_bytes = self._row_bytes()
+            with open(self._path("vectors"), "ab") as vf:
+                # 上次写入中断留下的不完整行
+                size = vf.seek(0, os.SEEK_END)
+                if size % row_bytes:
+                    vf.truncate(size - size % row_bytes)
+                first_row = (size - size % row_bytes) // row_bytes
+                vf.write(np.ascontiguousarray(vectors[list(new.values())], dtype=self.dtype).tobytes())
+            # 向量先于索引落盘：读取方看到的索引项一定有对应的向量
+            records = b"".join(k + (first_row + n).to_bytes(8, "little") for n, k in enumerate(new))
+            with open(self._path("index"), "ab") as xf:
+                xf.write(records)
+            self.writes += len(new)
+            self._refresh()
+            size = (first_row + len(new)) * row_bytes
+            CACHE_BYTES.set(size)
+            if self.max_bytes and size > self.max_bytes:
+                self._compact()
+
+    def _compact(self) -> None:
+        """调用方需持有 self._lock 与文件锁"""
+        row_bytes = self._row_bytes()
+        keep_rows = int(self.max_bytes * COMPACT_TO) // row_bytes
+        keep = list(self._index.items())[-keep_rows:] if keep_rows else []
+        mm = self._matrix(max((r for _, r in keep), default=-1) + 1)
+        gen = self._gen + 1
+        with open(self._path("vectors", gen), "wb") as vf, open(self._path("index", gen), "wb") as xf:
+            for start in range(0, len(keep), 4096):
+                part = keep[start: start + 4096]
+                vf.write(np.ascontiguousarray(mm[[r for _, r in part]]).tobytes())
+                xf.write(b"".join(k + (start + n).to_bytes(8, "little") for n, (k, _) in enumerate(part)))
+        old_gen = self._gen
+        self._write_meta(gen, self._dim)
+        for kind in ("vectors", "index"):
+            try:
+                os.remove(self._path(kind, old_gen))
+            except FileNotFoundError:
+                pass
+        self.compactions += 1
+        logger.info("Embedding cache compacted to %d entries (gen %d)", len(keep), gen)
+        self._refresh()
+        CACHE_BYTES.set(len(keep) * row_bytes)
+
+    async def get_or_embed(self, texts: List[str], embed_fn: Callable[[List[str]], Awaitable[np.ndarray]]) -> np.ndarray:
+        """命中的直接读缓存，未命中的（同一请求内去重后）交给 embed_fn，结果按请求顺序返回"""
+        out, missing = await asyncio.to_thread(self.get_many, texts)
+        if not missing:
+            return out
+        first: Dict[bytes, int] = {}
+        for i in missing:
+            first.setdefault(self.key(texts[i]), len(first))
+        miss_texts = [None] * len(first)
+        for i in missing:
+            slot = first[self.key(texts[i])]
+            if miss_texts[slot] is None:
+                miss_texts[slot] = texts[i]
+        vectors = np.asarray(await embed_fn(miss_texts), dtype=np.float32)
+        if out is None:
+            out = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+        for i in missing:
+            out[i] = vectors[first[self.key(texts[i])]]
+        try:
+            await asyncio.to_thread(self.put_many, miss_texts, vectors)
+        except Exception as e:
+            logger.warning("Embedding cache write failed: %s", e)
+        return out
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries = len(self._index)
+        return {
+            "entries": entries,
+            "bytes": entries * self._row_bytes(),
+            "max_bytes": self.max_bytes,
+            "dtype": self.dtype.name,
+            "dtype_mismatch": self._dtype_mismatch,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "writes": self.writes,
+            "compactions": self.compactions,
+        }
+
+
+def create_embedding_cache() -> Optional[EmbeddingCache]:
+    if not ENABLED:
+        return None
+    # 模型标识取 EMBEDDING_MODEL 的末级名称（本地路径与 HF 名称指向同一模型时共用缓存），并区分推理后端
+    return EmbeddingCache(CACHE_DIR, embedding_model_id())
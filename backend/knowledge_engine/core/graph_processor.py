@@ -1,6 +1,12 @@
 import os
 import json
 import networkx as nx
+from typing import Optional
+from common.metrics import Histogram
+from common import tracing
+
+# step: parse（读取 graphml）/ prune（剪枝）/ extract（生成节点与边）
+GRAPH_PROCESS_SECONDS = Histogram("graph_process_seconds", "LightRAG graph post-processing time", ["step"])
 
 class GraphProcessor:
     """
@@ -12,7 +18,8 @@ class GraphProcessor:
         working_dir: str, 
         documents: list, 
         concept: str,
-        chunk_mapping: dict
+        chunk_mapping: dict,
+        previous: Optional[dict] = None
     ) -> dict:
         """
         解析 LightRAG 输出,生成前端所需的 JSON
@@ -22,6 +29,7 @@ class GraphProcessor:
         - documents: 原始文档列表
         - concept: 核心概念
         - chunk_mapping: {chunk_id: {doc_ids: [...], domains: [...]}}
+        - previous: 上次发布的图谱；内容未变化的节点 / 边直接沿用，不再重新解析（变化部分见 delta）
         
         返回: {nodes: [...], edges: [...]}
         """
@@ -31,18 +39,25 @@ class GraphProcessor:
             raise FileNotFoundError(f"未找到图谱文件: {graphml_path}")
         
         # 1. 加载完整图谱
-        G_full = nx.read_graphml(graphml_path)
+        with GRAPH_PROCESS_SECONDS.time(step="parse"), tracing.span("graphml.parse") as sp:
+            G_full = nx.read_graphml(graphml_path)
+            sp.update(nodes=G_full.number_of_nodes(), edges=G_full.number_of_edges())
         print(f"原始图谱: {len(G_full.nodes())} 节点, {len(G_full.edges())} 边")
         
         # 2. 【剪枝】保留与核心概念连通的子图
-        G_pruned = self._prune_graph(G_full, concept)
+        with GRAPH_PROCESS_SECONDS.time(step="prune"), tracing.span("graph.prune") as sp:
+            G_pruned = self._prune_graph(G_full, concept)
+            sp.update(nodes=G_pruned.number_of_nodes(), edges=G_pruned.number_of_edges())
         print(f"剪枝后: {len(G_pruned.nodes())} 节点, {len(G_pruned.edges())} 边")
         
-        # 3. 解析节点（使用剪枝后的图）
-        nodes = self._extract_nodes(G_pruned, concept, chunk_mapping)
-        
-        # 4. 解析边
-        edges = self._extract_edges(G_pruned)
+        with GRAPH_PROCESS_SECONDS.time(step="extract"), tracing.span("graph.extract"):
+            # 3. 解析节点（使用剪枝后的图）
+            prev_nodes = {n["id"]: n for n in previous["nodes"]} if previous else {}
+            nodes = self._extract_nodes(G_pruned, concept, chunk_mapping, prev_nodes)
+            
+            # 4. 解析边
+            prev_edges = {(e["source"], e["target"]): e for e in previous["edges"]} if previous else {}
+            edges = self._extract_edges(G_pruned, prev_edges)
         
         return {
             "concept": concept,
@@ -139,14 +154,23 @@ class GraphProcessor:
         
         return G.subgraph(largest_cc).copy()
     
-    def _extract_nodes(self, G: nx.Graph, concept: str, chunk_mapping: dict) -> list:
-        """提取节点信息"""
+    def _extract_nodes(self, G: nx.Graph, concept: str, chunk_mapping: dict, prev_nodes: dict) -> list:
+        """提取节点信息；来源 chunk 与描述都未变化的节点沿用上次的结果"""
         nodes = []
         
         for node_id, node_data in G.nodes(data=True):
             # 解析 source_id
             source_ids_raw = node_data.get('source_id', '')
             source_chunks = self._parse_source_ids(source_ids_raw)
+            label = node_data.get('entity_name', node_id)
+            description = node_data.get('description', '暂无描述')
+            size = G.degree(node_id) + 1  # 前端可参考的节点大小，=deg+1
+            
+            prev = prev_nodes.get(node_id)
+            if prev and prev["source_chunks"] == source_chunks and prev["label"] == label and prev["description"] == description:
+                # chunk 的溯源是增量维护的，来源不变则领域不变
+                nodes.append(prev if prev["size"] == size else {**prev, "size": size})
+                continue
             
             # 反查领域（支持多领域）
             domains = self._resolve_domains(source_chunks, chunk_mapping)
@@ -154,18 +178,18 @@ class GraphProcessor:
             # 构建节点
             node = {
                 "id": node_id,
-                "label": node_data.get('entity_name', node_id),
-                "description": node_data.get('description', '暂无描述'),
+                "label": label,
+                "description": description,
                 "domains": domains,
                 "source_chunks": source_chunks,
-                "size": G.degree(node_id) + 1  # 前端可参考的节点大小，=deg+1
+                "size": size
             }
             
             nodes.append(node)
         
         return nodes
     
-    def _extract_edges(self, G: nx.Graph) -> list:
+    def _extract_edges(self, G: nx.Graph, prev_edges: dict) -> list:
         """提取边信息"""
         edges = []
         
@@ -176,9 +200,34 @@ class GraphProcessor:
                 "relation": edge_data.get('label', 'related'),
                 "description": edge_data.get('description', '')
             }
-            edges.append(edge)
+            prev = prev_edges.get((source, target))
+            edges.append(prev if prev == edge else edge)
         
         return edges
+
+    @staticmethod
+    def graph_version(working_dir: str) -> Optional[list]:
+        """LightRAG 图谱文件的版本 [mtime, size]，用于判断自上次发布后是否有变化"""
+        try:
+            st = os.stat(os.path.join(working_dir, "graph_chunk_entity_relation.graphml"))
+        except FileNotFoundError:
+            return None
+        return [st.st_mtime, st.st_size]
+
+    @staticmethod
+    def delta(previous: Optional[dict], graph: dict) -> dict:
+        """
+        相对上次发布的图谱新增或变化的节点 / 边；previous 为 None 时全部视为新增
+        （不再出现的节点不处理：Neo4j 中的节点按 id 在各概念间共享，与之前一样不删除）
+        """
+        if not previous:
+            return {"nodes": graph["nodes"], "edges": graph["edges"]}
+        prev_nodes = {n["id"]: n for n in previous["nodes"]}
+        prev_edges = {(e["source"], e["target"]): e for e in previous["edges"]}
+        return {
+            "nodes": [n for n in graph["nodes"] if prev_nodes.get(n["id"]) != n],
+            "edges": [e for e in graph["edges"] if prev_edges.get((e["source"], e["target"])) != e],
+        }
     
     def _parse_source_ids(self, source_ids_raw: str) -> list:
         """解析 source_id 字符串"""
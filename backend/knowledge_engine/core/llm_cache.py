@@ -0,0 +1,105 @@
+"""
+LightRAG LLM 调用的持久化响应缓存（位于 RAGEngine._llm_wrapper 之前）
+
+- 键：hash(模型, 完整 messages（含 system prompt 与历史）, 请求参数)，与概念无关：
+  同一来源文本在另一个概念下重新构建时，实体抽取等调用直接命中，不再请求模型
+  （LightRAG 自带的 llm 缓存按工作目录隔离，跨概念不共享）
+- 存储：./data 下的 SQLite（多进程共享），超出 LLM_CACHE_MAX_BYTES 时按最近访问淘汰
+- 防击穿：相同键的并发调用共享同一次请求
+- 流式请求不缓存
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from common.metrics import Counter
+from common.sqlite_cache import SQLiteCache
+
+logger = logging.getLogger("llm-cache")
+
+ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./data/llm_cache.sqlite3")
+MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+# 0 表示不过期（抽取结果只取决于输入）
+TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "0"))
+
+# result: hit / miss / coalesced
+LOOKUPS = Counter("llm_cache_lookups_total", "LightRAG LLM response cache lookups", ["operation", "result"])
+
+
+class LLMResponseCache:
+    def __init__(self, store: Optional[SQLiteCache]) -> None:
+        self.store = store
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], params: Dict[str, Any]) -> str:
+        raw = json.dumps([model, messages, params], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_call(self, key: str, operation: str, call: Callable[[], Awaitable[str]]) -> str:
+        if self.store is None:
+            return await call()
+
+        cached = await asyncio.to_thread(self.store.get, key)
+        if cached is not None:
+            LOOKUPS.inc(operation=operation, result="hit")
+            return cached
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            LOOKUPS.inc(operation=operation, result="coalesced")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # 发起方被取消而自身未被取消时，自己去请求
+                task = asyncio.current_task()
+                if not pending.cancelled() or (task is not None and task.cancelling()):
+                    raise
+                return await call()
+
+        LOOKUPS.inc(operation=operation, result="miss")
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            content = await call()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            fut.exception()
+            raise
+        else:
+            fut.set_result(content)
+            # 空响应多半是异常情况（内容过滤、截断），不写入缓存
+            if content:
+                try:
+                    await asyncio.to_thread(self.store.set, key, content)
+                except Exception as e:
+                    logger.warning("Failed to write LLM cache: %s", e)
+            return content
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        if self.store is None:
+            return {"enabled": False}
+        return {"enabled": True, "coalesced": self.coalesced, "inflight": len(self._inflight), **self.store.stats()}
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+
+def create_llm_cache() -> LLMResponseCache:
+    store = SQLiteCache(CACHE_PATH, ttl_s=TTL_S, max_bytes=MAX_BYTES) if ENABLED else None
+    return LLMResponseCache(store)
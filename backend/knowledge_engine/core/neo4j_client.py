@@ -3,11 +3,14 @@ import logging
 from typing import List, Dict, Any
 from neo4j import AsyncGraphDatabase
 from dotenv import load_dotenv
+from common.metrics import Histogram
 
 load_dotenv()
 
 logger = logging.getLogger("neo4j-client")
 
+WRITE_SECONDS = Histogram("neo4j_write_seconds", "Neo4j batch write time", ["kind"])
+
 class Neo4jClient:
     def __init__(self):
         self.uri = os.getenv("NEO4J_URI", "bolt://localhost:7687")
@@ -67,7 +70,10 @@ class Neo4jClient:
             """
             
             try:
-                await session.run(node_query, nodes=nodes)
+                # consume() 等待服务端执行完成，耗时才包含实际写入
+                with WRITE_SECONDS.time(kind="nodes"):
+                    result = await session.run(node_query, nodes=nodes)
+                    await result.consume()
                 logger.info(f"Saved {len(nodes)} nodes to Neo4j for '{concept}'")
             except Exception as e:
                 logger.error(f"Error saving nodes: {e}")
@@ -87,7 +93,9 @@ class Neo4jClient:
             """
             
             try:
-                await session.run(edge_query, edges=edges, concept=concept)
+                with WRITE_SECONDS.time(kind="edges"):
+                    result = await session.run(edge_query, edges=edges, concept=concept)
+                    await result.consume()
                 logger.info(f"Saved {len(edges)} edges to Neo4j for '{concept}'")
             except Exception as e:
                 logger.error(f"Error saving edges: {e}")
@@ -0,0 +1,146 @@
+"""
+ONNX Runtime embedding 后端（EMBEDDING_BACKEND=onnx）
+
+同一个 bge 模型导出为 ONNX，并做动态 int8 量化（权重 int8、激活运行时量化），
+CPU 上比 fp32 PyTorch 推理更快，启动时也不需要加载 torch。输出与 SentenceTransformer.encode 一致：
+[CLS] 向量 + L2 归一化。精度与速度的取舍用 benchmarks/bench_embedding_backends.py 对比。
+需要安装可选依赖：uv sync --extra onnx（onnxruntime、onnx，见 pyproject.toml）。
+
+- EMBEDDING_ONNX_DIR：导出目录（model.onnx、model.int8.onnx 与分词器文件）
+- EMBEDDING_ONNX_QUANTIZED：true 使用 int8 模型，false 使用 fp32 ONNX 模型
+- EMBEDDING_ONNX_THREADS：intra-op 线程数，0 为本进程可用的 CPU 数；
+  多个进程各自加载模型时（inline 模式 + 多 uvicorn worker）应按进程数分摊
+
+目录不存在时首次加载会自动导出（需要 torch / transformers，只做一次），也可手动导出（在 backend 目录下）：
+    python -m knowledge_engine.core.onnx_embedding --out ./bge-large-zh-v1.5-onnx
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from typing import Any, List
+
+import numpy as np
+
+logger = logging.getLogger("embedding-onnx")
+
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "./bge-large-zh-v1.5-onnx")
+ONNX_QUANTIZED = os.getenv("EMBEDDING_ONNX_QUANTIZED", "true").strip().lower() in ("1", "true", "yes")
+ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+MAX_LENGTH = int(os.getenv("EMBEDDING_MAX_LENGTH", "512"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def export_onnx(source: str, out_dir: str, quantize: bool = True) -> None:
+    """把 HF / 本地模型导出为 ONNX（输出 last_hidden_state），并生成动态 int8 量化版本"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(source)
+    model = AutoModel.from_pretrained(source).eval()
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, inner: Any) -> None:
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).last_hidden_state
+
+    sample = tokenizer(["导出示例文本", "export sample"], padding=True, return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model),
+            tuple(sample[n] for n in names),
+            fp32_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{n: {0: "batch", 1: "seq"} for n in names}, "last_hidden_state": {0: "batch", 1: "seq"}},
+            opset_version=17,
+            do_constant_folding=True,
+        )
+    tokenizer.save_pretrained(out_dir)
+    logger.info("Exported ONNX model to %s", fp32_path)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(out_dir, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8, per_channel=True)
+        logger.info("Quantized ONNX model to %s", int8_path)
+
+
+class OnnxEmbeddingModel:
+    """与 SentenceTransformer.encode 接口一致的 ONNX Runtime 推理封装"""
+
+    def __init__(self, model_dir: str = ONNX_DIR, quantized: bool = ONNX_QUANTIZED, threads: int = ONNX_THREADS, max_length: int = MAX_LENGTH) -> None:
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.intra_op_num_threads = threads or available_cpus()
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+        self.path = path
+        self.threads = opts.intra_op_num_threads
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True, **_: Any) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # 长度相近的文本放在同一批，减少 padding 计算
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        results: List[np.ndarray] = [None] * len(texts)  # type: ignore[list-item]
+        for start in range(0, len(texts), batch_size):
+            idx = order[start: start + batch_size]
+            enc = self.tokenizer(
+                [texts[i] for i in idx], padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            vecs = hidden[:, 0]  # bge 使用 [CLS] 向量作为句向量
+            if normalize_embeddings:
+                vecs = vecs / np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+            for j, i in enumerate(idx):
+                results[i] = vecs[j]
+        return np.stack(results).astype(np.float32)
+
+
+def load_onnx_model(source: str, model_dir: str = ONNX_DIR, quantized: bool = ONNX_QUANTIZED) -> OnnxEmbeddingModel:
+    path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+    if not os.path.exists(path):
+        logger.warning("ONNX model %s not found, exporting from %s (one-off, requires torch)", path, source)
+        export_onnx(source, model_dir, quantize=quantized)
+    model = OnnxEmbeddingModel(model_dir, quantized)
+    logger.info("Loaded ONNX embedding model %s (threads=%d)", model.path, model.threads)
+    return model
+
+
+if __name__ == "__main__":
+    from .embedding import resolve_model_source
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (+ dynamic int8 quantization)")
+    parser.add_argument("--model", default=None, help="本地模型目录或 HF 名称，默认同 EMBEDDING_MODEL")
+    parser.add_argument("--out", default=ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+    export_onnx(args.model or resolve_model_source(), args.out, quantize=not args.no_quantize)
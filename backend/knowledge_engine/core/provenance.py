@@ -0,0 +1,175 @@
+"""
+chunk 溯源索引：LightRAG chunk → 原始文档（Search Agent 的 chunk）→ 领域，
+以及反向的 文档 → chunk → 图谱节点（"这个节点从哪来"）
+
+- 文档以 [DOC_ID: ...] / [领域: ...] 文档头插入 LightRAG，文档头只出现在每篇文档的首个 chunk 中；
+  其余 chunk 通过 full_doc_id 关联到所属的 LightRAG 文档，再由文档映射到原始文档与领域
+- LightRAG 文档 id 由插入文本决定（RAGEngine.lightrag_doc_id），构建时直接由本次的文档得到；
+  索引中没有的（如旧的工作目录）才读取 kv_store_full_docs.json 并解析其文档头
+- 索引记录 kv_store_text_chunks.json 的 (mtime, size)：未变化时不重新读取，变化时只解析新增的 chunk
+- 持久化在 data/provenance/{concept}.json（经 JSONStorage 读写与缓存），反向查找表按索引版本缓存
+- 同时记录最近一次发布的图谱状态，用于增量发布
+"""
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .storage import JSONStorage, storage
+
+logger = logging.getLogger("provenance")
+
+# 一次扫描同时取出文档 id 与领域标签
+TAG_RE = re.compile(r"\[DOC_ID:\s*([^\]]+?)\s*\]|\[领域:\s*([^\]]*?)\s*\]")
+# 文档头位于文本开头，解析 full_docs 时只扫描前面这些字符
+HEADER_CHARS = 512
+
+
+def parse_tags(text: str) -> Tuple[List[str], List[str]]:
+    """返回 (文档 id 列表, 领域列表)"""
+    doc_ids: List[str] = []
+    domains: List[str] = []
+    for m in TAG_RE.finditer(text):
+        if m.group(1) is not None:
+            doc_ids.append(m.group(1))
+        elif m.group(2):
+            domains.append(m.group(2))
+    return doc_ids, domains
+
+
+class ProvenanceIndex:
+    """方法均为同步阻塞调用，异步接口中请通过 asyncio.to_thread 调用"""
+
+    def __init__(self, store: JSONStorage):
+        self.storage = store
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, concept: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(concept, threading.Lock())
+
+    def update(self, concept: str, working_dir: str, documents: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+        """
+        增量更新索引，返回 {chunk_id: {doc_ids: [...], domains: [...]}}（GraphProcessor 的 chunk_mapping）
+        documents: 本次构建插入的 {LightRAG 文档 id: 文档}
+        """
+        chunks_path = os.path.join(working_dir, "kv_store_text_chunks.json")
+        with self._lock(concept):
+            index = self.storage.get_provenance(concept)
+            try:
+                st = os.stat(chunks_path)
+            except FileNotFoundError:
+                return index.get("chunks", {})
+            version = [st.st_mtime, st.st_size]
+            if index.get("source") == version:
+                return index["chunks"]
+            try:
+                with open(chunks_path, "r", encoding="utf-8") as f:
+                    raw: Dict[str, dict] = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Unreadable {chunks_path}, keeping previous provenance for '{concept}'")
+                return index.get("chunks", {})
+
+            # 缓存中的 dict 是共享的，合并到副本上
+            docs = dict(index.get("docs", {}))
+            for lightrag_id, doc in (documents or {}).items():
+                docs.setdefault(lightrag_id, {"doc_ids": [doc["doc_id"]], "domains": [doc["domain"]]})
+            # LightRAG 中已删除的 chunk 一并移除
+            chunks = {cid: info for cid, info in index.get("chunks", {}).items() if cid in raw}
+            new = [cid for cid in raw if cid not in chunks]
+            missing = {raw[cid].get("full_doc_id") for cid in new} - docs.keys() - {None}
+            if missing:
+                docs.update(self._read_doc_headers(working_dir, missing))
+
+            for cid in new:
+                data = raw[cid]
+                doc_ids, domains = parse_tags(data.get("content", ""))
+                source = docs.get(data.get("full_doc_id"))
+                if source:
+                    doc_ids += source["doc_ids"]
+                    domains += source["domains"]
+                # 无法溯源的 chunk 也记录（空列表），下次不再重复解析
+                chunks[cid] = {"doc_ids": sorted(set(doc_ids)), "domains": sorted(set(domains))}
+
+            self.storage.save_provenance(concept, {**index, "source": version, "docs": docs, "chunks": chunks})
+            logger.info(f"Provenance for '{concept}': {len(new)} new chunks indexed ({len(chunks)} total)")
+            return chunks
+
+    @staticmethod
+    def _read_doc_headers(working_dir: str, lightrag_ids: set) -> Dict[str, dict]:
+        path = os.path.join(working_dir, "kv_store_full_docs.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                full_docs = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        headers = {}
+        for lightrag_id in lightrag_ids:
+            record = full_docs.get(lightrag_id)
+            if record:
+                doc_ids, domains = parse_tags(record.get("content", "")[:HEADER_CHARS])
+                headers[lightrag_id] = {"doc_ids": doc_ids, "domains": domains}
+        return headers
+
+    def record_published(self, concept: str, nodes: List[dict], graph_version: Optional[list], neo4j_synced: bool) -> None:
+        """
+        记录已发布的图谱：各节点的来源 chunk（用于 文档 → 节点 的反向查找），
+        以及对应的 LightRAG 图谱文件版本与 Neo4j 是否同步成功（下次发布据此跳过或只同步变化部分）
+        """
+        with self._lock(concept):
+            index = self.storage.get_provenance(concept)
+            self.storage.save_provenance(concept, {
+                **index,
+                "node_chunks": {n["id"]: n["source_chunks"] for n in nodes},
+                "published": {"graph_version": graph_version, "neo4j_synced": neo4j_synced},
+            })
+
+    def published(self, concept: str) -> dict:
+        return self.storage.get_provenance(concept).get("published", {})
+
+    @staticmethod
+    def _reverse(index: dict) -> dict:
+        doc_chunks: Dict[str, List[str]] = defaultdict(list)
+        chunk_nodes: Dict[str, List[str]] = defaultdict(list)
+        for cid, info in index.get("chunks", {}).items():
+            for doc_id in info["doc_ids"]:
+                doc_chunks[doc_id].append(cid)
+        for node_id, chunk_ids in index.get("node_chunks", {}).items():
+            for cid in chunk_ids:
+                chunk_nodes[cid].append(node_id)
+        return {"doc_chunks": dict(doc_chunks), "chunk_nodes": dict(chunk_nodes)}
+
+    def node_sources(self, concept: str, node_id: str) -> Optional[dict]:
+        """节点 → 来源 chunk → 原始文档 / 领域"""
+        index = self.storage.get_provenance(concept)
+        chunk_ids = index.get("node_chunks", {}).get(node_id)
+        if chunk_ids is None:
+            return None
+        chunks = index.get("chunks", {})
+        items = [{"chunk_id": cid, **chunks.get(cid, {"doc_ids": [], "domains": []})} for cid in chunk_ids]
+        return {
+            "concept": concept,
+            "node_id": node_id,
+            "chunks": items,
+            "doc_ids": sorted({d for item in items for d in item["doc_ids"]}),
+        }
+
+    def document_targets(self, concept: str, doc_id: str) -> Optional[dict]:
+        """原始文档 → LightRAG chunk → 图谱节点"""
+        reverse = self.storage.get_provenance_view(concept, self._reverse)
+        chunk_ids = reverse["doc_chunks"].get(doc_id) if reverse else None
+        if not chunk_ids:
+            return None
+        return {
+            "concept": concept,
+            "doc_id": doc_id,
+            "chunk_ids": chunk_ids,
+            "nodes": sorted({n for cid in chunk_ids for n in reverse["chunk_nodes"].get(cid, [])}),
+        }
+
+
+provenance_index = ProvenanceIndex(storage)
@@ -1,71 +1,91 @@
 import os
-import json
+import time
+import asyncio
 import numpy as np
-from typing import Dict
+from typing import Callable, Dict, List, Optional
 from dotenv import load_dotenv
 from lightrag import LightRAG, QueryParam
-from lightrag.utils import EmbeddingFunc
-from sentence_transformers import SentenceTransformer
+from lightrag.utils import EmbeddingFunc, compute_mdhash_id
 from openai import AsyncOpenAI
+from common.metrics import LLM_REQUEST_SECONDS, Counter, Histogram, record_llm_usage
+from common import tracing
+from .embedding import create_embedder
+from .embedding_cache import create_embedding_cache
+from .rag_pool import RAGPool
+from .provenance import provenance_index
+from .llm_cache import create_llm_cache
 
 load_dotenv()
 
-# 如果没有设置，默认使用 huggingface 镜像
-os.environ.setdefault('HF_ENDPOINT', 'https://hf-mirror.com')
+EMBED_BATCH_SIZE = Histogram("embedding_batch_size", "Texts per embedding call", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+EMBED_SECONDS = Histogram("embedding_batch_seconds", "Embedding request latency (including micro-batch wait)")
+EMBED_TEXTS = Counter("embedding_texts_total", "Texts embedded (rate() gives throughput)")
+INSERT_SECONDS = Histogram("lightrag_insert_seconds", "LightRAG time per document (from its window start to processed/failed)", ["outcome"])
+
+# 每次 ainsert 交给 LightRAG 的文档数；窗口内最多 MAX_PARALLEL_INSERT 篇并行抽取（1 等价于逐篇插入）
+INSERT_WINDOW = max(1, int(os.getenv("LIGHTRAG_INSERT_WINDOW", "8")))
+MAX_PARALLEL_INSERT = int(os.getenv("MAX_PARALLEL_INSERT", "4"))
+# 插入期间轮询文档处理状态的间隔，用于逐篇上报进度
+INSERT_POLL_S = 1.0
+
+# on_progress(文档, 状态 processed/failed, 已完成数, 总数)
+InsertProgressFn = Callable[[dict, str, int, int], None]
 
 class RAGEngine:
     def __init__(self):
         self.base_dir = "./lightrag_workdir"
         os.makedirs(self.base_dir, exist_ok=True)
-        self.rag_instances: Dict[str, LightRAG] = {}
+        # 每个概念的 LightRAG 实例只初始化一次存储，超出预算时按 LRU 落盘释放（RAG_POOL_MAX_*）
+        self.rag_pool = RAGPool(self._create_rag_instance)
+        self.insert_window = INSERT_WINDOW
+        self.max_parallel_insert = MAX_PARALLEL_INSERT
         
         self.api_key = os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
         self.base_url = os.getenv("LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         self.llm_model = os.getenv("LLM_MODEL") or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        # 所有 LightRAG 调用共用一个 client（连接池），构建期间不再为每次调用重新建立连接
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        # 跨概念共享的持久化响应缓存：重复来源的抽取调用不再请求模型（LLM_CACHE_ENABLED）
+        self.llm_cache = create_llm_cache()
         
-        # Embedding 模型加载
-        model_path = os.getenv("EMBEDDING_MODEL", "./bge-large-zh-v1.5")
-        try:
-            if os.path.exists(model_path) and os.path.exists(os.path.join(model_path, "config.json")):
-                self.embedding_model = SentenceTransformer(model_path, device='cpu')
-            else:
-                print(f"Loading embedding model from HF: BAAI/bge-large-zh-v1.5")
-                self.embedding_model = SentenceTransformer('BAAI/bge-large-zh-v1.5', device='cpu')
-        except Exception as e:
-            print(f"Warning: Embedding load failed ({e}), using fallback.")
-            self.embedding_model = SentenceTransformer('BAAI/bge-large-zh-v1.5', device='cpu')
+        # Embedding：inline 模式在本进程加载模型，worker 模式由独立进程加载（EMBEDDING_MODE）
+        self.embedder = create_embedder()
+        # 内容寻址的 embedding 磁盘缓存，只有未命中的文本才送入模型（EMBEDDING_CACHE_ENABLED）
+        self.embedding_cache = create_embedding_cache()
     
-    def get_rag_instance(self, concept: str) -> LightRAG:
-        if concept not in self.rag_instances:
-            working_dir = os.path.join(self.base_dir, concept)
-            os.makedirs(working_dir, exist_ok=True)
-            self.rag_instances[concept] = LightRAG(
-                working_dir=working_dir,
-                llm_model_func=self._llm_wrapper,
-                embedding_func=EmbeddingFunc(
-                    embedding_dim=1024,
-                    max_token_size=512,
-                    func=self._embedding_wrapper
-                )
+    def _create_rag_instance(self, concept: str) -> LightRAG:
+        working_dir = os.path.join(self.base_dir, concept)
+        os.makedirs(working_dir, exist_ok=True)
+        return LightRAG(
+            working_dir=working_dir,
+            max_parallel_insert=self.max_parallel_insert,
+            llm_model_func=self._llm_wrapper,
+            embedding_func=EmbeddingFunc(
+                embedding_dim=1024,
+                max_token_size=512,
+                func=self._embedding_wrapper
             )
-        return self.rag_instances[concept]
+        )
     
     async def query(self, concept: str, question: str, param: QueryParam = None) -> str:
         if param is None:
             param = QueryParam(mode="hybrid")
         
-        rag = self.get_rag_instance(concept)
-        #  显式初始化存储
-        await rag.initialize_storages()
-        
-        return await rag.aquery(question, param=param)
+        # 存储只在实例首次打开时初始化
+        async with self.rag_pool.lease(concept) as rag:
+            return await rag.aquery(question, param=param)
+
+    async def close(self) -> None:
+        await self.rag_pool.close()
+        await self.client.close()
+        self.llm_cache.close()
 
     async def _llm_wrapper(self, prompt, system_prompt=None, history_messages=[], **kwargs):
         """LLM 调用封装：包含 Prompt 注入和参数过滤"""
         
         # 1. 清理 LightRAG 传入的特殊参数
         kwargs.pop("hashing_kv", None)
-        kwargs.pop("keyword_extraction", None)
+        keyword_extraction = kwargs.pop("keyword_extraction", False)
         
         # 2. 过滤掉 OpenAI API 不支持的参数
         allowed_params = {
@@ -103,68 +123,140 @@ class RAGEngine:
         # 将指令附加到 Prompt 后
         prompt = prompt + instruction
         
-        # 4. 创建 Client (复用 __init__ 中初始化的配置)
-        client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
-        
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.extend(history_messages)
         messages.append({"role": "user", "content": prompt})
         
-        # 5. 发起请求
-        response = await client.chat.completions.create(
-            model=self.llm_model,
-            messages=messages,
-            **kwargs
-        )
+        # 4. 发起请求（先查响应缓存；流式请求不缓存）
+        operation = "keyword_extraction" if keyword_extraction else "generate"
+        if kwargs.get("stream"):
+            return await self._chat(messages, operation, kwargs)
+        key = self.llm_cache.make_key(self.llm_model, messages, kwargs)
+        return await self.llm_cache.get_or_call(key, operation, lambda: self._chat(messages, operation, kwargs))
+
+    async def _chat(self, messages: list, operation: str, kwargs: dict):
+        t0 = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.llm_model,
+                messages=messages,
+                **kwargs
+            )
+            outcome = "ok"
+        finally:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - t0, component="lightrag", operation=operation, outcome=outcome)
+        record_llm_usage("lightrag", operation, response.usage)
         return response.choices[0].message.content
     
     async def _embedding_wrapper(self, texts: list) -> np.ndarray:
-        return self.embedding_model.encode(texts, normalize_embeddings=True)
+        EMBED_BATCH_SIZE.observe(len(texts))
+        EMBED_TEXTS.inc(len(texts))
+        with EMBED_SECONDS.time():
+            if self.embedding_cache is not None:
+                return await self.embedding_cache.get_or_embed(texts, self.embedder.embed)
+            return await self.embedder.embed(texts)
     
-    async def build_graph(self, concept: str, documents: list) -> tuple[str, dict]:
-        rag = self.get_rag_instance(concept)
+    async def build_graph(self, concept: str, documents: list, on_progress: Optional[InsertProgressFn] = None) -> tuple[str, dict]:
+        await self.insert_documents(concept, documents, on_progress)
+        return await asyncio.to_thread(self.chunk_mapping, concept, documents)
+
+    async def insert_documents(self, concept: str, documents: list, on_progress: Optional[InsertProgressFn] = None) -> str:
+        """
+        把文档插入 LightRAG（可多次调用做增量插入），返回工作目录
+        每 LIGHTRAG_INSERT_WINDOW 篇一起交给 LightRAG：后一篇的抽取不必等前一篇合并完成；
+        on_progress 在每篇文档处理完成（或已处理过而跳过，状态 skipped）时调用
+        """
         working_dir = os.path.join(self.base_dir, concept)
         
-        # 初始化存储
-        await rag.initialize_storages()
-        
-        print(f"Inserting {len(documents)} docs for '{concept}'...")
-        for doc in documents:
-            text = f"[DOC_ID: {doc['doc_id']}]\n[领域: {doc['domain']}]\n{doc['content']}"
-            await rag.ainsert(text)
+        done = 0
+
+        def on_done(doc: dict, status: str) -> None:
+            nonlocal done
+            done += 1
+            if on_progress is not None:
+                on_progress(doc, status, done, len(documents))
+
+        async with self.rag_pool.lease(concept) as rag:
+            # 已处理过的文档（chunk id 由内容决定）不再交给 LightRAG，重复构建只处理新增部分
+            ids = [self.lightrag_doc_id(doc) for doc in documents]
+            statuses = await self._doc_statuses(rag, ids)
+            new_docs = []
+            for doc, doc_id in zip(documents, ids):
+                if statuses.get(doc_id) == "processed":
+                    on_done(doc, "skipped")
+                else:
+                    new_docs.append(doc)
+            print(f"Inserting {len(new_docs)} docs for '{concept}' ({len(documents) - len(new_docs)} already processed)...")
+            for start in range(0, len(new_docs), self.insert_window):
+                await self._insert_window(rag, new_docs[start: start + self.insert_window], on_done)
             
-        return working_dir, self._build_chunk_mapping(working_dir, documents)
-    
-    def _build_chunk_mapping(self, working_dir: str, documents: list) -> dict:
-        chunk_json_path = os.path.join(working_dir, "kv_store_text_chunks.json")
-        if not os.path.exists(chunk_json_path): return {}
-        
+        return working_dir
+
+    async def _insert_window(self, rag: LightRAG, documents: List[dict], on_done: Callable[[dict, str], None]) -> None:
+        """插入一个窗口的文档，每篇处理完成时调用 on_done(文档, 状态)"""
+        texts = [self._document_text(doc) for doc in documents]
+        ids = [compute_mdhash_id(text, prefix="doc-") for text in texts]
+        pending = dict(zip(ids, documents))
+        # 之前失败过的文档会被重新处理，只有状态变化后才算本次的结果
+        before = await self._doc_statuses(rag, ids)
+        t0 = time.perf_counter()
+
+        def finish(doc_id: str, status: str) -> None:
+            INSERT_SECONDS.observe(time.perf_counter() - t0, outcome="ok" if status == "processed" else "error")
+            on_done(pending.pop(doc_id), status)
+
+        # LLM / embedding 调用不单独记 span：LightRAG 在自己的常驻 worker 任务中执行它们，
+        # 这些任务继承的是首个调用者的上下文，记录下来会挂到错误的任务上
+        with tracing.span("lightrag.ainsert", documents=len(texts), chars=sum(map(len, texts))):
+            task = asyncio.create_task(rag.ainsert(texts, ids=ids))
+            try:
+                while True:
+                    finished, _ = await asyncio.wait({task}, timeout=INSERT_POLL_S)
+                    if pending:
+                        for doc_id, status in (await self._doc_statuses(rag, list(pending))).items():
+                            if status == "processed" or (status == "failed" and before.get(doc_id) != "failed"):
+                                finish(doc_id, status)
+                    if finished:
+                        break
+                task.result()
+            finally:
+                if not task.done():
+                    task.cancel()
+        # 窗口已结束仍未确认的（状态存储不可读、再次失败等）按最终状态上报
+        final = await self._doc_statuses(rag, list(pending)) if pending else {}
+        for doc_id in list(pending):
+            finish(doc_id, final.get(doc_id, "processed"))
+
+    @staticmethod
+    async def _doc_statuses(rag: LightRAG, ids: List[str]) -> Dict[str, str]:
         try:
-            with open(chunk_json_path, 'r', encoding='utf-8') as f:
-                chunks = json.load(f)
+            records = await rag.doc_status.get_by_ids(ids)
         except Exception:
             return {}
-            
-        doc_map = {d['doc_id']: d['domain'] for d in documents}
-        mapping = {}
-        for cid, cdata in chunks.items():
-            content = cdata.get('content', '')
-            found = set()
-            for did in doc_map:
-                if f"[DOC_ID: {did}]" in content: found.add(did)
-            if not found:
-                 for doc in documents:
-                    clean = content.replace('[DOC_ID:', '').replace('[领域:', '')
-                    if clean[:50] in doc['content']: 
-                        found.add(doc['doc_id']); break
-            
-            if found:
-                mapping[cid] = {
-                    'doc_ids': list(found), 
-                    'domains': list(set(doc_map[d] for d in found))
-                }
-        return mapping
+        statuses = {}
+        for doc_id, record in zip(ids, records):
+            status = record.get("status") if isinstance(record, dict) else getattr(record, "status", None)
+            if status is not None:
+                statuses[doc_id] = str(getattr(status, "value", status))
+        return statuses
+
+    @staticmethod
+    def _document_text(doc: dict) -> str:
+        # 先按 LightRAG 的规则清理文本，文档 id 与它自己生成的一致（已插入过的文档仍会被去重）
+        return f"[DOC_ID: {doc['doc_id']}]\n[领域: {doc['domain']}]\n{doc['content']}".strip().replace("\x00", "")
+
+    @classmethod
+    def lightrag_doc_id(cls, doc: dict) -> str:
+        """文档插入 LightRAG 后的文档 id（kv_store_full_docs / chunk 的 full_doc_id）"""
+        return compute_mdhash_id(cls._document_text(doc), prefix="doc-")
+
+    def chunk_mapping(self, concept: str, documents: list) -> tuple[str, dict]:
+        """返回 (工作目录, chunk 到文档/领域的映射)；增量更新溯源索引，阻塞调用"""
+        working_dir = os.path.join(self.base_dir, concept)
+        documents_by_id = {self.lightrag_doc_id(doc): doc for doc in documents}
+        return working_dir, provenance_index.update(concept, working_dir, documents_by_id)
 
 rag_engine = RAGEngine()
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+LightRAG 实例池（按概念，LRU 淘汰）
+
+每个 LightRAG 实例在 initialize_storages 后把该概念的 KV 存储、向量库与图整体载入内存，
+不淘汰的话进程内存随概念数增长。池内实例只初始化一次存储，之后的 query / insert 直接复用；
+超出 RAG_POOL_MAX_INSTANCES 或 RAG_POOL_MAX_BYTES 时，对最久未用且空闲的实例执行
+finalize_storages（落盘并释放）后移出，下次使用时再按需重新打开。
+
+- 内存按工作目录中存储文件的总大小估算（JSON KV、nano-vectordb、graphml 都整文件载入），
+  每次使用结束后重新统计（插入后会变大）
+- 正在被 query / 构建使用的实例不会被淘汰；全部在用时暂时允许超出预算
+- 最近使用的实例即使单独超出 RAG_POOL_MAX_BYTES 也保留，避免每次使用后都被关闭
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict
+
+from common import tracing
+from common.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger("rag-pool")
+
+MAX_INSTANCES = int(os.getenv("RAG_POOL_MAX_INSTANCES", "8"))
+# 0 表示不按内存限制
+MAX_BYTES = int(os.getenv("RAG_POOL_MAX_BYTES", "0"))
+
+INIT_SECONDS = Histogram("lightrag_storage_init_seconds", "LightRAG initialize_storages time per instance open")
+EVICTIONS = Counter("lightrag_pool_evictions_total", "LightRAG instances finalized and evicted from the pool")
+POOL_INSTANCES = Gauge("lightrag_pool_instances", "LightRAG instances with open storages")
+POOL_BYTES = Gauge("lightrag_pool_bytes", "Estimated memory of open LightRAG instances (storage file size)")
+
+
+def storage_bytes(working_dir: str) -> int:
+    total = 0
+    try:
+        with os.scandir(working_dir) as it:
+            for e in it:
+                if e.is_file():
+                    total += e.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+class _Entry:
+    __slots__ = ("rag", "working_dir", "size", "leases")
+
+    def __init__(self, rag: Any, working_dir: str) -> None:
+        self.rag = rag
+        self.working_dir = working_dir
+        self.size = storage_bytes(working_dir)
+        self.leases = 0
+
+
+class RAGPool:
+    def __init__(self, factory: Callable[[str], Any], max_instances: int = MAX_INSTANCES, max_bytes: int = MAX_BYTES) -> None:
+        # factory(concept) 创建未初始化的 LightRAG 实例
+        self.factory = factory
+        self.max_instances = max(1, max_instances)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        # 同一概念的打开 / 关闭串行：并发的首次使用只初始化一次，关闭未完成前不会重新打开
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.inits = 0
+        self.init_seconds = 0.0
+        self.evictions = 0
+
+    @asynccontextmanager
+    async def lease(self, concept: str) -> AsyncIterator[Any]:
+        """取得已初始化存储的实例；使用期间不会被淘汰"""
+        entry = await self._open(concept)
+        try:
+            yield entry.rag
+        finally:
+            entry.leases -= 1
+            entry.size = storage_bytes(entry.working_dir)
+            await self._evict()
+
+    async def _open(self, concept: str) -> _Entry:
+        entry = self._entries.get(concept)
+        if entry is None:
+            async with self._locks.setdefault(concept, asyncio.Lock()):
+                entry = self._entries.get(concept)
+                if entry is None:
+                    rag = self.factory(concept)
+                    t0 = time.perf_counter()
+                    with tracing.span("lightrag.initialize_storages", concept=concept):
+                        await rag.initialize_storages()
+                    elapsed = time.perf_counter() - t0
+                    INIT_SECONDS.observe(elapsed)
+                    self.inits += 1
+                    self.init_seconds += elapsed
+                    entry = _Entry(rag, rag.working_dir)
+                    self._entries[concept] = entry
+                    logger.info("Opened LightRAG storages for '%s' in %.2fs (%d bytes)", concept, elapsed, entry.size)
+        # 从取到 entry 到增加引用之间没有 await，淘汰不会插进来
+        entry.leases += 1
+        self._entries.move_to_end(concept)
+        self._update_gauges()
+        return entry
+
+    def _over_budget(self) -> bool:
+        if len(self._entries) > self.max_instances:
+            return True
+        return self.max_bytes > 0 and len(self._entries) > 1 and self.total_bytes > self.max_bytes
+
+    async def _evict(self) -> None:
+        while self._over_budget():
+            # 只保留最近使用的那个时不再按内存淘汰（见 _over_budget）
+            victim = next((c for c, e in list(self._entries.items())[:-1] if e.leases == 0), None)
+            if victim is None:
+                break
+            entry = self._entries.pop(victim)
+            # 条目在字典中时没有人持有该概念的锁，这里获取不会挂起
+            async with self._locks[victim]:
+                await self._finalize(victim, entry)
+            self.evictions += 1
+            EVICTIONS.inc()
+            self._update_gauges()
+
+    async def _finalize(self, concept: str, entry: _Entry) -> None:
+        try:
+            with tracing.span("lightrag.finalize_storages", concept=concept):
+                await entry.rag.finalize_storages()
+            logger.info("Evicted LightRAG instance '%s' (%d bytes)", concept, entry.size)
+        except Exception as e:
+            logger.error(f"finalize_storages failed for '{concept}': {e}")
+
+    async def close(self) -> None:
+        """关闭时落盘全部实例"""
+        while self._entries:
+            concept, entry = self._entries.popitem(last=False)
+            async with self._locks[concept]:
+                await self._finalize(concept, entry)
+        self._update_gauges()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(e.size for e in self._entries.values())
+
+    def _update_gauges(self) -> None:
+        POOL_INSTANCES.set(len(self._entries))
+        POOL_BYTES.set(self.total_bytes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instances": len(self._entries),
+            "in_use": sum(1 for e in self._entries.values() if e.leases),
+            "bytes": self.total_bytes,
+            "max_instances": self.max_instances,
+            "max_bytes": self.max_bytes,
+            "concepts": list(self._entries),
+            "inits": self.inits,
+            "init_seconds_total": round(self.init_seconds, 3),
+            "init_seconds_avg": round(self.init_seconds / self.inits, 3) if self.inits else 0.0,
+            "evictions": self.evictions,
+        }
@@ -1,15 +1,37 @@
 import os
 import json
-from typing import Dict, List
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
 
 # 数据存储在 backend/data 目录下
 DATA_DIR = "./data"
 GRAPH_DIR = os.path.join(DATA_DIR, "graphs")
+# 每个概念的 chunk → 文档 / 领域 / 节点 溯源索引
+PROVENANCE_DIR = os.path.join(DATA_DIR, "provenance")
+# 读缓存中最多保留的图谱数（LRU）
+GRAPH_CACHE_MAX_ENTRIES = int(os.getenv("GRAPH_CACHE_MAX_ENTRIES", "32"))
 
 class JSONStorage:
+    """
+    JSON 文件存储，带进程内读缓存
+
+    读取结果按 (文件 mtime, size) 缓存：本进程写入时直接失效，其他进程写入后 mtime 变化也会重新加载。
+    方法均为同步阻塞调用，异步接口中请通过 asyncio.to_thread 调用。
+    """
     def __init__(self):
+        self._lock = threading.Lock()
+        # save_documents 是读-改-写，多个构建并发写入时需串行
+        self._docs_write_lock = threading.Lock()
+        self._cache: OrderedDict[str, tuple[tuple[float, int], Any]] = OrderedDict()
+        # 由缓存内容派生的视图（如校验并序列化好的接口响应），与原数据同版本失效
+        self._views: Dict[str, tuple[tuple[float, int], Any]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
         os.makedirs(DATA_DIR, exist_ok=True)
         os.makedirs(GRAPH_DIR, exist_ok=True)
+        os.makedirs(PROVENANCE_DIR, exist_ok=True)
         
         self.docs_file = os.path.join(DATA_DIR, "documents.json")
         self.chunk_map_file = os.path.join(DATA_DIR, "chunk_mapping.json")
@@ -27,20 +49,69 @@ class JSONStorage:
             return {}
     
     def _save_json(self, path: str, data: dict):
-        with open(path, 'w', encoding='utf-8') as f:
+        # 先写临时文件再替换：并发读取的线程不会读到写了一半的文件
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        self._invalidate(path)
+
+    def _invalidate(self, path: str) -> None:
+        with self._lock:
+            self._cache.pop(path, None)
+            self._views.pop(path, None)
+
+    def _cached_entry(self, path: str) -> Optional[tuple[tuple[float, int], Any]]:
+        """读穿缓存，返回 (文件版本, 内容)；文件不存在返回 None"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._invalidate(path)
+            return None
+        version = (st.st_mtime, st.st_size)
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(path)
+                self.cache_hits += 1
+                return entry
+            self.cache_misses += 1
+        entry = (version, self._load_json(path))
+        with self._lock:
+            self._cache[path] = entry
+            self._cache.move_to_end(path)
+            # documents.json 常驻，图谱与溯源索引按 LRU 淘汰
+            graphs = [k for k in self._cache if k != self.docs_file]
+            for key in graphs[: max(0, len(graphs) - GRAPH_CACHE_MAX_ENTRIES)]:
+                del self._cache[key]
+                self._views.pop(key, None)
+        return entry
+
+    def _cached_json(self, path: str) -> Optional[Any]:
+        entry = self._cached_entry(path)
+        return entry[1] if entry is not None else None
     
     def save_documents(self, docs: List[dict]):
-        all_docs = self._load_json(self.docs_file)
-        for doc in docs:
-            all_docs[doc['doc_id']] = {
-                'domain': doc['domain'],
-                'content': doc['content']
-            }
-        self._save_json(self.docs_file, all_docs)
+        with self._docs_write_lock:
+            current = self._cached_json(self.docs_file) or {}
+            changed = {}
+            for doc in docs:
+                record = {
+                    'domain': doc['domain'],
+                    'content': doc['content']
+                }
+                if current.get(doc['doc_id']) != record:
+                    changed[doc['doc_id']] = record
+            # 重复构建时文档多已存在（chunk id 由内容决定），没有变化就不重写整个文件
+            if not changed:
+                return
+            # 缓存中的 dict 是共享的，合并到副本上
+            all_docs = dict(current)
+            all_docs.update(changed)
+            self._save_json(self.docs_file, all_docs)
     
     def get_document(self, doc_id: str) -> dict:
-        all_docs = self._load_json(self.docs_file)
+        all_docs = self._cached_json(self.docs_file) or {}
         return all_docs.get(doc_id)
     
     def save_graph(self, concept: str, graph_data: dict):
@@ -49,8 +120,55 @@ class JSONStorage:
     
     def get_graph(self, concept: str) -> dict:
         graph_file = os.path.join(GRAPH_DIR, f"{concept}.json")
-        if not os.path.exists(graph_file):
+        return self._cached_json(graph_file)
+
+    def get_graph_view(self, concept: str, render: Callable[[dict], Any]) -> Optional[Any]:
+        """
+        返回 render(图谱数据) 的结果并按图谱文件版本缓存
+        用于缓存校验 + 序列化后的接口响应，图谱不变时重复请求不再重新编码
+        """
+        return self._get_view(os.path.join(GRAPH_DIR, f"{concept}.json"), render)
+
+    def _get_view(self, path: str, render: Callable[[dict], Any]) -> Optional[Any]:
+        entry = self._cached_entry(path)
+        if entry is None or not entry[1]:
             return None
-        return self._load_json(graph_file)
+        version, data = entry
+        with self._lock:
+            view = self._views.get(path)
+            if view is not None and view[0] == version:
+                return view[1]
+        rendered = render(data)
+        with self._lock:
+            if path in self._cache:
+                self._views[path] = (version, rendered)
+        return rendered
+
+    def save_provenance(self, concept: str, index: dict):
+        self._save_json(os.path.join(PROVENANCE_DIR, f"{concept}.json"), index)
+
+    def get_provenance(self, concept: str) -> dict:
+        """溯源索引（缓存中的共享对象，修改前请复制）"""
+        return self._cached_json(os.path.join(PROVENANCE_DIR, f"{concept}.json")) or {}
+
+    def get_provenance_view(self, concept: str, render: Callable[[dict], Any]) -> Optional[Any]:
+        """render(溯源索引) 的结果，按索引文件版本缓存（如反向查找表）"""
+        return self._get_view(os.path.join(PROVENANCE_DIR, f"{concept}.json"), render)
+
+    def list_graphs(self) -> List[str]:
+        if not os.path.exists(GRAPH_DIR):
+            return []
+        return [f[: -len('.json')] for f in os.listdir(GRAPH_DIR) if f.endswith('.json')]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._cache)
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "entries": entries,
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+        }
 
 storage = JSONStorage()
\ No newline at end of file
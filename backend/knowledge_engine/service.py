@@ -1,10 +1,13 @@
+import asyncio
 import logging
 from typing import List, Optional
-from common.models import Chunk
-from .core.rag_engine import rag_engine
+from common import tracing
+from common.models import Chunk, GraphResponse
+from .core.rag_engine import InsertProgressFn, rag_engine
 from .core.graph_processor import graph_processor
 from .core.storage import storage
 from .core.neo4j_client import neo4j_client 
+from .core.provenance import provenance_index
 from lightrag import QueryParam
 
 logger = logging.getLogger("knowledge-service")
@@ -15,8 +18,9 @@ class KnowledgeService:
         self.processor = graph_processor
         self.storage = storage
         self.neo4j = neo4j_client
+        self.provenance = provenance_index
 
-    async def ingest_and_build_graph(self, concept: str, chunks: List[Chunk]) -> dict:
+    async def ingest_and_build_graph(self, concept: str, chunks: List[Chunk], on_progress: Optional[InsertProgressFn] = None) -> dict:
         """
         [被 Search Agent 调用]
         将搜索到的 Chunks 入库并构建图谱
@@ -26,66 +30,119 @@ class KnowledgeService:
 
         logger.info(f"Start building graph for '{concept}' with {len(chunks)} chunks.")
         
+        try:
+            documents = await self.ingest_documents(concept, chunks, on_progress)
+            return await self.publish_graph(concept, documents)
+        except Exception as e:
+            logger.exception(f"Graph build failed for {concept}")
+            raise e
+
+    async def ingest_documents(self, concept: str, chunks: List[Chunk], on_progress: Optional[InsertProgressFn] = None) -> List[dict]:
+        """
+        [被流式流水线调用]
+        存储原始文档并增量插入 LightRAG（不生成图谱），返回转换后的文档列表
+        on_progress(文档, 状态, 已完成数, 总数) 在每篇文档插入完成时调用
+        """
         # 1. 转换模型
-        documents = []
-        for chunk in chunks:
-            documents.append({
-                "doc_id": chunk.id,
-                "domain": chunk.discipline,
-                "content": chunk.content,
-                "source": chunk.source.model_dump(),
-                "relevance_score": chunk.relevance_score,
-                "academic_value": chunk.academic_value,
-            })
+        documents = [self._to_document(chunk) for chunk in chunks]
             
-        # 2. 存储原始文档
-        self.storage.save_documents(documents)
+        # 2. 存储原始文档（整文件读写，放到线程中避免阻塞事件循环）
+        with tracing.span("storage.save_documents", documents=len(documents)):
+            await asyncio.to_thread(self.storage.save_documents, documents)
         
-        # 3. LightRAG 构建
-        try:
-            working_dir, chunk_mapping = await self.rag.build_graph(concept, documents)
-            
-            # 4. 解析为前端图谱格式
+        # 3. LightRAG 插入
+        await self.rag.insert_documents(concept, documents, on_progress)
+        return documents
+
+    async def publish_graph(self, concept: str, documents: List[dict]) -> dict:
+        """
+        根据已插入的全部文档解析 LightRAG 输出，保存图谱 JSON 并同步 Neo4j
+        documents 为该次构建插入过的文档（chunk -> 领域映射的增量部分）；
+        相对上次发布的图谱只处理变化的部分
+        """
+        # chunk 溯源索引只解析新增的 chunk（读文件放到线程中）
+        with tracing.span("provenance.update", documents=len(documents)):
+            working_dir, chunk_mapping = await asyncio.to_thread(self.rag.chunk_mapping, concept, documents)
+
+        # 自上次发布后 LightRAG 图谱没有变化（如重复构建时全部文档都已处理过）且 Neo4j 已同步：直接沿用
+        graph_version = self.processor.graph_version(working_dir)
+        previous = await asyncio.to_thread(self.storage.get_graph, concept)
+        published = self.provenance.published(concept)
+        if previous and graph_version is not None and published.get("graph_version") == graph_version and published.get("neo4j_synced"):
+            logger.info(f"Graph for '{concept}' unchanged since last publish, skipped")
+            return {"status": "success", "nodes_count": len(previous.get("nodes", [])), "changed_nodes": 0}
+
+        # 4. 解析为前端图谱格式（未变化的节点 / 边沿用上次发布的结果）
+        with tracing.span("process_lightrag_output", documents=len(documents)) as sp:
             graph_data = self.processor.process_lightrag_output(
-                working_dir, documents, concept, chunk_mapping
+                working_dir, documents, concept, chunk_mapping, previous
             )
-            
-             # 5. 保存图谱 JSON (文件存储 - 兼容旧逻辑)
-            self.storage.save_graph(concept, graph_data)
-            
-            # 6. 同步保存到 Neo4j 
+            # 上次没有同步成功时 Neo4j 中可能缺节点，整图重新同步
+            delta = self.processor.delta(previous if published.get("neo4j_synced") else None, graph_data)
+            sp.update(nodes=len(graph_data["nodes"]), edges=len(graph_data["edges"]),
+                      changed_nodes=len(delta["nodes"]), changed_edges=len(delta["edges"]))
+        
+         # 5. 保存图谱 JSON (文件存储 - 兼容旧逻辑)
+        with tracing.span("storage.save_graph"):
+            await asyncio.to_thread(self.storage.save_graph, concept, graph_data)
+        
+        # 6. 同步保存到 Neo4j：只写入新增或变化的节点 / 边（与之前一样不删除节点）
+        synced = True
+        if delta["nodes"] or delta["edges"]:
             try:
-                logger.info(f"Syncing graph '{concept}' to Neo4j...")
-                await self.neo4j.save_graph(
-                    concept=concept, 
-                    nodes=graph_data["nodes"], 
-                    edges=graph_data["edges"]
-                )
+                logger.info(f"Syncing graph '{concept}' to Neo4j ({len(delta['nodes'])} nodes, {len(delta['edges'])} edges changed)...")
+                with tracing.span("neo4j.save_graph", nodes=len(delta["nodes"]), edges=len(delta["edges"])):
+                    await self.neo4j.save_graph(
+                        concept=concept, 
+                        nodes=delta["nodes"], 
+                        edges=delta["edges"]
+                    )
             except Exception as ne:
+                synced = False
                 logger.error(f"Failed to sync to Neo4j: {ne}") 
-            
-            logger.info(f"Graph built successfully: {concept}")
-            return {"status": "success", "nodes_count": len(graph_data.get("nodes", []))}
-            
-        except Exception as e:
-            logger.exception(f"Graph build failed for {concept}")
-            raise e
+        await asyncio.to_thread(self.provenance.record_published, concept, graph_data["nodes"], graph_version, synced)
+        
+        logger.info(f"Graph built successfully: {concept}")
+        return {"status": "success", "nodes_count": len(graph_data.get("nodes", [])), "changed_nodes": len(delta["nodes"])}
+
+    @staticmethod
+    def _to_document(chunk: Chunk) -> dict:
+        return {
+            "doc_id": chunk.id,
+            "domain": chunk.discipline,
+            "content": chunk.content,
+            "source": chunk.source.model_dump(),
+            "relevance_score": chunk.relevance_score,
+            "academic_value": chunk.academic_value,
+        }
+
+    async def embed(self, texts: List[str]):
+        """[被 Search Agent 调用] 复用 RAG 的 embedding 模型计算向量"""
+        return await self.rag._embedding_wrapper(texts)
 
     def get_graph(self, concept: str) -> Optional[dict]:
         """[被 Central Agent 调用] 获取图谱数据"""
         return self.storage.get_graph(concept)
 
+    def get_graph_json(self, concept: str) -> Optional[bytes]:
+        """[被 Central Agent 调用] 校验并序列化后的图谱 JSON，图谱文件不变时直接复用"""
+        return self.storage.get_graph_view(concept, lambda data: GraphResponse(**data).model_dump_json().encode("utf-8"))
+
     def get_chunk(self, chunk_id: str) -> Optional[dict]:
         """[被 Central Agent 调用] 获取原始文档片段"""
         return self.storage.get_document(chunk_id)
 
+    def get_node_provenance(self, concept: str, node_id: str) -> Optional[dict]:
+        """[被 Central Agent 调用] 节点来源：节点 → chunk → 原始文档"""
+        return self.provenance.node_sources(concept, node_id)
+
+    def get_document_provenance(self, concept: str, doc_id: str) -> Optional[dict]:
+        """[被 Central Agent 调用] 文档去向：原始文档 → chunk → 图谱节点"""
+        return self.provenance.document_targets(concept, doc_id)
+
     def list_concepts(self) -> List[str]:
         """[被 Central Agent 调用] 列出已有图谱"""
-        import os 
-        graph_dir = "./data/graphs"
-        if not os.path.exists(graph_dir):
-            return []
-        return [f.replace('.json', '') for f in os.listdir(graph_dir) if f.endswith('.json')]
+        return self.storage.list_graphs()
 
     async def qa(self, concept: str, source: str, target: str, question: Optional[str] = None) -> str:
         """[被 Central Agent 调用] 知识问答"""
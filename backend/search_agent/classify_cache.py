@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import copy
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+import numpy as np
+
+from .search_cache import normalize_query
+
+logger = logging.getLogger("search-agent-classify-cache")
+
+EmbedFn = Callable[[list[str]], Awaitable[Any]]
+
+
+@dataclass
+class ClassifyEntry:
+    concept: str
+    model: str
+    payload: dict
+    created_at: float
+    embedding: Optional[np.ndarray] = None
+    hits: int = 0
+    reused_by: list[str] = field(default_factory=list)
+
+    def provenance(self) -> dict[str, Any]:
+        return {
+            "concept": self.concept,
+            "model": self.model,
+            "source": "llm",
+            "cached_at": self.created_at,
+            "hits": self.hits,
+        }
+
+
+class ClassifyCache:
+    """
+    概念分类结果缓存（进程内，TTL + LRU）
+
+    - 精确命中：键为 (规范化概念, 模型)
+    - 相似命中（可选）：配置 CLASSIFY_CACHE_SIMILARITY > 0 且注入 embed_fn 后，
+      同一模型下余弦相似度超过阈值的已缓存概念可复用其分类结果
+    - 每个条目记录来源、创建时间、命中次数与被哪些概念复用（provenance）
+    """
+
+    def __init__(self, embed_fn: Optional[EmbedFn] = None) -> None:
+        self.enabled = os.getenv("CLASSIFY_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+        self.ttl_s = float(os.getenv("CLASSIFY_CACHE_TTL_S", str(24 * 3600)))
+        self.max_entries = int(os.getenv("CLASSIFY_CACHE_MAX_ENTRIES", "1000"))
+        self.similarity = float(os.getenv("CLASSIFY_CACHE_SIMILARITY", "0"))
+        self.embed_fn = embed_fn
+        self._entries: OrderedDict[tuple[str, str], ClassifyEntry] = OrderedDict()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def similarity_enabled(self) -> bool:
+        return self.similarity > 0 and self.embed_fn is not None
+
+    async def get(self, concept: str, model: str) -> tuple[Optional[dict], dict[str, Any]]:
+        """返回 (payload 副本或 None, provenance)"""
+        if not self.enabled:
+            return None, {"cache": "disabled"}
+        self._expire()
+        norm = normalize_query(concept)
+
+        entry = self._entries.get((norm, model))
+        if entry is not None:
+            self._entries.move_to_end((norm, model))
+            entry.hits += 1
+            self.exact_hits += 1
+            return copy.deepcopy(entry.payload), {"cache": "exact", **entry.provenance()}
+
+        if self.similarity_enabled:
+            match = await self._nearest(norm, model)
+            if match is not None:
+                entry, score = match
+                self._entries.move_to_end((normalize_query(entry.concept), entry.model))
+                entry.hits += 1
+                if norm not in entry.reused_by:
+                    entry.reused_by.append(norm)
+                self.similar_hits += 1
+                logger.info("Classify cache similar hit: '%s' -> '%s' (%.3f)", concept, entry.concept, score)
+                payload = copy.deepcopy(entry.payload)
+                payload["concept"] = concept
+                return payload, {"cache": "similar", "similarity": round(score, 4), **entry.provenance()}
+
+        self.misses += 1
+        return None, {"cache": "miss"}
+
+    async def put(self, concept: str, model: str, payload: dict) -> None:
+        if not self.enabled:
+            return
+        norm = normalize_query(concept)
+        embedding = None
+        if self.similarity_enabled:
+            try:
+                embedding = await self._embed(norm)
+            except Exception as e:
+                logger.warning("Classify cache embedding failed for '%s': %s", concept, e)
+        self._entries[(norm, model)] = ClassifyEntry(
+            concept=concept,
+            model=model,
+            payload=copy.deepcopy(payload),
+            created_at=time.time(),
+            embedding=embedding,
+        )
+        self._entries.move_to_end((norm, model))
+        while self.max_entries and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _embed(self, text: str) -> np.ndarray:
+        vec = np.asarray(await self.embed_fn([text]), dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    async def _nearest(self, norm: str, model: str) -> Optional[tuple[ClassifyEntry, float]]:
+        candidates = [e for e in self._entries.values() if e.model == model and e.embedding is not None]
+        if not candidates:
+            return None
+        try:
+            query = await self._embed(norm)
+        except Exception as e:
+            logger.warning("Classify cache embedding failed for '%s': %s", norm, e)
+            return None
+        scores = np.stack([e.embedding for e in candidates]) @ query
+        best = int(np.argmax(scores))
+        if float(scores[best]) >= self.similarity:
+            return candidates[best], float(scores[best])
+        return None
+
+    def _expire(self) -> None:
+        if not self.ttl_s:
+            return
+        deadline = time.time() - self.ttl_s
+        for key in [k for k, e in self._entries.items() if e.created_at < deadline]:
+            del self._entries[key]
+            self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "similarity_threshold": self.similarity if self.similarity_enabled else None,
+            "recent": [
+                {**e.provenance(), "reused_by": e.reused_by}
+                for e in list(self._entries.values())[-20:]
+            ],
+        }
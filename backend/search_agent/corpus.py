@@ -0,0 +1,249 @@
+"""
+离线语料检索（SEARCH_PROVIDER=corpus）
+
+对本地文档集合（JSONL 文件或目录）构建一次 BM25 倒排索引并落盘，之后以内存映射方式加载，
+用于在无网络环境下以接近生产的规模压测 / 基准测试 search_graph。
+
+- JSONL：每行 {"url", "title", "content"}（content 也可写作 text）
+- 目录：递归读取 .txt / .md 文件，标题取文件名
+- 分词：中文按相邻字二元组（bigram），其余按小写单词
+
+手动构建索引（在 backend 目录下）：
+    python -m search_agent.corpus build --source ./data/corpus.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("search-agent-corpus")
+
+INDEX_VERSION = 1
+_CJK_RUN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[0-9a-z]+")
+_CJK_CHAR_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for run in _CJK_RUN_RE.findall(unicodedata.normalize("NFKC", text or "").lower()):
+        if _CJK_CHAR_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _iter_source(source: str) -> Iterator[dict]:
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if not name.endswith((".txt", ".md")):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                    content = f.read()
+                yield {"url": f"file://{os.path.abspath(path)}", "title": os.path.splitext(name)[0], "content": content}
+        return
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                doc = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            content = doc.get("content") or doc.get("text") or ""
+            if content:
+                yield {"url": doc.get("url", "") or "", "title": doc.get("title", "") or "", "content": content}
+
+
+def _source_signature(source: str) -> dict:
+    if os.path.isdir(source):
+        size, mtime = 0, 0.0
+        for root, _, files in os.walk(source):
+            for name in files:
+                st = os.stat(os.path.join(root, name))
+                size += st.st_size
+                mtime = max(mtime, st.st_mtime)
+        return {"source": os.path.abspath(source), "size": size, "mtime": mtime}
+    st = os.stat(source)
+    return {"source": os.path.abspath(source), "size": st.st_size, "mtime": st.st_mtime}
+
+
+def build_index(source: str, index_dir: str) -> None:
+    """构建倒排索引：词表 + 扁平 postings 数组（按词连续存放）+ 文档长度 + 原文 JSONL 偏移"""
+    os.makedirs(index_dir, exist_ok=True)
+    postings: Dict[str, List[tuple[int, int]]] = defaultdict(list)
+    doc_lens: List[int] = []
+    offsets: List[int] = []
+
+    docs_path = os.path.join(index_dir, "docs.jsonl")
+    with open(docs_path, "wb") as out:
+        for doc_id, doc in enumerate(_iter_source(source)):
+            offsets.append(out.tell())
+            out.write(json.dumps(doc, ensure_ascii=False).encode("utf-8") + b"\n")
+            tf = Counter(tokenize(doc["title"] + " " + doc["content"]))
+            doc_lens.append(sum(tf.values()))
+            for term, count in tf.items():
+                postings[term].append((doc_id, count))
+        offsets.append(out.tell())
+
+    vocab: Dict[str, List[int]] = {}
+    total = sum(len(p) for p in postings.values())
+    p_docs = np.empty(total, dtype=np.int32)
+    p_tfs = np.empty(total, dtype=np.float32)
+    pos = 0
+    for term, plist in postings.items():
+        vocab[term] = [pos, len(plist)]
+        for doc_id, count in plist:
+            p_docs[pos] = doc_id
+            p_tfs[pos] = count
+            pos += 1
+
+    np.save(os.path.join(index_dir, "postings_docs.npy"), p_docs)
+    np.save(os.path.join(index_dir, "postings_tf.npy"), p_tfs)
+    np.save(os.path.join(index_dir, "doc_len.npy"), np.asarray(doc_lens, dtype=np.int32))
+    np.save(os.path.join(index_dir, "doc_offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(index_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    meta = {
+        "version": INDEX_VERSION,
+        "n_docs": len(doc_lens),
+        "avgdl": float(np.mean(doc_lens)) if doc_lens else 0.0,
+        **_source_signature(source),
+    }
+    # meta 最后写入：它存在即表示索引完整
+    with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    logger.info("Corpus index built: docs=%d terms=%d postings=%d -> %s", len(doc_lens), len(vocab), total, index_dir)
+
+
+class CorpusIndex:
+    """内存映射的 BM25 索引；首次查询时加载（必要时构建）"""
+
+    def __init__(self, source: str, index_dir: str, k1: float = 1.5, b: float = 0.75, max_chars: int = 2000) -> None:
+        self.source = source
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _is_fresh(self) -> bool:
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            return False
+        if not os.path.exists(self.source):
+            # 只有索引没有原始语料时直接使用已有索引
+            return True
+        sig = _source_signature(self.source)
+        return all(meta.get(k) == v for k, v in sig.items())
+
+    def load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            if not self._is_fresh():
+                if not os.path.exists(self.source):
+                    raise FileNotFoundError(f"Corpus source not found: {self.source}")
+                logger.info("Building corpus index from %s ...", self.source)
+                build_index(self.source, self.index_dir)
+            d = self.index_dir
+            with open(os.path.join(d, "meta.json"), "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            with open(os.path.join(d, "vocab.json"), "r", encoding="utf-8") as f:
+                self.vocab: Dict[str, List[int]] = json.load(f)
+            self.p_docs = np.load(os.path.join(d, "postings_docs.npy"), mmap_mode="r")
+            self.p_tfs = np.load(os.path.join(d, "postings_tf.npy"), mmap_mode="r")
+            self.doc_len = np.load(os.path.join(d, "doc_len.npy"), mmap_mode="r")
+            self.offsets = np.load(os.path.join(d, "doc_offsets.npy"), mmap_mode="r")
+            self._docs_file = open(os.path.join(d, "docs.jsonl"), "rb")
+            size = os.fstat(self._docs_file.fileno()).st_size
+            self._docs = mmap.mmap(self._docs_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            self.n_docs = int(self.meta["n_docs"])
+            self.avgdl = float(self.meta["avgdl"]) or 1.0
+            # BM25 分母中与词无关的部分，按文档预先计算
+            self._norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len, dtype=np.float32) / self.avgdl)
+            self._loaded = True
+            logger.info("Corpus index loaded: docs=%d terms=%d", self.n_docs, len(self.vocab))
+
+    def doc(self, doc_id: int) -> dict:
+        start, end = int(self.offsets[doc_id]), int(self.offsets[doc_id + 1])
+        return json.loads(self._docs[start:end])
+
+    def search(self, query: str, top_k: int) -> List[dict]:
+        self.load()
+        if self.n_docs == 0:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term, qtf in Counter(tokenize(query)).items():
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            start, df = entry
+            docs = self.p_docs[start : start + df]
+            tfs = self.p_tfs[start : start + df]
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += qtf * idf * tfs * (self.k1 + 1) / (tfs + self._norm[docs])
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        out = []
+        for doc_id in top:
+            doc = self.doc(int(doc_id))
+            doc["content"] = doc["content"][: self.max_chars]
+            doc["score"] = float(scores[doc_id])
+            out.append(doc)
+        return out
+
+    def stats(self) -> dict[str, Any]:
+        if not self._loaded:
+            return {"loaded": False, "source": self.source}
+        return {"loaded": True, "source": self.source, "docs": self.n_docs, "terms": len(self.vocab), "avgdl": self.avgdl}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build / query the offline corpus index")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--source", default=os.getenv("SEARCH_CORPUS_PATH", "./data/corpus.jsonl"))
+    b.add_argument("--index-dir", default=os.getenv("SEARCH_CORPUS_INDEX_DIR", "./data/corpus_index"))
+    q = sub.add_parser("query")
+    q.add_argument("text")
+    q.add_argument("--source", default=os.getenv("SEARCH_CORPUS_PATH", "./data/corpus.jsonl"))
+    q.add_argument("--index-dir", default=os.getenv("SEARCH_CORPUS_INDEX_DIR", "./data/corpus_index"))
+    q.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.cmd == "build":
+        build_index(args.source, args.index_dir)
+    else:
+        for doc in CorpusIndex(args.source, args.index_dir).search(args.text, args.k):
+            print(f"{doc['score']:.3f}  {doc['title']}  {doc['url']}")
+
+
+if __name__ == "__main__":
+    main()
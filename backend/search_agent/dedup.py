@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+from typing import Generic, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+# 中日韩字符逐字切分，其余按单词（字母数字串）切分
+_TOKEN_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]|[0-9a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(unicodedata.normalize("NFKC", text or "").lower())
+
+
+def shingles(text: str, n: int = 3) -> List[str]:
+    """token 级 n-gram；中文即字符 n-gram，对标点与空白差异不敏感"""
+    tokens = tokenize(text)
+    if len(tokens) <= n:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i : i + n]) for i in range(len(tokens) - n + 1)]
+
+
+def _hash64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str, n: int = 3, bits: int = 64) -> int:
+    counts = Counter(shingles(text, n))
+    if not counts:
+        return 0
+    hashes = np.fromiter((_hash64(f) for f in counts), dtype=np.uint64, count=len(counts))
+    weights = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    # 每个特征按位投票：该位为 1 加权重，为 0 减权重
+    bit_matrix = (hashes[:, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)
+    votes = (bit_matrix.astype(np.int64) * 2 - 1).T @ weights
+    out = 0
+    for i in np.flatnonzero(votes > 0):
+        out |= 1 << int(i)
+    return out
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class NearDuplicateFilter(Generic[T]):
+    """
+    基于 SimHash 的近重复过滤
+
+    64 位指纹按 max_distance + 1 个分段建立 LSH 索引：汉明距离不超过 max_distance 的两个指纹
+    必然至少有一段完全相同（抽屉原理），因此只需与同段桶内的候选比较。
+    """
+
+    def __init__(self, max_distance: int = 10, shingle_size: int = 3, bits: int = 64) -> None:
+        self.max_distance = max_distance
+        self.shingle_size = shingle_size
+        self.bits = bits
+        self.bands = max_distance + 1
+        self.band_width = bits // self.bands
+        self._buckets: List[dict[int, List[int]]] = [{} for _ in range(self.bands)]
+        self._fingerprints: List[int] = []
+        self.items: List[T] = []
+
+    def _band_keys(self, fp: int) -> List[int]:
+        mask = (1 << self.band_width) - 1
+        return [(fp >> (i * self.band_width)) & mask for i in range(self.bands)]
+
+    def find(self, fp: int) -> Optional[int]:
+        for band, key in enumerate(self._band_keys(fp)):
+            for idx in self._buckets[band].get(key, ()):
+                if hamming(fp, self._fingerprints[idx]) <= self.max_distance:
+                    return idx
+        return None
+
+    def add(self, item: T, text: str) -> Tuple[bool, Optional[int]]:
+        """
+        加入一条内容；返回 (是否新条目, 重复时命中的已保留条目下标)
+        """
+        fp = simhash(text, self.shingle_size, self.bits)
+        dup = self.find(fp)
+        if dup is not None:
+            return False, dup
+        idx = len(self.items)
+        self.items.append(item)
+        self._fingerprints.append(fp)
+        for band, key in enumerate(self._band_keys(fp)):
+            self._buckets[band].setdefault(key, []).append(idx)
+        return True, None
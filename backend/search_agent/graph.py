@@ -1,13 +1,18 @@
 import asyncio
 import logging
-import uuid
+import os
+import time
 from typing import Any, Dict, List, TypedDict, Callable, Optional
 from langgraph.graph import StateGraph, END
 
 # 引用 Services
 from search_agent.service import SearchService, SearchItem, hash_text
+from search_agent.dedup import NearDuplicateFilter
+from search_agent.scheduler import SEARCH_TIME_SHARE, SearchScheduler, budget_for, drive
 from knowledge_engine.service import KnowledgeService
 from common.models import Chunk, SourceInfo, ValidationInfo
+from common.metrics import Histogram
+from common import tracing
 
 # 配置日志输出
 logger = logging.getLogger("search-graph")
@@ -17,6 +22,15 @@ logging.basicConfig(level=logging.INFO)
 search_service = SearchService()
 knowledge_service = KnowledgeService()
 
+# 近重复过滤：SimHash 汉明距离阈值（64 位指纹）
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "10"))
+# 检索阶段提前验证的微批大小（验证结果反馈给调度器）
+FEEDBACK_VALIDATE_BATCH = int(os.getenv("SEARCH_FEEDBACK_VALIDATE_BATCH", "10"))
+
+# mode: staged（LangGraph 节点）/ streaming（流水线阶段，各阶段时间重叠）
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Wall time of each pipeline stage", ["mode", "stage"])
+
 # --- State ---
 class SearchAgentState(TypedDict):
     task_id: str
@@ -24,6 +38,10 @@ class SearchAgentState(TypedDict):
     disciplines: List[Dict[str, Any]]
     search_config: Dict[str, Any]
     raw_search_items: List[tuple[str, SearchItem]] 
+    near_duplicates_removed: int
+    validated_urls: List[str]
+    deadline_at: float
+    search_summary: Dict[str, Any]
     validated_meta: Dict[str, Any]
     chunks: List[Chunk]
     graph_status: str
@@ -39,10 +57,62 @@ def check_cancelled(config: Dict[str, Any]) -> bool:
     # 2. 执行
     return checker()
 
+def item_key(it: SearchItem) -> str:
+    """精确去重键：url + 内容哈希"""
+    return (it.url or "") + "|" + hash_text(it.content)
+
+async def run_query(q: str, max_results: int, config) -> List[SearchItem]:
+    """执行单个查询；失败返回空列表，不影响其他查询"""
+    if check_cancelled(config): return []
+    try:
+        # 调用 Service
+        with tracing.span("search_query", query=q) as sp:
+            items = await search_service.search(q, max_results)
+            sp["items"] = len(items)
+        logger.info(f"   Query '{q}' returned {len(items)} items")
+        return items
+    except Exception as e:
+        logger.error(f"!!! Search FAILED for query '{q}': {e}")
+        import traceback
+        traceback.print_exc()
+        return []
+
+def chunk_id_for(disc: str, content: str) -> str:
+    """按 学科 + 内容 生成稳定的 chunk id：同一来源重复构建时可识别为已处理（内容变化即视为新文档）"""
+    return f"chunk-{hash_text(disc + chr(10) + (content or ''))[:16]}"
+
+def make_chunk(disc: str, it: SearchItem, meta: Dict[str, Any], enable_validation: bool) -> Optional[Chunk]:
+    """按验证结论构建 Chunk；被验证为无效时返回 None"""
+    if enable_validation and meta.get("is_valid") is False:
+        return None
+    rel = float(meta.get("relevance_score", 0.65))
+    return Chunk(
+        id=chunk_id_for(disc, it.content),
+        content=it.content,
+        discipline=disc,
+        source=SourceInfo(url=it.url, title=it.title),
+        relevance_score=rel,
+        academic_value=float(meta.get("academic_value", 0.55)),
+        validation=ValidationInfo(is_validated=bool(enable_validation), confidence=rel, notes=meta.get("notes"))
+    )
+
+def fallback_chunk() -> Chunk:
+    """未检索到任何内容时的占位 Chunk"""
+    return Chunk(
+        id=chunk_id_for("System", "未检索到内容"),
+        content="未检索到内容",
+        discipline="System",
+        source=SourceInfo(url="about:blank", title="No Results"),
+        relevance_score=0.1, academic_value=0.1
+    )
+
 # --- Nodes ---
 
 async def search_node(state: SearchAgentState, config):
-    """搜索节点 """
+    """
+    搜索节点：按 depth 预算由调度器自适应派发查询
+    结果边到达边去重，并以微批提前验证，验证通过率反馈给调度器用于分配后续查询
+    """
     logger.info(">>> [Node] Entering Search Node") 
     
     if check_cancelled(config): 
@@ -54,52 +124,104 @@ async def search_node(state: SearchAgentState, config):
     
     concept = state["concept"]
     disciplines = state["disciplines"]
-    max_results = state["search_config"].get("max_results_per_discipline", 10)
+    enable_validation = state["search_config"].get("enable_validation", True)
+    budget = budget_for(state["search_config"])
+    started = time.time()
+    deadline_at = started + budget.deadline_s
 
-    logger.info(f"Concept: {concept}, Disciplines count: {len(disciplines)}")
+    logger.info(f"Concept: {concept}, Disciplines count: {len(disciplines)}, budget: {budget}")
 
     if not disciplines:
         logger.error("!!! No disciplines provided, skipping search.")
-        return {"raw_search_items": []}
-
-    queries = []
-    for d in disciplines:
-        name = d["name"]
-        kws = d.get("search_keywords") or [name]
-        # 限制关键词数量，防止请求过多
-        for kw in kws[:3]:
-            queries.append((name, f"{concept} {kw}"))
-    
-    logger.info(f"Generated {len(queries)} queries. Starting parallel search...")
+        return {"raw_search_items": [], "deadline_at": deadline_at}
 
-    async def one(discipline: str, q: str):
-        if check_cancelled(config): return []
-        try:
-            # 调用 Service
-            items = await search_service.search(q, max_results)
-            logger.info(f"   Query '{q}' returned {len(items)} items")
-            return items
-        except Exception as e:
-            logger.error(f"!!! Search FAILED for query '{q}': {e}")
-            import traceback
-            traceback.print_exc()
-            return []
+    scheduler = SearchScheduler(concept, disciplines, budget)
+    near = NearDuplicateFilter(max_distance=NEAR_DUP_MAX_DISTANCE) if NEAR_DUP_ENABLED else None
+    flat: List[tuple[str, SearchItem]] = near.items if near else []
+    seen: set[str] = set()
+    counters = {"done": 0, "near_dups": 0}
+    validated_meta: Dict[str, Any] = {}
+    validated_urls: set[str] = set()
+    to_validate: List[tuple[str, SearchItem]] = []
+    val_tasks: set[asyncio.Task] = set()
 
-    results_nested = await asyncio.gather(*[one(d, q) for d, q in queries])
-    
-    flat = []
-    seen = set()
-    for (disc, _), items in zip(queries, results_nested):
+    async def validate_batch(batch: List[tuple[str, SearchItem]]) -> None:
+        meta = await search_service.validate_results(concept, [it for _, it in batch])
+        validated_meta.update(meta)
+        validated_urls.update(it.url for _, it in batch)
+        if not meta:
+            return  # 无 LLM 或验证失败：没有可用的反馈信号
+        per_disc: Dict[str, List[int]] = {}
+        for disc, it in batch:
+            ok = it.url in meta and meta[it.url].get("is_valid") is not False
+            stat = per_disc.setdefault(disc, [0, 0])
+            stat[0] += 1
+            stat[1] += int(ok)
+        for disc, (total, valid) in per_disc.items():
+            scheduler.report_validation(disc, total, valid)
+
+    async def on_result(disc: str, q: str, items: List[SearchItem]) -> None:
+        new = 0
         for it in items:
-            key = (it.url or "") + "|" + hash_text(it.content)
-            if key in seen: continue
+            key = item_key(it)
+            if key in seen or len(it.content) < 80:
+                continue
             seen.add(key)
-            if len(it.content) < 80: continue
-            flat.append((disc, it))
-            
-    logger.info(f">>> [Node] Search Finished. Total raw items: {len(flat)}")
-    cb("aggregation", 55, None)
-    return {"raw_search_items": flat}
+            if near is not None:
+                added, dup = near.add((disc, it), it.content)
+                if not added:
+                    # 近重复：保留内容更长的一条
+                    counters["near_dups"] += 1
+                    kept_disc, kept = near.items[dup]
+                    if len(it.content) > len(kept.content):
+                        near.items[dup] = (kept_disc, it)
+                    continue
+            else:
+                flat.append((disc, it))
+            new += 1
+            to_validate.append((disc, it))
+        scheduler.report_results(disc, len(items), new)
+
+        if enable_validation and len(to_validate) >= FEEDBACK_VALIDATE_BATCH:
+            batch = to_validate[:]
+            to_validate.clear()
+            task = asyncio.create_task(validate_batch(batch))
+            val_tasks.add(task)
+            task.add_done_callback(val_tasks.discard)
+
+        counters["done"] += 1
+        cb("search", 10 + int(45 * counters["done"] / budget.max_queries), {"found": len(flat)})
+
+    timed_out = await drive(
+        scheduler,
+        run_one=lambda q: run_query(q, budget.results_per_query, config),
+        on_result=on_result,
+        deadline_at=started + budget.deadline_s * SEARCH_TIME_SHARE,
+        cancelled=lambda: check_cancelled(config),
+    )
+
+    # 等待在途的提前验证（不超过总截止时间），未完成的留给验证节点
+    if val_tasks:
+        _, still = await asyncio.wait(set(val_tasks), timeout=max(0.0, deadline_at - time.time()))
+        for task in still:
+            task.cancel()
+
+    summary = scheduler.summary()
+    summary["deadline_hit"] = timed_out
+    near_dups = counters["near_dups"]
+    logger.info(
+        f">>> [Node] Search Finished. Total raw items: {len(flat)}, queries: {scheduler.issued}, "
+        f"near-duplicates removed: {near_dups}, pre-validated: {len(validated_urls)}"
+    )
+    cb("aggregation", 55, {"near_duplicates_removed": near_dups})
+    return {
+        "raw_search_items": flat,
+        "near_duplicates_removed": near_dups,
+        "validated_meta": validated_meta,
+        "validated_urls": list(validated_urls),
+        "deadline_at": deadline_at,
+        "search_summary": summary,
+    }
 
 async def validation_node(state: SearchAgentState, config):
     logger.info(">>> [Node] Entering Validation Node")
@@ -108,18 +230,27 @@ async def validation_node(state: SearchAgentState, config):
     cb("validation", 70, None)
     
     concept = state["concept"]
-    items = [it for _, it in state.get("raw_search_items", [])]
+    done_urls = set(state.get("validated_urls") or [])
+    # 检索阶段已提前验证过的条目不再重复验证
+    items = [it for _, it in state.get("raw_search_items", []) if it.url not in done_urls]
     enable_validation = state["search_config"].get("enable_validation", True)
+    validated_meta = dict(state.get("validated_meta") or {})
+    remaining = state.get("deadline_at", float("inf")) - time.time()
     
     logger.info(f"Validating {len(items)} items. Enable validation: {enable_validation}")
 
-    validated_meta = {}
     if enable_validation and items:
-        try:
-            validated_meta = await search_service.validate_results(concept, items)
-            logger.info(f"Validation complete. Meta count: {len(validated_meta)}")
-        except Exception as e:
-            logger.error(f"!!! Validation FAILED: {e}")
+        if remaining <= 0:
+            logger.warning(f"Deadline reached, skipping validation of {len(items)} items")
+        else:
+            try:
+                meta = await asyncio.wait_for(search_service.validate_results(concept, items), timeout=remaining)
+                validated_meta.update(meta)
+                logger.info(f"Validation complete. Meta count: {len(validated_meta)}")
+            except asyncio.TimeoutError:
+                logger.warning(f"Validation hit the task deadline, {len(items)} items left unvalidated")
+            except Exception as e:
+                logger.error(f"!!! Validation FAILED: {e}")
 
     return {"validated_meta": validated_meta}
 
@@ -138,30 +269,13 @@ async def construct_chunks_node(state: SearchAgentState, config):
     
     if not flat_items:
         logger.warning("No flat items found, creating fallback chunk.")
-        # Fallback Chunk
-        chunks.append(Chunk(
-            id=f"chunk-{uuid.uuid4().hex[:8]}",
-            content="未检索到内容",
-            discipline="System",
-            source=SourceInfo(url="about:blank", title="No Results"),
-            relevance_score=0.1, academic_value=0.1
-        ))
+        chunks.append(fallback_chunk())
     else:
         for disc, it in flat_items:
-            meta = validated_meta.get(it.url, {})
-            if enable_validation and meta.get("is_valid") is False:
+            chunk = make_chunk(disc, it, validated_meta.get(it.url, {}), enable_validation)
+            if chunk is None:
                 continue
-            
-            rel = float(meta.get("relevance_score", 0.65))
-            chunks.append(Chunk(
-                id=f"chunk-{uuid.uuid4().hex[:8]}",
-                content=it.content,
-                discipline=disc,
-                source=SourceInfo(url=it.url, title=it.title),
-                relevance_score=rel,
-                academic_value=float(meta.get("academic_value", 0.55)),
-                validation=ValidationInfo(is_validated=bool(enable_validation), confidence=rel, notes=meta.get("notes"))
-            ))
+            chunks.append(chunk)
             by_disc[disc] = by_disc.get(disc, 0) + 1
 
     logger.info(f"Constructed {len(chunks)} chunks.")
@@ -182,7 +296,11 @@ async def ingest_node(state: SearchAgentState, config):
     if auto_ingest and chunks:
         try:
             logger.info(f"Ingesting {len(chunks)} chunks to Knowledge Engine...")
-            await knowledge_service.ingest_and_build_graph(concept, chunks)
+
+            def on_progress(doc: dict, doc_status: str, done: int, total: int) -> None:
+                cb("ingesting", 95 + 4 * done // total, {"ingested": done, "total": total, "doc_id": doc["doc_id"], "doc_status": doc_status})
+
+            await knowledge_service.ingest_and_build_graph(concept, chunks, on_progress)
             status = "success"
         except Exception as e:
             logger.error(f"!!! Ingestion FAILED: {e}")
@@ -193,12 +311,19 @@ async def ingest_node(state: SearchAgentState, config):
     cb("completed", 100, {"ingest_status": status})
     return {"graph_status": status}
 
+def timed_node(stage: str, node: Callable):
+    """记录节点耗时；保留 (state, config) 签名，LangGraph 据此注入 config"""
+    async def run(state: SearchAgentState, config):
+        with STAGE_SECONDS.time(mode="staged", stage=stage), tracing.span(f"node:{stage}"):
+            return await node(state, config)
+    return run
+
 # --- Workflow ---
 workflow = StateGraph(SearchAgentState)
-workflow.add_node("search", search_node)
-workflow.add_node("validate", validation_node)
-workflow.add_node("construct", construct_chunks_node)
-workflow.add_node("ingest", ingest_node)
+workflow.add_node("search", timed_node("search", search_node))
+workflow.add_node("validate", timed_node("validate", validation_node))
+workflow.add_node("construct", timed_node("construct", construct_chunks_node))
+workflow.add_node("ingest", timed_node("ingest", ingest_node))
 
 workflow.set_entry_point("search")
 workflow.add_edge("search", "validate")
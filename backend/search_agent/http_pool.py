@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict
+
+import httpx
+
+logger = logging.getLogger("search-agent-http")
+
+USER_AGENT = "CloudComputer2025-SearchAgent/0.1"
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPClientPool:
+    """
+    每个上游（tavily / wikipedia / llm / knowledge_engine）持有一个长连接 AsyncClient，
+    避免每次请求都重新建立 TCP + TLS 握手。
+
+    - 连接池上限、keep-alive 数量与过期时间可通过环境变量配置
+    - HTTP2_ENABLED=true 且安装了 h2 时启用 HTTP/2
+    - 未显式 start() 时按需懒加载，保证脚本/测试直接调用也能工作
+    """
+
+    def __init__(self, timeouts: Dict[str, float] | None = None, default_timeout: float = 30.0) -> None:
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "30")),
+        )
+        self.http2 = os.getenv("HTTP2_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+        if self.http2 and not _h2_available():
+            logger.warning("HTTP2_ENABLED is set but 'h2' is not installed, falling back to HTTP/1.1")
+            self.http2 = False
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests_total: Dict[str, int] = {}
+
+    def _create(self, upstream: str) -> httpx.AsyncClient:
+        timeout = self.timeouts.get(upstream, self.default_timeout)
+        return httpx.AsyncClient(
+            timeout=timeout,
+            limits=self.limits,
+            http2=self.http2,
+            headers={"User-Agent": USER_AGENT},
+        )
+
+    def client(self, upstream: str) -> httpx.AsyncClient:
+        """获取某个上游的共享 client（不存在或已关闭时创建）"""
+        c = self._clients.get(upstream)
+        if c is None or c.is_closed:
+            c = self._create(upstream)
+            self._clients[upstream] = c
+        self._requests_total[upstream] = self._requests_total.get(upstream, 0) + 1
+        return c
+
+    async def start(self, upstreams: list[str] | None = None) -> None:
+        """应用启动时预创建 client"""
+        for name in upstreams or list(self.timeouts):
+            if name not in self._clients or self._clients[name].is_closed:
+                self._clients[name] = self._create(name)
+        logger.info("HTTP client pool started: upstreams=%s http2=%s", list(self._clients), self.http2)
+
+    async def aclose(self) -> None:
+        """应用关闭时释放所有连接"""
+        for name, c in list(self._clients.items()):
+            try:
+                await c.aclose()
+            except Exception as e:
+                logger.warning("Failed to close http client %s: %s", name, e)
+        self._clients.clear()
+
+    def stats(self) -> dict[str, Any]:
+        """导出连接池指标：连接数、使用中、空闲、等待者"""
+        out: dict[str, Any] = {
+            "http2": self.http2,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+            },
+            "upstreams": {},
+        }
+        for name, c in self._clients.items():
+            out["upstreams"][name] = {
+                "closed": c.is_closed,
+                "requests_total": self._requests_total.get(name, 0),
+                **_pool_stats(c),
+            }
+        return out
+
+
+def _pool_stats(client: httpx.AsyncClient) -> dict[str, int]:
+    # httpx 没有公开连接池指标，这里读取 httpcore 连接池的内部状态；
+    # 结构变化时降级为空值而不是抛错
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return {}
+    try:
+        connections = list(getattr(pool, "connections", []) or [])
+        requests = list(getattr(pool, "_requests", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        waiting = sum(1 for req in requests if getattr(req, "connection", None) is None)
+        return {
+            "connections": len(connections),
+            "in_use": len(connections) - idle,
+            "idle": idle,
+            "waiters": waiting,
+        }
+    except Exception:
+        return {}
@@ -0,0 +1,262 @@
+"""
+流式流水线执行模式
+
+search_graph 的四个节点是严格的阶段屏障：验证要等最慢的查询，入库要等全部验证。
+这里把同样的步骤改为由有界队列连接的并发阶段：
+
+    search（逐个查询产出） -> validate（微批） -> construct -> ingest（增量插入 LightRAG）
+
+第一批入库后先发布一版图谱（缩短首图时间），全部完成后再发布最终图谱。
+返回值与 search_graph.ainvoke 的最终状态结构一致。
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List
+
+from common import tracing
+from common.models import Chunk
+from search_agent.dedup import NearDuplicateFilter
+from search_agent.graph import (
+    NEAR_DUP_ENABLED,
+    NEAR_DUP_MAX_DISTANCE,
+    STAGE_SECONDS,
+    check_cancelled,
+    fallback_chunk,
+    get_cb,
+    item_key,
+    knowledge_service,
+    make_chunk,
+    run_query,
+    search_service,
+)
+from search_agent.scheduler import SEARCH_TIME_SHARE, SearchScheduler, budget_for, drive
+
+logger = logging.getLogger("search-pipeline")
+
+QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+VALIDATE_MICRO_BATCH = int(os.getenv("PIPELINE_VALIDATE_BATCH", "10"))
+INGEST_MICRO_BATCH = int(os.getenv("PIPELINE_INGEST_BATCH", "10"))
+BATCH_WAIT_S = float(os.getenv("PIPELINE_BATCH_WAIT_S", "1.0"))
+PUBLISH_FIRST_GRAPH = os.getenv("PIPELINE_PUBLISH_FIRST_GRAPH", "true").strip().lower() in ("1", "true", "yes")
+
+_DONE = object()
+
+
+async def _next_batch(queue: asyncio.Queue, size: int, wait_s: float) -> tuple[list, bool]:
+    """
+    从队列取一个微批：凑满 size 条或首条到达后等待 wait_s 秒即返回
+    返回 (批次, 上游是否已结束)
+    """
+    first = await queue.get()
+    if first is _DONE:
+        return [], True
+    batch = [first]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait_s
+    while len(batch) < size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            nxt = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            break
+        if nxt is _DONE:
+            return batch, True
+        batch.append(nxt)
+    return batch, False
+
+
+class _Progress:
+    """汇总各阶段计数并通过 status_callback 上报；current_stage 为仍在运行的最上游阶段"""
+
+    def __init__(self, cb, total_queries: int) -> None:
+        self.cb = cb
+        self.total_queries = max(1, total_queries)
+        self.queries_done = 0
+        self.found = 0
+        self.validated = 0
+        self.chunks = 0
+        self.ingested = 0
+        self.near_dups = 0
+        self.search_done = False
+        self.validate_done = False
+
+    def report(self) -> None:
+        search_frac = self.queries_done / self.total_queries
+        validate_frac = self.validated / self.found if self.found else (1.0 if self.search_done else 0.0)
+        ingest_frac = self.ingested / self.chunks if self.chunks else 0.0
+        overall = int(10 + 45 * search_frac + 25 * validate_frac * search_frac + 15 * ingest_frac * search_frac)
+        if not self.search_done:
+            stage = "search"
+        elif not self.validate_done:
+            stage = "validation"
+        else:
+            stage = "ingesting"
+        self.cb(stage, min(overall, 99), {
+            "total": self.chunks,
+            "found": self.found,
+            "validated": self.validated,
+            "ingested": self.ingested,
+            "near_duplicates_removed": self.near_dups,
+        })
+
+
+async def run_streaming_pipeline(state: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    cb = get_cb(config)
+    concept = state["concept"]
+    search_config = state["search_config"]
+    enable_validation = search_config.get("enable_validation", True)
+    auto_ingest = search_config.get("auto_ingest", True)
+
+    budget = budget_for(search_config)
+    scheduler = SearchScheduler(concept, state["disciplines"], budget)
+    started = time.time()
+    deadline_at = started + budget.deadline_s
+    progress = _Progress(cb, budget.max_queries)
+    cb("search", 10, None)
+    logger.info(f">>> [Pipeline] Streaming search for '{concept}' with budget {budget}")
+
+    items_q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    chunks_q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    all_chunks: List[Chunk] = []
+    result: Dict[str, Any] = {"graph_status": "skipped"}
+
+    async def search_stage() -> None:
+        seen: set[str] = set()
+        near = NearDuplicateFilter(max_distance=NEAR_DUP_MAX_DISTANCE)
+
+        async def on_result(disc: str, q: str, items: list) -> None:
+            new = 0
+            for it in items:
+                key = item_key(it)
+                if key in seen or len(it.content) < 80:
+                    continue
+                seen.add(key)
+                if NEAR_DUP_ENABLED:
+                    # 已下发的条目无法替换，流式模式下只丢弃后到的近重复项
+                    added, _ = near.add((disc, it), it.content)
+                    if not added:
+                        progress.near_dups += 1
+                        continue
+                new += 1
+                progress.found += 1
+                await items_q.put((disc, it))
+            scheduler.report_results(disc, len(items), new)
+            progress.queries_done += 1
+            progress.report()
+
+        try:
+            await drive(
+                scheduler,
+                run_one=lambda q: run_query(q, budget.results_per_query, config),
+                on_result=on_result,
+                deadline_at=started + budget.deadline_s * SEARCH_TIME_SHARE,
+                cancelled=lambda: check_cancelled(config),
+            )
+        finally:
+            # 调度器可能在预算耗尽前停止，进度按实际派发的查询数计算
+            progress.total_queries = max(1, scheduler.issued)
+            progress.search_done = True
+            logger.info(f">>> [Pipeline] Search finished: {scheduler.summary()}")
+        # 结束标记只在正常完成时发送：取消或出错时下游可能已退出，向已满的队列 put 会一直挂起，
+        # 此时由 TaskGroup 取消其余阶段
+        await items_q.put(_DONE)
+
+    async def validate_stage() -> None:
+        produced = 0
+        skipped = 0
+        try:
+            while True:
+                batch, finished = await _next_batch(items_q, VALIDATE_MICRO_BATCH, BATCH_WAIT_S)
+                if batch and not check_cancelled(config):
+                    meta: Dict[str, Any] = {}
+                    # 与 validation_node 一致：超过任务期限后不再调用 LLM 验证，条目未经验证直接放行
+                    remaining = deadline_at - time.time()
+                    if enable_validation and remaining <= 0:
+                        skipped += len(batch)
+                    elif enable_validation:
+                        try:
+                            meta = await asyncio.wait_for(
+                                search_service.validate_results(concept, [it for _, it in batch]), timeout=remaining
+                            )
+                        except asyncio.TimeoutError:
+                            skipped += len(batch)
+                        except Exception as e:
+                            logger.error(f"!!! Validation micro-batch FAILED: {e}")
+                        if meta:
+                            # 验证通过率反馈给调度器，用于分配后续查询
+                            for disc in {d for d, _ in batch}:
+                                its = [it for d, it in batch if d == disc]
+                                valid = sum(1 for it in its if it.url in meta and meta[it.url].get("is_valid") is not False)
+                                scheduler.report_validation(disc, len(its), valid)
+                    chunks = [c for c in (make_chunk(d, it, meta.get(it.url, {}), enable_validation) for d, it in batch) if c]
+                    progress.validated += len(batch)
+                    progress.chunks += len(chunks)
+                    produced += len(chunks)
+                    for c in chunks:
+                        await chunks_q.put(c)
+                    progress.report()
+                if finished:
+                    break
+            if skipped:
+                logger.warning(f"Deadline reached, {skipped} items passed through unvalidated")
+            if produced == 0 and not check_cancelled(config):
+                logger.warning("No items survived the pipeline, creating fallback chunk.")
+                progress.chunks += 1
+                await chunks_q.put(fallback_chunk())
+        finally:
+            progress.validate_done = True
+        await chunks_q.put(_DONE)
+
+    async def ingest_stage() -> None:
+        documents: List[dict] = []
+        published = False
+        failed = False
+
+        def on_progress(doc: dict, doc_status: str, done: int, total: int) -> None:
+            progress.ingested += 1
+            progress.report()
+
+        while True:
+            batch, finished = await _next_batch(chunks_q, INGEST_MICRO_BATCH, BATCH_WAIT_S)
+            all_chunks.extend(batch)
+            if batch and auto_ingest and not failed and not check_cancelled(config):
+                try:
+                    documents.extend(await knowledge_service.ingest_documents(concept, batch, on_progress))
+                    if PUBLISH_FIRST_GRAPH and not published and not finished:
+                        await knowledge_service.publish_graph(concept, documents)
+                        published = True
+                        logger.info(f">>> [Pipeline] First graph published for '{concept}' ({len(documents)} docs)")
+                except Exception as e:
+                    logger.exception(f"!!! Incremental ingestion FAILED: {e}")
+                    failed = True
+                progress.report()
+            if finished:
+                break
+
+        if failed:
+            result["graph_status"] = "failed"
+        elif documents and not check_cancelled(config):
+            try:
+                await knowledge_service.publish_graph(concept, documents)
+                result["graph_status"] = "success"
+            except Exception as e:
+                logger.exception(f"!!! Final graph publish FAILED: {e}")
+                result["graph_status"] = "failed"
+
+    async def timed(stage: str, run) -> None:
+        with STAGE_SECONDS.time(mode="streaming", stage=stage), tracing.span(f"stage:{stage}"):
+            await run()
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(timed("search", search_stage))
+        tg.create_task(timed("validate", validate_stage))
+        tg.create_task(timed("ingest", ingest_stage))
+
+    cb("completed", 100, {"ingest_status": result["graph_status"], "total": len(all_chunks)})
+    return {**state, "chunks": all_chunks, "graph_status": result["graph_status"]}
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("search-agent-ratelimit")
+
+# 各上游默认参数：(每秒请求数, 突发容量, 初始并发, 最大并发)
+DEFAULTS: Dict[str, tuple[float, int, int, int]] = {
+    "tavily": (5.0, 10, 4, 16),
+    "wikipedia": (20.0, 20, 8, 32),
+    "llm": (5.0, 5, 4, 16),
+}
+
+# 视为“上游过载”的状态码：触发乘性减小并暂停发放令牌
+THROTTLE_STATUS = {429, 503}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数或 HTTP 日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, dt.timestamp() - time.time())
+
+
+class AdaptiveLimiter:
+    """
+    令牌桶 + AIMD 并发控制
+
+    - 令牌桶限制请求速率（rate/s，允许 burst 突发）
+    - 并发上限按 AIMD 调整：成功时加性增长（每个“窗口”约 +1），
+      被限流（429/503/超时）时乘性减半，并按 Retry-After 暂停发放令牌
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        initial_concurrency: int,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        default_backoff_s: float = 2.0,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.limit = float(min(max(initial_concurrency, min_concurrency), self.max_concurrency))
+        self.default_backoff_s = default_backoff_s
+
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+        self.loop = asyncio.get_running_loop()
+
+        self.inflight = 0
+        self.queued = 0
+        self.requests_total = 0
+        self.throttled_total = 0
+
+    async def acquire(self) -> None:
+        self.queued += 1
+        try:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self.inflight < max(1, int(self.limit)))
+                self.inflight += 1
+            try:
+                await self._take_token()
+            except BaseException:
+                await self.release_slot()
+                raise
+        finally:
+            self.queued -= 1
+        self.requests_total += 1
+
+    async def _take_token(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    async def release(self, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        """
+        归还并发槽位并根据结果调整上限
+
+        status: HTTP 状态码；None 表示超时/连接错误（同样视为拥塞信号）
+        """
+        now = time.monotonic()
+        if status is None or status in THROTTLE_STATUS:
+            if status is not None:
+                self.throttled_total += 1
+            # 同一拥塞事件中大量并发请求同时失败，只减一次
+            if now - self._last_decrease > 1.0:
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                self._last_decrease = now
+            if status is not None:
+                wait = retry_after if retry_after is not None else self.default_backoff_s
+                self._paused_until = max(self._paused_until, now + wait)
+                self._tokens = 0.0
+            logger.info("[%s] throttled (status=%s), concurrency limit -> %.1f", self.name, status, self.limit)
+        elif status < 500:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+        await self.release_slot()
+
+    async def release_slot(self) -> None:
+        """只归还槽位、不调整上限（请求被取消等与上游无关的情况）"""
+        async with self._cond:
+            self.inflight -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "concurrency_limit": round(self.limit, 2),
+            "max_concurrency": self.max_concurrency,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "requests_total": self.requests_total,
+            "throttled_total": self.throttled_total,
+        }
+
+
+# 进程级注册表：同一进程内所有任务共享同一组限流器
+_LIMITERS: Dict[str, AdaptiveLimiter] = {}
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    """在协程内调用；事件循环变化（如脚本多次 asyncio.run）时重建限流器"""
+    loop = asyncio.get_running_loop()
+    limiter = _LIMITERS.get(name)
+    if limiter is None or limiter.loop is not loop:
+        rate, burst, initial, maximum = DEFAULTS.get(name, (10.0, 10, 8, 32))
+        prefix = f"RATE_LIMIT_{name.upper()}"
+        limiter = AdaptiveLimiter(
+            name=name,
+            rate=float(os.getenv(f"{prefix}_RPS", str(rate))),
+            burst=int(os.getenv(f"{prefix}_BURST", str(burst))),
+            initial_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(initial))),
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(maximum))),
+        )
+        _LIMITERS[name] = limiter
+    return limiter
+
+
+def limiter_stats() -> dict[str, Any]:
+    return {name: l.stats() for name, l in _LIMITERS.items()}
@@ -0,0 +1,169 @@
+"""
+按 SearchConfig.depth 分配预算的自适应检索调度
+
+depth 映射为显式预算（查询总数、每学科查询上限、每次返回条数、截止时间），调度器在预算内：
+- 先给每个学科一个查询，之后按“验证通过率 × 新内容比例”把剩余查询分给表现好的学科
+- 某学科最近一次查询几乎全是重复内容（饱和）或候选查询用尽时不再为其排查询
+- 到达截止时间即停止派发并取消在途查询，返回已有结果
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("search-scheduler")
+
+
+@dataclass(frozen=True)
+class DepthBudget:
+    max_queries: int
+    max_queries_per_discipline: int
+    results_per_query: int
+    deadline_s: float
+
+
+DEPTH_BUDGETS: Dict[str, DepthBudget] = {
+    "shallow": DepthBudget(max_queries=8, max_queries_per_discipline=2, results_per_query=5, deadline_s=60),
+    "medium": DepthBudget(max_queries=24, max_queries_per_discipline=4, results_per_query=10, deadline_s=180),
+    "deep": DepthBudget(max_queries=60, max_queries_per_discipline=8, results_per_query=15, deadline_s=420),
+}
+
+# 新内容比例低于该值视为该学科已饱和
+SATURATION_NOVELTY = float(os.getenv("SEARCH_SATURATION_NOVELTY", "0.2"))
+# 检索阶段最多占用截止时间的比例，剩余时间留给验证
+SEARCH_TIME_SHARE = float(os.getenv("SEARCH_TIME_SHARE", "0.7"))
+SCHEDULER_CONCURRENCY = int(os.getenv("SEARCH_SCHEDULER_CONCURRENCY", "8"))
+
+# 关键词用尽后补充的查询后缀
+_EXPANSIONS = ["", "原理", "应用", "历史", "研究进展", "定义"]
+
+
+def budget_for(search_config: Dict[str, Any]) -> DepthBudget:
+    base = DEPTH_BUDGETS.get(search_config.get("depth", "medium"), DEPTH_BUDGETS["medium"])
+    cap = int(search_config.get("max_results_per_discipline", base.results_per_query))
+    return DepthBudget(
+        max_queries=base.max_queries,
+        max_queries_per_discipline=base.max_queries_per_discipline,
+        results_per_query=max(1, min(base.results_per_query, cap)),
+        deadline_s=base.deadline_s,
+    )
+
+
+@dataclass
+class _DisciplineState:
+    name: str
+    candidates: List[str]
+    issued: int = 0
+    returned: int = 0
+    new: int = 0
+    validated: int = 0
+    valid: int = 0
+    saturated: bool = False
+
+    def priority(self) -> float:
+        # 拉普拉斯平滑：尚无反馈的学科得分 0.5 * 0.5
+        valid_rate = (self.valid + 1) / (self.validated + 2)
+        novelty = (self.new + 1) / (self.returned + 2)
+        return valid_rate * novelty / (1 + self.issued)
+
+
+class SearchScheduler:
+    def __init__(self, concept: str, disciplines: List[Dict[str, Any]], budget: DepthBudget) -> None:
+        self.budget = budget
+        self.issued = 0
+        self._by_name: Dict[str, _DisciplineState] = {}
+        for d in disciplines:
+            name = d["name"]
+            kws = list(d.get("search_keywords") or [])
+            candidates = [f"{concept} {kw}" for kw in kws]
+            candidates += [f"{concept} {name} {suffix}".strip() for suffix in _EXPANSIONS]
+            # 去重并保持顺序
+            self._by_name[name] = _DisciplineState(name=name, candidates=list(dict.fromkeys(candidates)))
+
+    def next_query(self) -> Optional[tuple[str, str]]:
+        if self.issued >= self.budget.max_queries:
+            return None
+        active = [
+            s for s in self._by_name.values()
+            if not s.saturated and s.issued < min(len(s.candidates), self.budget.max_queries_per_discipline)
+        ]
+        if not active:
+            return None
+        # 尚未查询过的学科优先，其余按优先级
+        s = max(active, key=lambda x: (x.issued == 0, x.priority()))
+        q = s.candidates[s.issued]
+        s.issued += 1
+        self.issued += 1
+        return s.name, q
+
+    def report_results(self, discipline: str, returned: int, new: int) -> None:
+        s = self._by_name.get(discipline)
+        if s is None:
+            return
+        s.returned += returned
+        s.new += new
+        if returned and new / returned < SATURATION_NOVELTY:
+            s.saturated = True
+            logger.info(f"   Discipline '{discipline}' saturated ({new}/{returned} new)")
+
+    def report_validation(self, discipline: str, total: int, valid: int) -> None:
+        s = self._by_name.get(discipline)
+        if s is None:
+            return
+        s.validated += total
+        s.valid += valid
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "queries_issued": self.issued,
+            "budget": self.budget.__dict__,
+            "disciplines": {
+                n: {"queries": s.issued, "new_items": s.new, "valid": s.valid, "validated": s.validated, "saturated": s.saturated}
+                for n, s in self._by_name.items()
+            },
+        }
+
+
+async def drive(
+    scheduler: SearchScheduler,
+    run_one: Callable[[str], Awaitable[list]],
+    on_result: Callable[[str, str, list], Awaitable[None]],
+    deadline_at: float,
+    concurrency: int = SCHEDULER_CONCURRENCY,
+    cancelled: Callable[[], bool] = lambda: False,
+) -> bool:
+    """
+    持续派发调度器给出的查询（最多 concurrency 个在途），每完成一个就回调 on_result 并补位
+    返回是否因截止时间而提前停止
+    """
+    pending: Dict[asyncio.Task, tuple[str, str]] = {}
+
+    def fill() -> None:
+        while len(pending) < concurrency and not cancelled():
+            nxt = scheduler.next_query()
+            if nxt is None:
+                return
+            disc, q = nxt
+            pending[asyncio.create_task(run_one(q))] = (disc, q)
+
+    fill()
+    try:
+        while pending:
+            remaining = deadline_at - time.time()
+            if remaining <= 0:
+                logger.warning(f"Search deadline reached, dropping {len(pending)} in-flight queries")
+                return True
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                disc, q = pending.pop(task)
+                items = task.result() if not task.cancelled() and task.exception() is None else []
+                await on_result(disc, q, items)
+            fill()
+        return False
+    finally:
+        for task in pending:
+            task.cancel()
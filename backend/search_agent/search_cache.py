@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List
+
+from common.sqlite_cache import SQLiteCache
+
+if TYPE_CHECKING:
+    from .service import SearchItem
+
+logger = logging.getLogger("search-agent-cache")
+
+
+def normalize_query(query: str) -> str:
+    """统一全半角、大小写与空白，让等价查询命中同一个缓存键"""
+    q = unicodedata.normalize("NFKC", query or "").lower()
+    return re.sub(r"\s+", " ", q).strip()
+
+
+class SearchCache:
+    """
+    SearchService.search 前的结果缓存
+
+    - 键：(provider, language, normalized query, max_results)
+    - 存储：./data 下的 SQLite，带 TTL 与 LRU 淘汰
+    - 防击穿：相同键的并发请求共享同一个上游调用
+    """
+
+    def __init__(self) -> None:
+        self.enabled = os.getenv("SEARCH_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+        self.store = SQLiteCache(
+            path=os.getenv("SEARCH_CACHE_PATH", "./data/search_cache.sqlite3"),
+            ttl_s=float(os.getenv("SEARCH_CACHE_TTL_S", str(7 * 24 * 3600))),
+            max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "20000")),
+        ) if self.enabled else None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(provider: str, lang: str, query: str, max_results: int) -> str:
+        raw = json.dumps([provider, lang, normalize_query(query), int(max_results)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[List["SearchItem"]]],
+        item_cls: type,
+    ) -> List["SearchItem"]:
+        if self.store is None:
+            return await fetch()
+
+        cached = await asyncio.to_thread(self.store.get, key)
+        if cached is not None:
+            return [item_cls(**it) for it in cached]
+
+        # 已有相同查询在途：等待它的结果，而不是再打一次上游
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            try:
+                return list(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                # 发起方被取消而自身未被取消时，自己去请求上游
+                task = asyncio.current_task()
+                if not pending.cancelled() or (task is not None and task.cancelling()):
+                    raise
+                return await fetch()
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            items = await fetch()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            fut.exception()
+            raise
+        else:
+            fut.set_result(items)
+            # 空结果可能是临时故障（限流、Key 缺失），不写入缓存
+            if items:
+                try:
+                    await asyncio.to_thread(self.store.set, key, [asdict(it) for it in items])
+                except Exception as e:
+                    logger.warning("Failed to write search cache: %s", e)
+            return items
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        if self.store is None:
+            return {"enabled": False}
+        return {"enabled": True, "coalesced": self.coalesced, "inflight": len(self._inflight), **self.store.stats()}
@@ -6,6 +6,7 @@ import json
 import logging
 import os
 import re
+import time
 import urllib.parse
 import uuid
 from dataclasses import dataclass
@@ -14,20 +15,42 @@ from typing import Any, List
 import httpx
 
 
+from common.metrics import (
+    LLM_REQUEST_SECONDS, LLM_RETRIES, Counter, Histogram, record_llm_usage, status_class,
+)
+from common import tracing
 from common.models import Chunk, SourceInfo, ValidationInfo
 from common.prompts import CLASSIFY_PROMPT, VALIDATE_PROMPT
 from dotenv import load_dotenv
 
+from .classify_cache import ClassifyCache
+from .corpus import CorpusIndex
+from .http_pool import HTTPClientPool, USER_AGENT
+from .rate_limit import THROTTLE_STATUS, get_limiter, limiter_stats, parse_retry_after
+from .search_cache import SearchCache
+
 load_dotenv()
 
 logger = logging.getLogger("search-agent-service")
 
+PROVIDER_SECONDS = Histogram("search_provider_seconds", "Search provider call latency (cache misses only)", ["provider", "outcome"])
+PROVIDER_ITEMS = Counter("search_provider_items_total", "Items returned by search provider calls", ["provider"])
+UPSTREAM_SECONDS = Histogram("upstream_request_seconds", "Outbound HTTP request latency per attempt", ["upstream", "status"])
+
 def clean_text(s: str) -> str:
     return re.sub(r"\s+", " ", s or "").strip()
 
 def hash_text(s: str) -> str:
     return hashlib.sha256((s or "").encode("utf-8")).hexdigest()
 
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+def estimate_tokens(s: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余约 4 字符 1 token"""
+    s = s or ""
+    cjk = len(_CJK_RE.findall(s))
+    return cjk + (len(s) - cjk + 3) // 4
+
 @dataclass
 class SearchItem:
     url: str
@@ -45,13 +68,62 @@ class SearchService:
         self.llm_timeout_s = float(os.getenv("LLM_TIMEOUT_S", "120"))
         self.knowledge_engine_url = os.getenv("KNOWLEDGE_ENGINE_URL", "http://knowledge-engine:8002").strip()
         self.wiki_lang = os.getenv("WIKIPEDIA_LANG", "zh").strip().lower()
-        
+        self.wiki_base_url = os.getenv("WIKIPEDIA_BASE_URL", "").strip()
+        # sequential: 逐个 REST summary；concurrent: 有界并发 REST summary；batch: 单次 prop=extracts
+        self.wiki_mode = os.getenv("WIKIPEDIA_MODE", "concurrent").strip().lower()
+        self.wiki_concurrency = max(1, int(os.getenv("WIKIPEDIA_CONCURRENCY", "5")))
+        # 离线语料检索（SEARCH_PROVIDER=corpus），首次查询时加载/构建索引
+        self.corpus = CorpusIndex(
+            source=os.getenv("SEARCH_CORPUS_PATH", "./data/corpus.jsonl").strip(),
+            index_dir=os.getenv("SEARCH_CORPUS_INDEX_DIR", "./data/corpus_index").strip(),
+            max_chars=int(os.getenv("SEARCH_CORPUS_MAX_CHARS", "2000")),
+        )
+
+        # 每个上游一个长连接 client，由 FastAPI 生命周期负责 start/aclose
+        self.http = HTTPClientPool(
+            timeouts={
+                "tavily": self.timeout_s,
+                "wikipedia": self.timeout_s,
+                "llm": self.llm_timeout_s,
+                "knowledge_engine": self.timeout_s,
+            },
+            default_timeout=self.timeout_s,
+        )
+        self.cache = SearchCache()
+        # 分类缓存；相似度查找所需的 embed_fn 由 central_agent 启动时注入
+        self.classify_cache = ClassifyCache()
+        self.throttle_retries = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "2"))
+
+        # 批量验证：每批 prompt 的 token 预算、每批最多条数、单条截断长度、并发批数
+        self.validate_batch_tokens = int(os.getenv("VALIDATE_BATCH_TOKENS", "12000"))
+        self.validate_batch_max_items = int(os.getenv("VALIDATE_BATCH_MAX_ITEMS", "30"))
+        self.validate_item_chars = int(os.getenv("VALIDATE_ITEM_CHARS", "800"))
+        self.validate_concurrency = max(1, int(os.getenv("VALIDATE_CONCURRENCY", "4")))
+
+    async def startup(self) -> None:
+        await self.http.start()
+
+    async def shutdown(self) -> None:
+        await self.http.aclose()
+
+    def stats(self) -> dict[str, Any]:
+        """运行时指标（供 /api/search/stats 使用）"""
+        return {
+            "http": self.http.stats(),
+            "cache": self.cache.stats(),
+            "classify_cache": self.classify_cache.stats(),
+            "corpus": self.corpus.stats() if self.search_provider == "corpus" else None,
+            "limiters": limiter_stats(),
+        }
 
     async def classify(self, concept: str, max_disciplines: int = 5, min_relevance: float = 0.3) -> dict[str, Any]:
-        """调用 LLM 对概念进行学科分类"""
+        """调用 LLM 对概念进行学科分类（结果按 概念+模型 缓存，过滤参数在缓存之后应用）"""
         if self.openai_key:
             try:
-                payload = await self._llm_json(CLASSIFY_PROMPT.format(concept=concept))
+                payload, provenance = await self.classify_cache.get(concept, self.openai_model)
+                if payload is None:
+                    payload = await self._llm_json(CLASSIFY_PROMPT.format(concept=concept), operation="classify")
+                    await self.classify_cache.put(concept, self.openai_model, payload)
                 disciplines = payload.get("disciplines") or []
                 disciplines = [d for d in disciplines if float(d.get("relevance_score", 0)) >= min_relevance]
                 disciplines = disciplines[:max_disciplines]
@@ -61,6 +133,7 @@ class SearchService:
                 payload["disciplines"] = disciplines
                 payload["primary_discipline"] = payload.get("primary_discipline") or (disciplines[0]["name"] if disciplines else "综合")
                 payload.setdefault("suggested_additions", [])
+                payload["cache"] = provenance
                 return payload
             except Exception as e:
                 logger.exception("LLM classify failed, fallback enabled. concept=%s err=%s", concept, e)
@@ -97,48 +170,137 @@ class SearchService:
         }
 
     async def search(self, query: str, max_results: int) -> List[SearchItem]:
-        """统一搜索入口"""
+        """统一搜索入口（带结果缓存，相同查询并发时只请求一次上游）"""
+        if self.search_provider in ("mock", "corpus"):
+            # 本地数据源无需缓存
+            return await self._provider_search(query, max_results)
+        if self.search_provider == "tavily":
+            provider, lang = "tavily", ""
+        else:
+            # batch 模式取的是导言摘要，与 REST summary 内容不同，缓存需分开
+            provider = "wikipedia:extracts" if self.wiki_mode == "batch" else "wikipedia:summary"
+            lang = self.wiki_lang
+        key = SearchCache.make_key(provider, lang, query, max_results)
+        return await self.cache.get_or_fetch(key, lambda: self._provider_search(query, max_results), SearchItem)
+
+    async def _provider_search(self, query: str, max_results: int) -> List[SearchItem]:
+        t0 = time.perf_counter()
+        outcome = "error"
+        try:
+            items = await self._dispatch_search(query, max_results)
+            outcome = "ok" if items else "empty"
+            PROVIDER_ITEMS.inc(len(items), provider=self.search_provider)
+            return items
+        finally:
+            PROVIDER_SECONDS.observe(time.perf_counter() - t0, provider=self.search_provider, outcome=outcome)
+
+    async def _dispatch_search(self, query: str, max_results: int) -> List[SearchItem]:
         if self.search_provider == "tavily":
             return await self._tavily_search(query, max_results)
         if self.search_provider == "mock":
             return await self._mock_search(query, max_results)
+        if self.search_provider == "corpus":
+            return await self._corpus_search(query, max_results)
         # default wikipedia
         return await self._wikipedia_search(query, max_results)
 
     async def validate_results(self, concept: str, items: List[SearchItem]) -> dict[str, Any]:
-        """批量验证检索结果的相关性"""
+        """
+        批量验证检索结果的相关性
+
+        按 token 预算把全部候选打包成多个批次并发验证（受 VALIDATE_CONCURRENCY 限制），
+        按 URL 合并结论；失败的批次单独拆半重试，不影响其他批次。
+        """
         if not self.openai_key or not items:
             return {}
-        
-        # 限制验证数量以防 Token 溢出，取前 30 个
-        cand = [{"url": it.url, "title": it.title, "content": it.content[:800]} for it in items[:30]]
-        
-        try:
-            resp = await self._llm_json(
-                VALIDATE_PROMPT.format(concept=concept, items_json=json.dumps(cand, ensure_ascii=False))
-            )
-            validated_meta = {}
-            for v in resp.get("validated", []) or []:
-                validated_meta[v.get("url", "")] = v
-            return validated_meta
-        except Exception as e:
-            print(f"LLM Validation Failed: {e}")
-            # 验证失败降级为全部通过（由上层逻辑处理默认值）
-            return {}
+
+        cand = [{"url": it.url, "title": it.title, "content": it.content[: self.validate_item_chars]} for it in items]
+        batches = self._pack_validation_batches(concept, cand)
+        sem = asyncio.Semaphore(self.validate_concurrency)
+        logger.info("Validating %d items in %d batches", len(cand), len(batches))
+
+        async def run(batch: list[dict], can_split: bool = True) -> dict[str, Any]:
+            try:
+                async with sem:
+                    with tracing.span("validate_batch", items=len(batch)) as sp:
+                        resp = await self._llm_json(
+                            VALIDATE_PROMPT.format(concept=concept, items_json=json.dumps(batch, ensure_ascii=False)),
+                            operation="validate",
+                        )
+                        sp["validated"] = len(resp.get("validated", []) or [])
+                return {v.get("url", ""): v for v in resp.get("validated", []) or []}
+            except Exception as e:
+                if can_split and len(batch) > 1:
+                    # 常见原因是输出过长被截断导致 JSON 不完整，拆半后单独重试
+                    logger.warning("Validation batch of %d failed (%s), retrying as two halves", len(batch), e)
+                    mid = len(batch) // 2
+                    left, right = await asyncio.gather(run(batch[:mid], False), run(batch[mid:], False))
+                    return {**left, **right}
+                logger.error("Validation batch of %d failed: %s", len(batch), e)
+                # 验证失败降级为全部通过（由上层逻辑处理默认值）
+                return {}
+
+        validated_meta: dict[str, Any] = {}
+        for part in await asyncio.gather(*[run(b) for b in batches]):
+            validated_meta.update(part)
+        return validated_meta
+
+    def _pack_validation_batches(self, concept: str, cand: list[dict]) -> list[list[dict]]:
+        """贪心装箱：每批的 prompt token 估算不超过 VALIDATE_BATCH_TOKENS"""
+        overhead = estimate_tokens(VALIDATE_PROMPT) + estimate_tokens(concept)
+        budget = max(1, self.validate_batch_tokens - overhead)
+        batches: list[list[dict]] = []
+        current: list[dict] = []
+        used = 0
+        for c in cand:
+            cost = estimate_tokens(json.dumps(c, ensure_ascii=False))
+            if current and (used + cost > budget or len(current) >= self.validate_batch_max_items):
+                batches.append(current)
+                current, used = [], 0
+            current.append(c)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
 
     async def ingest_chunks(self, concept: str, chunks: List[Chunk]) -> None:
         """发送 Chunk 到 Knowledge Engine"""
         url = f"{self.knowledge_engine_url.rstrip('/')}/api/ingest"
         payload = {"concept": concept, "chunks": [c.model_dump() for c in chunks]}
-        async with httpx.AsyncClient(timeout=self.timeout_s) as client:
-            try:
-                await client.post(url, json=payload)
-            except Exception:
-                # ingest失败不影响search结果返回（容错）
-                return
+        try:
+            await self.http.client("knowledge_engine").post(url, json=payload)
+        except Exception:
+            # ingest失败不影响search结果返回（容错）
+            return
 
     # --- Internal Provider Methods ---
 
+    async def _request(self, upstream: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        经过进程级限流器发出请求：令牌桶 + AIMD 并发上限，
+        429/503 时按 Retry-After 暂停并重试（最多 RATE_LIMIT_MAX_RETRIES 次）
+        """
+        limiter = get_limiter(upstream)
+        for attempt in range(self.throttle_retries + 1):
+            await limiter.acquire()
+            t0 = time.perf_counter()
+            try:
+                r = await self.http.client(upstream).request(method, url, **kwargs)
+            except (httpx.TimeoutException, httpx.TransportError):
+                UPSTREAM_SECONDS.observe(time.perf_counter() - t0, upstream=upstream, status=status_class(None))
+                await limiter.release(None)
+                raise
+            except BaseException:
+                await limiter.release_slot()
+                raise
+            UPSTREAM_SECONDS.observe(time.perf_counter() - t0, upstream=upstream, status=status_class(r.status_code))
+            await limiter.release(r.status_code, parse_retry_after(r.headers.get("Retry-After")))
+            if r.status_code not in THROTTLE_STATUS or attempt == self.throttle_retries:
+                return r
+            # 限流器已按 Retry-After 暂停发放令牌，下一轮 acquire 会自动等待
+            logger.warning("%s throttled (%s), retry %d/%d", upstream, r.status_code, attempt + 1, self.throttle_retries)
+        return r
+
     async def _tavily_search(self, query: str, max_results: int) -> List[SearchItem]:
         if not self.tavily_key:
             return []
@@ -151,10 +313,9 @@ class SearchService:
             "include_answer": False,
             "include_raw_content": False,
         }
-        async with httpx.AsyncClient(timeout=self.timeout_s) as client:
-            r = await client.post(url, json=body)
-            r.raise_for_status()
-            data = r.json()
+        r = await self._request("tavily", "POST", url, json=body)
+        r.raise_for_status()
+        data = r.json()
 
         items: List[SearchItem] = []
         for it in data.get("results", []) or []:
@@ -167,46 +328,125 @@ class SearchService:
             )
         return items
 
+    def _wiki_base(self, lang: str) -> str:
+        # WIKIPEDIA_BASE_URL 用于指向本地桩服务（压测 / 离线基准）
+        return self.wiki_base_url.rstrip("/") if self.wiki_base_url else f"https://{lang}.wikipedia.org"
+
     async def _wikipedia_search(self, query: str, max_results: int) -> List[SearchItem]:
         lang = "zh" if self.wiki_lang not in ("zh", "en") else self.wiki_lang
-        opensearch = f"https://{lang}.wikipedia.org/w/api.php"
+        base = self._wiki_base(lang)
+        # 1. OpenSearch to get titles
+        r = await self._request(
+            "wikipedia",
+            "GET",
+            f"{base}/w/api.php",
+            params={
+                "action": "opensearch",
+                "search": query,
+                "limit": str(max(1, min(max_results, 10))),
+                "namespace": "0",
+                "format": "json",
+            },
+            headers={"User-Agent": USER_AGENT},
+        )
+        r.raise_for_status()
+        data = r.json()
+
+        titles = data[1] if isinstance(data, list) and len(data) > 1 else []
+        urls = data[3] if isinstance(data, list) and len(data) > 3 else []
+        pairs = list(zip(titles, urls))[:max_results]
+        if not pairs:
+            return []
+
+        # 2. 获取正文摘要
+        if self.wiki_mode == "batch":
+            extracts = await self._wiki_extracts_batch(base, [t for t, _ in pairs])
+        elif self.wiki_mode == "sequential":
+            extracts = {}
+            for title, _ in pairs:
+                extracts[title] = await self._wiki_summary(base, title)
+        else:
+            sem = asyncio.Semaphore(self.wiki_concurrency)
+
+            async def one(title: str) -> str:
+                async with sem:
+                    return await self._wiki_summary(base, title)
+
+            results = await asyncio.gather(*[one(t) for t, _ in pairs])
+            extracts = {t: e for (t, _), e in zip(pairs, results)}
+
+        items: List[SearchItem] = []
+        for title, page_url in pairs:
+            extract = clean_text(extracts.get(title, ""))
+            if len(extract) < 80:
+                continue
+            items.append(SearchItem(url=page_url, title=title, content=extract))
+        return items
 
-        async with httpx.AsyncClient(timeout=self.timeout_s) as client:
-            # 1. OpenSearch to get titles
-            r = await client.get(
-                opensearch,
+    async def _wiki_summary(self, base: str, title: str) -> str:
+        """REST summary 接口取单个词条摘要；失败只影响该词条"""
+        safe_title = urllib.parse.quote(title, safe="")
+        try:
+            sr = await self._request(
+                "wikipedia", "GET", f"{base}/api/rest_v1/page/summary/{safe_title}", headers={"User-Agent": USER_AGENT}
+            )
+            if sr.status_code != 200:
+                return ""
+            return sr.json().get("extract", "") or ""
+        except Exception:
+            return ""
+
+    async def _wiki_extracts_batch(self, base: str, titles: List[str]) -> dict[str, str]:
+        """一次 action=query&prop=extracts 请求取回所有词条的导言摘要"""
+        try:
+            r = await self._request(
+                "wikipedia",
+                "GET",
+                f"{base}/w/api.php",
                 params={
-                    "action": "opensearch",
-                    "search": query,
-                    "limit": str(max(1, min(max_results, 10))),
-                    "namespace": "0",
+                    "action": "query",
+                    "prop": "extracts",
+                    "exintro": "1",
+                    "explaintext": "1",
+                    "exlimit": str(len(titles)),
+                    "redirects": "1",
+                    "titles": "|".join(titles),
                     "format": "json",
+                    "formatversion": "2",
                 },
-                headers={"User-Agent": "CloudComputer2025-SearchAgent/0.1"},
+                headers={"User-Agent": USER_AGENT},
             )
             r.raise_for_status()
-            data = r.json()
+            query = r.json().get("query", {}) or {}
+        except Exception as e:
+            logger.warning("Wikipedia batch extracts failed, titles=%d err=%s", len(titles), e)
+            return {}
 
-            titles = data[1] if isinstance(data, list) and len(data) > 1 else []
-            urls = data[3] if isinstance(data, list) and len(data) > 3 else []
+        # 请求标题 -> 规范化 -> 重定向 -> 最终页面标题
+        alias: dict[str, str] = {}
+        for m in (query.get("normalized") or []) + (query.get("redirects") or []):
+            alias[m.get("from", "")] = m.get("to", "")
+        by_title = {
+            p.get("title", ""): p.get("extract", "") or ""
+            for p in query.get("pages", []) or []
+            if not p.get("missing") and not p.get("invalid")
+        }
 
-            items: List[SearchItem] = []
-            for title, page_url in list(zip(titles, urls))[:max_results]:
-                # 2. Summary REST to get content
-                safe_title = urllib.parse.quote(title, safe="")
-                summary_url = f"https://{lang}.wikipedia.org/api/rest_v1/page/summary/{safe_title}"
-                try:
-                    sr = await client.get(summary_url, headers={"User-Agent": "CloudComputer2025-SearchAgent/0.1"})
-                    if sr.status_code != 200:
-                        continue
-                    sdata = sr.json()
-                    extract = clean_text(sdata.get("extract", "") or "")
-                    if len(extract) < 80:
-                        continue
-                    items.append(SearchItem(url=page_url, title=title, content=extract))
-                except Exception:
-                    continue
-        return items
+        out: dict[str, str] = {}
+        for t in titles:
+            final, hops = t, 0
+            while final in alias and hops < 3:
+                final, hops = alias[final], hops + 1
+            out[t] = by_title.get(final, "")
+        return out
+
+    async def _corpus_search(self, query: str, max_results: int) -> List[SearchItem]:
+        # BM25 打分是 CPU 密集型，放到线程中执行
+        docs = await asyncio.to_thread(self.corpus.search, query, max_results)
+        return [
+            SearchItem(url=d["url"], title=d["title"], content=clean_text(d["content"]))
+            for d in docs
+        ]
 
     async def _mock_search(self, query: str, max_results: int) -> List[SearchItem]:
         base = (
@@ -221,7 +461,7 @@ class SearchService:
             )
         ][:max_results]
 
-    async def _llm_json(self, prompt: str) -> dict[str, Any]:
+    async def _llm_json(self, prompt: str, operation: str = "other") -> dict[str, Any]:
         url = f"{self.openai_base_url.rstrip('/')}/chat/completions"
         headers = {"Authorization": f"Bearer {self.openai_key}"}
         body = {
@@ -233,12 +473,21 @@ class SearchService:
             "temperature": 0.2,
         }
         last_exc: Exception | None = None
+        labels = {"component": "search_agent", "operation": operation}
         for attempt in range(3):
+            if attempt:
+                LLM_RETRIES.inc(**labels)
+            t0 = time.perf_counter()
+            status: int | None = None
             try:
-                async with httpx.AsyncClient(timeout=self.llm_timeout_s) as client:
-                    r = await client.post(url, headers=headers, json=body)
-                    r.raise_for_status()
-                    data = r.json()
+                try:
+                    r = await self._request("llm", "POST", url, headers=headers, json=body)
+                    status = r.status_code
+                finally:
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - t0, **labels, outcome=status_class(status))
+                r.raise_for_status()
+                data = r.json()
+                record_llm_usage(**labels, usage=data.get("usage"))
                 content = data["choices"][0]["message"]["content"]
                 # 简单清洗 markdown 标记
                 if content.startswith("```json"):
@@ -248,9 +497,8 @@ class SearchService:
                 return json.loads(content.strip())
             except httpx.HTTPStatusError as e:
                 last_exc = e
-                if e.response.status_code == 429:
-                    await asyncio.sleep(5.0 * (attempt + 1))
-                else:
+                # 429/503 的等待由限流器按 Retry-After 负责，其余错误线性退避
+                if e.response.status_code not in THROTTLE_STATUS:
                     await asyncio.sleep(1.0 * (attempt + 1))
             except Exception as e:
                 last_exc = e
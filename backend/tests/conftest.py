@@ -0,0 +1,15 @@
+"""
+导入 knowledge_engine 会创建全局 RAGEngine：测试中改为不自动拉起的 worker 模式，
+并关闭磁盘缓存，避免加载真实模型；各模块的 ./data 等相对路径落在临时目录中
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("EMBEDDING_MODE", "worker")
+os.environ["EMBEDDING_WORKER_AUTOSTART"] = "false"
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
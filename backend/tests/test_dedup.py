@@ -0,0 +1,46 @@
+from search_agent.dedup import NearDuplicateFilter
+from search_agent.graph import NEAR_DUP_MAX_DISTANCE
+
+EN = (
+    "Deep learning is a subset of machine learning that focuses on utilizing neural networks to perform tasks "
+    "such as classification, regression, and representation learning. The field takes inspiration from biological "
+    "neuroscience and is centered around stacking artificial neurons into layers and training them to process data. "
+    "The adjective deep refers to the use of multiple layers in the network, ranging from three to several hundred "
+    "or thousands. Methods used can be supervised, semi-supervised or unsupervised."
+)
+ZH = (
+    "深度学习是机器学习的分支，是一种以人工神经网络为架构，对资料进行表征学习的算法。深度学习中的形容词深度是指在网络中使用多层。"
+    "早期的工作表明，线性感知器不能成为通用分类器，但另一方面，具有非多项式激活函数和一个无限宽度隐藏层的网络可以成为通用分类器。"
+    "深度学习是机器学习中一种基于对数据进行表征学习的算法。观测值可以使用多种方式来表示，如每个像素强度值的向量，"
+    "或者更抽象地表示成一系列边、特定形状的区域等。而使用某些特定的表示方法更容易从实例中学习任务。"
+)
+OTHER = (
+    "A knowledge graph is a knowledge base that uses a graph-structured data model or topology to represent and "
+    "operate on data. Knowledge graphs are often used to store interlinked descriptions of entities, objects, events, "
+    "situations or abstract concepts while also encoding the free-form semantics or relationships underlying these entities."
+)
+
+
+def _is_duplicate(original: str, edited: str) -> bool:
+    f = NearDuplicateFilter(max_distance=NEAR_DUP_MAX_DISTANCE)
+    f.add("original", original)
+    added, dup = f.add("edited", edited)
+    return not added and dup == 0
+
+
+def test_exact_copy_is_removed():
+    assert _is_duplicate(EN, EN)
+
+
+def test_lightly_edited_english_snippet_is_removed():
+    assert _is_duplicate(EN, EN.replace("stacking", "arranging"))
+    assert _is_duplicate(EN, EN.replace("stacking", "arranging").replace("biological", "human"))
+
+
+def test_lightly_edited_chinese_snippet_is_removed():
+    assert _is_duplicate(ZH, ZH.replace("分支", "分类"))
+    assert _is_duplicate(ZH, ZH.replace("分支", "分类").replace("像素", "图元"))
+
+
+def test_unrelated_snippet_is_kept():
+    assert not _is_duplicate(EN, OTHER)
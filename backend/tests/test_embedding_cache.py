@@ -0,0 +1,43 @@
+import json
+import os
+
+import numpy as np
+
+from knowledge_engine.core.embedding_cache import EmbeddingCache
+
+
+def _vectors(n: int, dim: int = 4) -> np.ndarray:
+    return np.arange(n * dim, dtype=np.float32).reshape(n, dim)
+
+
+def test_fresh_cache_starts_at_generation_zero(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a", "b"], _vectors(2))
+    with open(tmp_path / "meta.json", encoding="utf-8") as f:
+        assert json.load(f)["gen"] == 0
+    assert os.path.exists(tmp_path / "vectors.0.bin")
+
+    out, missing = EmbeddingCache(str(tmp_path), "model").get_many(["a", "c"])
+    assert missing == [1]
+    np.testing.assert_array_equal(out[0], _vectors(2)[0])
+
+
+def test_dtype_changed_by_another_process_disables_caching(tmp_path):
+    old = EmbeddingCache(str(tmp_path), "model", dtype="float16")
+    old.put_many(["a"], _vectors(1))
+    # 另一个进程以不同的存储类型启动：迁移到新一代
+    new = EmbeddingCache(str(tmp_path), "model", dtype="float32")
+    with open(tmp_path / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    assert meta["gen"] == 1 and meta["dtype"] == "float32"
+
+    # 旧进程不再读写（也不会在持有文件锁时再次加锁而卡住），更不会把代数切回去
+    old.put_many(["b"], _vectors(1))
+    out, missing = old.get_many(["a", "b"])
+    assert out is None and missing == [0, 1]
+    assert old.stats()["dtype_mismatch"]
+    with open(tmp_path / "meta.json", encoding="utf-8") as f:
+        assert json.load(f) == meta
+
+    new.put_many(["b"], _vectors(1))
+    assert new.get_many(["b"])[1] == []
@@ -0,0 +1,40 @@
+import asyncio
+
+from search_agent import pipeline
+from search_agent.service import SearchItem
+
+
+def _items(q: str, n: int) -> list:
+    # 每条内容不同且足够长（流水线丢弃 80 字以内的条目）
+    return [SearchItem(url=f"https://example.com/{q}/{i}", title=q, content=f"{q} {i} " + "内容" * 60 + f" {i}") for i in range(n)]
+
+
+def test_cancel_with_full_queues_does_not_hang(monkeypatch):
+    monkeypatch.setattr(pipeline, "QUEUE_SIZE", 2)
+    monkeypatch.setattr(pipeline, "INGEST_MICRO_BATCH", 1)
+    monkeypatch.setattr(pipeline, "NEAR_DUP_ENABLED", False)
+
+    async def run_query(q, max_results, config):
+        return _items(q, 5)
+
+    async def ingest_documents(concept, chunks, on_progress=None):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(pipeline, "run_query", run_query)
+    monkeypatch.setattr(pipeline.knowledge_service, "ingest_documents", ingest_documents)
+
+    async def main() -> None:
+        state = {
+            "concept": "测试",
+            "disciplines": [{"name": "a"}, {"name": "b"}],
+            "search_config": {"depth": "shallow", "enable_validation": False},
+        }
+        task = asyncio.create_task(pipeline.run_streaming_pipeline(state, {"configurable": {}}))
+        await asyncio.sleep(0.5)
+        # 搜索阶段已被写满的队列阻塞，入库阶段卡在 ingest_documents 中
+        assert not task.done()
+        task.cancel()
+        done, _ = await asyncio.wait({task}, timeout=2)
+        assert task in done and task.cancelled()
+
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+import asyncio
+import random
+import time
+
+from central_agent.task_store import MemoryTaskStore, TaskHandle
+
+
+class JitteryStore(MemoryTaskStore):
+    """put 耗时随机，模拟 sqlite 写入抖动"""
+
+    def put(self, task: dict) -> None:
+        time.sleep(random.uniform(0, 0.01))
+        super().put(task)
+
+
+def test_final_flush_is_not_overwritten_by_an_in_flight_write(tmp_path):
+    store = JitteryStore(str(tmp_path))
+
+    async def run(i: int) -> None:
+        task_id = f"task-{i}"
+        store.put({"task_id": task_id, "status": "pending"})
+        handle = TaskHandle(store, store.get(task_id), flush_interval=0)
+        handle.data["status"] = "processing"
+        handle.touch()
+        # 让延迟写入进入不同阶段（等待中 / 写入中）后再写最终状态
+        await asyncio.sleep(random.uniform(0, 0.005))
+        handle.data["status"] = "completed"
+        await handle.flush()
+        await asyncio.sleep(0.02)
+        assert store.get(task_id)["status"] == "completed"
+
+    async def main() -> None:
+        for i in range(100):
+            await run(i)
+
+    asyncio.run(main())
@@ -84,6 +84,7 @@ export const api = {
           depth: searchConfig.depth || 'medium',
           max_results_per_discipline: searchConfig.maxResultsPerDiscipline || 10,
           enable_validation: searchConfig.enableValidation !== false,
+          pipeline: searchConfig.pipeline || 'staged',
         },
       }),
     });
@@ -131,6 +132,25 @@ export const api = {
     return res.data;
   },
 
+  /**
+   * 订阅搜索任务进度推送（SSE），断线时浏览器自动带 Last-Event-ID 重连续传
+   * @param {string} taskId - 任务ID
+   * @param {Object} handlers - { onStatus(status), onDone({status, results_url, total, error}), onError(event) }
+   * @returns {Function} 关闭订阅
+   */
+  streamSearchStatus: (taskId, { onStatus, onDone, onError } = {}) => {
+    const source = new EventSource(`${API_BASE}/search/stream/${taskId}`);
+    source.addEventListener('status', (e) => onStatus && onStatus(JSON.parse(e.data)));
+    source.addEventListener('done', (e) => {
+      source.close();
+      if (onDone) onDone(JSON.parse(e.data));
+    });
+    source.onerror = (e) => {
+      if (onError) onError(e, source);
+    };
+    return () => source.close();
+  },
+
   /**
    * 轮询搜索状态直到完成
    * @param {string} taskId - 任务ID
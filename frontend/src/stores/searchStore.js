@@ -186,6 +186,77 @@ export const useSearchStore = defineStore('search', {
       }
     },
     
+    // 用 /status 或进度推送的快照更新本地状态
+    applySearchStatus(status) {
+      this.searchStatus = status.status;
+      this.searchProgress = {
+        overall: status.progress.overall,
+        currentStage: status.progress.current_stage,
+        stages: status.progress.stages
+      };
+      this.partialResults = {
+        totalChunksFound: status.partial_results.total_chunks_found,
+        validatedChunks: status.partial_results.validated_chunks,
+        byDiscipline: status.partial_results.by_discipline
+      };
+    },
+
+    // 订阅搜索进度：优先使用 SSE 推送，不支持或连接失败时退回轮询
+    // onUpdate 在每次状态变化后调用；返回停止函数
+    watchSearchStatus(onUpdate, interval = 1500) {
+      if (!this.currentTaskId) {
+        throw new Error('没有正在进行的搜索任务');
+      }
+      let stopped = false;
+      let timer = null;
+      let closeStream = null;
+
+      const poll = async () => {
+        if (stopped) return;
+        try {
+          await this.pollSearchStatus();
+          if (onUpdate) onUpdate(this.searchStatus);
+        } catch (error) {
+          console.error('轮询状态失败:', error);
+        }
+        const finished = ['completed', 'failed', 'cancelled'].includes(this.searchStatus);
+        if (!stopped && !finished) {
+          timer = setTimeout(poll, interval);
+        }
+      };
+
+      if (typeof EventSource === 'undefined') {
+        poll();
+      } else {
+        let received = false;
+        closeStream = api.streamSearchStatus(this.currentTaskId, {
+          onStatus: (status) => {
+            received = true;
+            this.applySearchStatus(status);
+            if (onUpdate) onUpdate(this.searchStatus);
+          },
+          onDone: (done) => {
+            this.searchStatus = done.status;
+            if (onUpdate) onUpdate(this.searchStatus);
+          },
+          onError: (e, source) => {
+            // 从未收到事件（如代理不支持 SSE）：关闭推送改为轮询；否则交给浏览器自动重连
+            if (!received || source.readyState === EventSource.CLOSED) {
+              source.close();
+              closeStream = null;
+              poll();
+            }
+          },
+        });
+      }
+
+      return () => {
+        stopped = true;
+        if (timer) clearTimeout(timer);
+        if (closeStream) closeStream();
+      };
+    },
+
     // 轮询搜索状态
     async pollSearchStatus() {
       if (!this.currentTaskId) {
@@ -194,19 +265,7 @@ export const useSearchStore = defineStore('search', {
       
       try {
         const status = await api.getSearchStatus(this.currentTaskId);
-        
-        this.searchStatus = status.status;
-        this.searchProgress = {
-          overall: status.progress.overall,
-          currentStage: status.progress.current_stage,
-          stages: status.progress.stages
-        };
-        this.partialResults = {
-          totalChunksFound: status.partial_results.total_chunks_found,
-          validatedChunks: status.partial_results.validated_chunks,
-          byDiscipline: status.partial_results.by_discipline
-        };
-        
+        this.applySearchStatus(status);
         return status;
       } catch (error) {
         console.error('获取搜索状态失败:', error);